@@ -6,65 +6,64 @@ import datetime
 def format_ap_info(ap):
     """Format AP info"""
     info = {}
-    if "ip" in ap:
-        info["IP"] = ap["ip"]
-    if "model" in ap:
-        info["Model"] = ap["model"]
-    if "serial" in ap:
-        info["Serial ID"] = ap["serial"]
-    if "cpu_usage" in ap:
-        info["CPU"] = f"{ap['cpu_usage']}%"
-    if "mem_usage" in ap or ("free_mem" in ap and "total_mem" in ap):
-        info["Mem"] = (
-            f"{round(ap['mem_usage'], 1)}%"
-            if "mem_usage" in ap
-            else f"{round(ap['free_mem'] * 100 / ap['total_mem'], 1)}%"
-        )
-        if "free_mem" in ap and "total_mem" in ap:
-            info["Mem"] += f" ({format_size(ap['free_mem'])}/{format_size(ap['total_mem'])})"
-    if "uptime" in ap:
-        info["Uptime"] = str(datetime.timedelta(seconds=int(ap["uptime"]) / 100))
+    if ap.ip is not None:
+        info["IP"] = ap.ip
+    if ap.group is not None:
+        info["Group"] = ap.group
+    if ap.model is not None:
+        info["Model"] = ap.model
+    if ap.serial is not None:
+        info["Serial ID"] = ap.serial
+    if ap.cpu_usage is not None:
+        info["CPU"] = f"{ap.cpu_usage}%"
+    if ap.mem_usage is not None:
+        info[
+            "Mem"
+        ] = f"{round(ap.mem_usage, 1)}% ({format_size(ap.free_mem)}/{format_size(ap.total_mem)})"
+    if ap.uptime is not None:
+        info["Uptime"] = str(datetime.timedelta(seconds=ap.uptime / 100))
     return info
 
 
 def format_ap_status(ap):
     """Format AP status"""
-    return f"{ap['name']} ({', '.join([f'{k}: {v}' for k, v in format_ap_info(ap).items()])})"
+    info = ", ".join([f"{k}: {v}" for k, v in format_ap_info(ap).items()])
+    return f"{ap.name or 'Unknown AP'} ({info})"
 
 
 def format_radio_info(it):
     """Format radio interface info"""
     info = {}
-    if "ssid" in it:
-        info["SSID"] = it["ssid"]
-    if "usage" in it:
-        info["Usage"] = f"{it['usage']}%"
-    if "status" in it:
-        info["Status"] = it["status"]
-    if "noise" in it:
-        info["Noise"] = f"{it['noise']}dBm"
-    if "tx_total_frames" in it:
-        info["TX"] = f"{it['tx_total_frames']} frames"
+    if it.ssid is not None:
+        info["SSID"] = it.ssid
+    if it.usage is not None:
+        info["Usage"] = f"{it.usage}%"
+    if it.status is not None:
+        info["Status"] = it.status
+    if it.noise is not None:
+        info["Noise"] = f"{it.noise}dBm"
+    if it.tx_total_frames is not None:
+        info["TX"] = f"{it.tx_total_frames} frames"
         extra = []
-        if "tx_total_bytes" in it:
-            extra.append(format_size(it["tx_total_bytes"], input_unit="KiB"))
-        if "tx_dropped_frames" in it:
-            extra.append(f"drops: {it['tx_dropped_frames']} frames")
+        if it.tx_total_bytes is not None:
+            extra.append(format_size(it.tx_total_bytes, input_unit="KiB"))
+        if it.tx_dropped_frames is not None:
+            extra.append(f"drops: {it.tx_dropped_frames} frames")
         if extra:
             info["TX"] += f" ({' '.join(extra)})"
-    if "rx_total_frames" in it:
-        info["RX"] = f"{it['rx_total_frames']} frames"
+    if it.rx_total_frames is not None:
+        info["RX"] = f"{it.rx_total_frames} frames"
         extra = []
-        if "rx_total_bytes" in it:
-            extra.append(format_size(it["rx_total_bytes"], input_unit="KiB"))
-        if "rx_bad_frames" in it:
-            extra.append(f"bad: {it['rx_bad_frames']} frames")
+        if it.rx_total_bytes is not None:
+            extra.append(format_size(it.rx_total_bytes, input_unit="KiB"))
+        if it.rx_bad_frames is not None:
+            extra.append(f"bad: {it.rx_bad_frames} frames")
         if extra:
             info["RX"] += f" ({' '.join(extra)})"
-    if "phy_events" in it:
-        info["Physical events"] = it["phy_events"]
-    if "clients_count" in it:
-        info["Clients"] = it["clients_count"]
+    if it.phy_events is not None:
+        info["Physical events"] = it.phy_events
+    if it.clients_count is not None:
+        info["Clients"] = it.clients_count
     return info
 
 
@@ -0,0 +1,201 @@
+""" Fleet aggregates of APs & radio interfaces (computed in one streaming pass) """
+
+import collections
+import math
+
+from check_aruba_ap.thresholds import METRICS
+
+# Percentiles of the AP metrics reported in the fleet perfdata
+PERCENTILES = (50, 90, 99)
+
+# Number of values kept to compute exact percentiles (before switching to estimated ones)
+EXACT_VALUES = 100
+
+
+class P2Quantile:
+    """
+    Streaming quantile estimator (P² algorithm, Jain & Chlamtac 1985)
+
+    Only five markers are kept whatever the number of observations: the quantile is exact up to
+    five observations, then estimated by adjusting the markers heights with a piecewise-parabolic
+    prediction.
+    """
+
+    def __init__(self, quantile):
+        self.quantile = quantile
+        # Markers heights, actual & desired positions and desired positions increments
+        self.heights = []
+        self.positions = [1, 2, 3, 4, 5]
+        self.desired = [1, 1 + 2 * quantile, 1 + 4 * quantile, 3 + 2 * quantile, 5]
+        self.increments = [0, quantile / 2, quantile, (1 + quantile) / 2, 1]
+
+    def add(self, value):
+        """Add an observation"""
+        heights = self.heights
+        if len(heights) < 5:
+            heights.append(value)
+            heights.sort()
+            return
+
+        if value < heights[0]:
+            heights[0] = value
+            cell = 0
+        elif value >= heights[4]:
+            heights[4] = value
+            cell = 3
+        else:
+            cell = next(idx for idx in range(1, 5) if value < heights[idx]) - 1
+        for idx in range(cell + 1, 5):
+            self.positions[idx] += 1
+        for idx in range(5):
+            self.desired[idx] += self.increments[idx]
+
+        # Adjust the heights of the middle markers if they are off their desired position
+        positions = self.positions
+        for idx in range(1, 4):
+            delta = self.desired[idx] - positions[idx]
+            if (delta >= 1 and positions[idx + 1] - positions[idx] > 1) or (
+                delta <= -1 and positions[idx - 1] - positions[idx] < -1
+            ):
+                step = 1 if delta > 0 else -1
+                height = self._parabolic(idx, step)
+                if not heights[idx - 1] < height < heights[idx + 1]:
+                    height = heights[idx] + step * (heights[idx + step] - heights[idx]) / (
+                        positions[idx + step] - positions[idx]
+                    )
+                heights[idx] = height
+                positions[idx] += step
+
+    def _parabolic(self, idx, step):
+        """Predict the height of a marker moved by step using the piecewise-parabolic formula"""
+        heights, positions = self.heights, self.positions
+        return heights[idx] + step / (positions[idx + 1] - positions[idx - 1]) * (
+            (positions[idx] - positions[idx - 1] + step)
+            * (heights[idx + 1] - heights[idx])
+            / (positions[idx + 1] - positions[idx])
+            + (positions[idx + 1] - positions[idx] - step)
+            * (heights[idx] - heights[idx - 1])
+            / (positions[idx] - positions[idx - 1])
+        )
+
+    @property
+    def value(self):
+        """Estimated quantile (None without observation)"""
+        if not self.heights:
+            return None
+        if len(self.heights) < 5:
+            return nearest_rank(self.heights, self.quantile)
+        return self.heights[2]
+
+
+def nearest_rank(values, quantile):
+    """Compute the quantile of sorted values using the nearest rank method"""
+    # Round the rank to ignore floating point errors (0.07 * 100 = 7.000000000000001)
+    return values[max(0, math.ceil(round(quantile * len(values), 9)) - 1)]
+
+
+class MetricSummary:
+    """
+    Streaming summary of a metric: count, min, max, average & percentiles
+
+    Percentiles are exact up to EXACT_VALUES values, then estimated using P² estimators.
+    """
+
+    def __init__(self, percentiles=PERCENTILES):
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+        self.percentiles = {percentile: P2Quantile(percentile / 100) for percentile in percentiles}
+        # First values (None once the estimators are used)
+        self._values = []
+
+    def add(self, value):
+        """Add a value"""
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+        if self._values is not None:
+            self._values.append(value)
+            if len(self._values) <= EXACT_VALUES:
+                return
+            values, self._values = self._values, None
+        else:
+            values = (value,)
+        for estimator in self.percentiles.values():
+            for item in values:
+                estimator.add(item)
+
+    @property
+    def avg(self):
+        """Average value (None without value)"""
+        return self.total / self.count if self.count else None
+
+    def values(self):
+        """Get the summary values by name (min, avg, max & pXX)"""
+        values = {"min": self.min, "avg": self.avg, "max": self.max}
+        exact_values = sorted(self._values) if self._values else None
+        for percentile, estimator in self.percentiles.items():
+            values[f"p{percentile}"] = (
+                estimator.value
+                if exact_values is None
+                else nearest_rank(exact_values, percentile / 100)
+            )
+        return values
+
+
+class FleetAggregates:
+    """
+    Fleet aggregates of the APs (online & offline counts, CPU & memory usage summaries and counts by
+    model) and of their radio interfaces (total clients), updated as records are retrieved: memory
+    usage does not depend on the fleet size (except for the number of distinct models).
+    """
+
+    def __init__(self, percentiles=PERCENTILES):
+        self.online = 0
+        self.offline = 0
+        self.metrics = {metric: MetricSummary(percentiles) for metric in METRICS}
+        self.models = collections.Counter()
+        self.clients = None
+
+    def add_ap(self, ap):
+        """Add an AP"""
+        if ap.online:
+            self.online += 1
+        else:
+            self.offline += 1
+        for metric, (key, _, _) in METRICS.items():
+            value = getattr(ap, key)
+            if value is not None:
+                self.metrics[metric].add(value)
+        if ap.model:
+            self.models[ap.model] += 1
+
+    def add_radio(self, it):
+        """Add a radio interface"""
+        if it.clients_count is not None:
+            self.clients = (self.clients or 0) + it.clients_count
+
+    def perf_data(self, prefix=""):
+        """Compute Icinga perfdata of the aggregates (as a dict of values by label)"""
+        perf_data = {
+            f"{prefix}Online APs": f"{self.online};;;0;",
+            f"{prefix}Offline APs": f"{self.offline};;;0;",
+        }
+        for metric, summary in self.metrics.items():
+            if not summary.count:
+                continue
+            _, label, unit = METRICS[metric]
+            for name, value in summary.values().items():
+                perf_data[
+                    f"{prefix}{label[0].upper()}{label[1:]} {name}"
+                ] = f"{round(value, 1)}{unit};;;0;100"
+        for model, count in sorted(self.models.items()):
+            perf_data[f"{prefix}Model {model} APs"] = f"{count};;;0;"
+        if self.clients is not None:
+            perf_data[f"{prefix}Clients"] = f"{self.clients};;;0;"
+        return perf_data
+
+
+# vim: tabstop=4 shiftwidth=4 softtabstop=4 expandtab
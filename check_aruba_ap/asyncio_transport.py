@@ -0,0 +1,339 @@
+""" asyncio SNMP transport backend (SNMP v1 & v2c) """
+
+import asyncio
+import itertools
+import logging
+import random
+import socket
+import threading
+
+from check_aruba_ap import ber
+from check_aruba_ap.transport import (
+    END_OF_WALK_TYPES,
+    MISSING_TYPES,
+    SNMPError,
+    SNMPNoSuchNameError,
+    SNMPTimeoutError,
+    SNMPTooBigError,
+    SNMPTransport,
+    SNMPVariable,
+    item_oid,
+)
+
+log = logging.getLogger(__name__)
+
+
+class SNMPProtocol(asyncio.DatagramProtocol):
+    """UDP protocol dispatching the received SNMP answers to the pending requests"""
+
+    def __init__(self):
+        self.transport = None
+        # Pending requests (address & answer future) by request ID
+        self.pending = {}
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        try:
+            message = ber.decode_message(data)
+        except ValueError as err:
+            log.debug("Invalid SNMP message received from %s: %s", addr[0], err)
+            return
+        address, future = self.pending.get(message.request_id, (None, None))
+        if message.pdu_type != ber.GET_RESPONSE or address != addr[:2] or future.done():
+            log.debug("Unexpected SNMP message received from %s, ignore it", addr[0])
+            return
+        future.set_result(message)
+
+    def error_received(self, exc):
+        log.debug("SNMP socket error: %s", exc)
+
+
+class AsyncioEngine:
+    """
+    asyncio SNMP engine
+
+    An event loop run in a background thread, with one UDP socket by address family (and local
+    port) shared by all SNMP hosts: many requests could be in flight at the same time, their
+    answers being dispatched on their request ID.
+    """
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(
+            target=self.loop.run_forever, name="snmp-asyncio-engine", daemon=True
+        )
+        self.thread.start()
+        self.protocols = {}
+        self.request_ids = itertools.count(random.randint(1, 2**30))
+        self._protocols_lock = None
+
+    @classmethod
+    def get_instance(cls):
+        """Get the shared engine instance (started on first call)"""
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls()
+            return cls._instance
+
+    def run(self, coroutine):
+        """Run a coroutine in the engine event loop and wait for its result (from another thread)"""
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    async def resolve(self, hostname, port):
+        """Resolve an SNMP host address (return its address family and address)"""
+        infos = await self.loop.getaddrinfo(hostname, port, type=socket.SOCK_DGRAM)
+        family, _, _, _, address = infos[0]
+        return family, address
+
+    async def _get_protocol(self, family, local_port=0):
+        """Get the shared UDP socket protocol of an address family (and local port)"""
+        if self._protocols_lock is None:
+            self._protocols_lock = asyncio.Lock()
+        async with self._protocols_lock:
+            if (family, local_port) not in self.protocols:
+                _, protocol = await self.loop.create_datagram_endpoint(
+                    SNMPProtocol,
+                    local_addr=("::" if family == socket.AF_INET6 else "0.0.0.0", local_port),
+                    family=family,
+                )
+                self.protocols[(family, local_port)] = protocol
+            return self.protocols[(family, local_port)]
+
+    async def request(
+        self, family, address, build_message, timeout, retries, local_port=0, on_retry=None
+    ):
+        """
+        Send an SNMP request and wait for its answer (the message is built by the build_message
+        function from the request ID, and on_retry is called before each retry)
+        """
+        protocol = await self._get_protocol(family, local_port)
+        request_id = next(self.request_ids) % 2**31
+        message = build_message(request_id)
+        future = self.loop.create_future()
+        protocol.pending[request_id] = (address[:2], future)
+        try:
+            for attempt in range(retries + 1):
+                protocol.transport.sendto(message, address)
+                try:
+                    return await asyncio.wait_for(asyncio.shield(future), timeout)
+                except asyncio.TimeoutError:
+                    log.debug(
+                        "No answer from %s to request %d (attempt %d)",
+                        address[0],
+                        request_id,
+                        attempt + 1,
+                    )
+                    if attempt < retries and on_retry is not None:
+                        on_retry()
+            raise SNMPTimeoutError(f"Timeout waiting for SNMP answer of {address[0]}")
+        finally:
+            del protocol.pending[request_id]
+
+
+class AsyncioTransport(SNMPTransport):
+    """
+    asyncio SNMP transport backend (SNMP v1 & v2c only)
+
+    Requests are sent through the shared asyncio engine: the column walks of a table and the GET
+    requests batches are pipelined (up to max_in_flight requests in flight for an SNMP host).
+    Coroutines versions of the operations (aget_many(), awalk(), awalk_many()) could also be
+    awaited directly in the engine event loop to poll many SNMP hosts concurrently.
+    """
+
+    # Maximum number of requests in flight for an SNMP host
+    max_in_flight = 16
+    # Requests are run in the engine event loop
+    thread_safe = True
+
+    def __init__(
+        self,
+        max_repetitions=20,
+        max_get_varbinds=32,
+        max_get_pdu_size=1400,
+        recorder=None,
+        deadline=None,
+        session_recorder=None,
+        hostname="localhost",
+        version=1,
+        community="public",
+        timeout=5,
+        retries=3,
+        remote_port=161,
+        local_port=0,
+        **kwargs,
+    ):
+        super().__init__(
+            hostname=hostname,
+            version=version,
+            max_repetitions=max_repetitions,
+            max_get_varbinds=max_get_varbinds,
+            max_get_pdu_size=max_get_pdu_size,
+            recorder=recorder,
+            deadline=deadline,
+            session_recorder=session_recorder,
+        )
+        if version not in (1, 2):
+            raise SNMPError(f"SNMP v{version} is not supported by the asyncio transport")
+        log.debug("AsyncioTransport(%s): ignored session parameters: %s", hostname, list(kwargs))
+        self.community = community
+        self.timeout = timeout
+        self.retries = retries
+        self.local_port = local_port or 0
+        self.engine = AsyncioEngine.get_instance()
+        try:
+            self.family, self.address = self.engine.run(self.engine.resolve(hostname, remote_port))
+        except OSError as err:
+            raise SNMPError(f"Fail to resolve SNMP host {hostname}: {err}") from err
+        self._semaphore = None
+
+    async def _arequest(self, request_type, pdu_type, oids, max_repetitions=0):
+        """Send a request and return the retrieved items"""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_in_flight)
+        async with self._semaphore:
+            timeout, retries = self.request_budget(self.timeout, self.retries)
+            with self._record(request_type, oids, max_repetitions) as answer:
+                message = await self.engine.request(
+                    self.family,
+                    self.address,
+                    lambda request_id: ber.encode_request(
+                        self.version,
+                        self.community,
+                        pdu_type,
+                        request_id,
+                        oids,
+                        max_repetitions=max_repetitions,
+                    ),
+                    timeout,
+                    retries,
+                    local_port=self.local_port,
+                    on_retry=self._record_retry,
+                )
+                if message.error_status:
+                    error = (
+                        f"({ber.ERROR_STATUSES.get(message.error_status, message.error_status)}) "
+                        f"SNMP error answer (index: {message.error_index})"
+                    )
+                    if message.error_status == 1:
+                        raise SNMPTooBigError(error)
+                    if message.error_status == 2:
+                        raise SNMPNoSuchNameError(error)
+                    raise SNMPError(error)
+                answer.extend(
+                    SNMPVariable(oid, "", value, snmp_type)
+                    for oid, value, snmp_type in message.varbinds
+                )
+        return answer
+
+    def _get(self, oids):
+        return self.engine.run(self._arequest("get", ber.GET_REQUEST, oids))
+
+    def _get_next(self, oids):
+        return self.engine.run(self._arequest("getnext", ber.GET_NEXT_REQUEST, oids))
+
+    def _get_bulk(self, oids, max_repetitions):
+        return self.engine.run(
+            self._arequest("getbulk", ber.GET_BULK_REQUEST, oids, max_repetitions)
+        )
+
+    async def awalk(self, oid, max_repetitions=None):
+        """Walk an OID subtree (using GETBULK requests if the SNMP version support it)"""
+        if self.version == 1 or not self.max_repetitions:
+            return await self._anext_walk(oid)
+        return await self._abulk_walk(oid, max_repetitions)
+
+    async def _anext_walk(self, oid):
+        """Walk an OID subtree using GETNEXT requests"""
+        items = []
+        next_oid = oid
+        while True:
+            try:
+                item = (await self._arequest("getnext", ber.GET_NEXT_REQUEST, [next_oid]))[0]
+            except SNMPNoSuchNameError:
+                # SNMP v1 end of MIB view
+                return items
+            if item.snmp_type in END_OF_WALK_TYPES or not item.oid.startswith(f"{oid}."):
+                return items
+            items.append(item)
+            next_oid = item.oid
+
+    async def _abulk_walk(self, oid, max_repetitions=None):
+        """Walk an OID subtree using GETBULK requests (see SNMPTransport.walk())"""
+        items = []
+        next_oid = oid
+        expected = max_repetitions
+        while True:
+            max_repetitions = min(expected or self.max_repetitions, self.max_repetitions)
+            try:
+                answer = await self._arequest(
+                    "getbulk", ber.GET_BULK_REQUEST, [next_oid], max_repetitions
+                )
+            except SNMPTooBigError:
+                if max_repetitions <= 1:
+                    raise
+                # Remember it for next walks to avoid retrieving the same tooBig answer again
+                self.max_repetitions = min(self.max_repetitions, max(1, max_repetitions // 2))
+                log.debug(
+                    "_abulk_walk(%s): tooBig answer received, retry with max-repetitions=%d",
+                    oid,
+                    self.max_repetitions,
+                )
+                self._record_retry()
+                continue
+            for item in answer:
+                if item.snmp_type in END_OF_WALK_TYPES or not item.oid.startswith(f"{oid}."):
+                    return items
+                items.append(item)
+            if not answer or item_oid(answer[-1]) == next_oid:
+                return items
+            next_oid = item_oid(answer[-1])
+
+    async def awalk_many(self, oids):
+        """Walk many OID subtrees concurrently"""
+        return list(await asyncio.gather(*[self.awalk(oid) for oid in oids]))
+
+    async def aget_batch(self, oids):
+        """Get a batch of OIDs using one GET request (return a list of items, None if missing)"""
+        try:
+            items = await self._arequest("get", ber.GET_REQUEST, oids)
+        except SNMPNoSuchNameError:
+            # With SNMP v1, one missing OID make the whole request fail: split the batch to
+            # retrieve the other ones
+            if len(oids) == 1:
+                return [None]
+            self._record_retry()
+            middle = len(oids) // 2
+            first, second = await asyncio.gather(
+                self.aget_batch(oids[:middle]), self.aget_batch(oids[middle:])
+            )
+            return first + second
+        return [None if item.snmp_type in MISSING_TYPES else item for item in items]
+
+    async def aget_many(self, oids):
+        """Get many OIDs values by packing them in concurrent GET requests"""
+        batches = list(self.iter_get_batches(oids))
+        log.debug("aget_many(): get %d OIDs in %d requests", len(oids), len(batches))
+        results = await asyncio.gather(*[self.aget_batch(batch) for batch in batches])
+        return [
+            (oid, item)
+            for batch, items in zip(batches, results)
+            for oid, item in zip(batch, items)
+            if item is not None
+        ]
+
+    def walk(self, oid, max_repetitions=None):
+        return self.engine.run(self.awalk(oid, max_repetitions))
+
+    def walk_many(self, oids):
+        return self.engine.run(self.awalk_many(oids))
+
+    def get_many(self, oids):
+        return self.engine.run(self.aget_many(oids))
+
+
+# vim: tabstop=4 shiftwidth=4 softtabstop=4 expandtab
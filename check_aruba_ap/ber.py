@@ -0,0 +1,223 @@
+""" Minimal BER codec of SNMP v1/v2c messages """
+
+import collections
+
+# PDU types tags
+GET_REQUEST = 0xA0
+GET_NEXT_REQUEST = 0xA1
+GET_RESPONSE = 0xA2
+GET_BULK_REQUEST = 0xA5
+
+# Universal types tags
+INTEGER = 0x02
+OCTET_STRING = 0x04
+NULL = 0x05
+OBJECT_IDENTIFIER = 0x06
+SEQUENCE = 0x30
+
+# SNMP types of values tags (easysnmp names)
+VALUE_TYPES = {
+    INTEGER: "INTEGER",
+    OCTET_STRING: "OCTETSTR",
+    NULL: "NULL",
+    OBJECT_IDENTIFIER: "OBJECTID",
+    0x40: "IPADDR",
+    0x41: "COUNTER",
+    0x42: "GAUGE",
+    0x43: "TICKS",
+    0x44: "OPAQUE",
+    0x46: "COUNTER64",
+    0x80: "NOSUCHOBJECT",
+    0x81: "NOSUCHINSTANCE",
+    0x82: "ENDOFMIBVIEW",
+}
+
+# Error status names (of the PDU error-status field)
+ERROR_STATUSES = {
+    1: "tooBig",
+    2: "noSuchName",
+    3: "badValue",
+    4: "readOnly",
+    5: "genErr",
+}
+
+# Decoded SNMP message (for GETBULK requests, error_status & error_index fields are the
+# non-repeaters & max-repetitions ones)
+Message = collections.namedtuple(
+    "Message",
+    (
+        "version",
+        "community",
+        "pdu_type",
+        "request_id",
+        "error_status",
+        "error_index",
+        "varbinds",
+    ),
+)
+
+
+def encode_length(length):
+    """Encode a BER length"""
+    if length < 0x80:
+        return bytes((length,))
+    data = length.to_bytes((length.bit_length() + 7) // 8, "big")
+    return bytes((0x80 | len(data),)) + data
+
+
+def encode_tlv(tag, value):
+    """Encode a BER TLV"""
+    return bytes((tag,)) + encode_length(len(value)) + value
+
+
+def encode_integer(value, tag=INTEGER):
+    """Encode a BER integer"""
+    return encode_tlv(tag, value.to_bytes(value.bit_length() // 8 + 1, "big", signed=True))
+
+
+def encode_oid(oid):
+    """Encode a BER object identifier (the "iso" first sub-identifier is supported)"""
+    sub_ids = [1 if sub_id == "iso" else int(sub_id) for sub_id in oid.strip(".").split(".")]
+    data = bytearray((sub_ids[0] * 40 + sub_ids[1],))
+    for sub_id in sub_ids[2:]:
+        chunk = bytearray((sub_id & 0x7F,))
+        sub_id >>= 7
+        while sub_id:
+            chunk.insert(0, 0x80 | (sub_id & 0x7F))
+            sub_id >>= 7
+        data += chunk
+    return encode_tlv(OBJECT_IDENTIFIER, bytes(data))
+
+
+def encode_value(value, snmp_type):
+    """Encode a varbind value from its easysnmp formatted value and type"""
+    tag = next(tag for tag, type_name in VALUE_TYPES.items() if type_name == snmp_type)
+    if tag in (INTEGER, 0x41, 0x42, 0x43, 0x46):
+        return encode_integer(int(value), tag=tag)
+    if tag == 0x40:
+        return encode_tlv(tag, bytes(int(byte) for byte in value.split(".")))
+    if tag == OBJECT_IDENTIFIER:
+        return encode_oid(value)
+    if tag in (OCTET_STRING, 0x44):
+        return encode_tlv(tag, value.encode("latin-1"))
+    return encode_tlv(tag, b"")
+
+
+def encode_message(version, community, pdu_type, request_id, error_status, error_index, varbinds):
+    """
+    Encode an SNMP message
+
+    Varbinds are a list of (OID, encoded value) tuples. For GETBULK requests, error_status and
+    error_index are the non-repeaters and max-repetitions fields.
+    """
+    pdu = encode_tlv(
+        pdu_type,
+        encode_integer(request_id)
+        + encode_integer(error_status)
+        + encode_integer(error_index)
+        + encode_tlv(
+            SEQUENCE,
+            b"".join(encode_tlv(SEQUENCE, encode_oid(oid) + value) for oid, value in varbinds),
+        ),
+    )
+    return encode_tlv(
+        SEQUENCE,
+        encode_integer(version - 1) + encode_tlv(OCTET_STRING, community.encode("utf-8")) + pdu,
+    )
+
+
+def encode_request(version, community, pdu_type, request_id, oids, max_repetitions=0):
+    """Encode an SNMP request message (max_repetitions is only used by GETBULK requests)"""
+    return encode_message(
+        version,
+        community,
+        pdu_type,
+        request_id,
+        0,
+        max_repetitions if pdu_type == GET_BULK_REQUEST else 0,
+        [(oid, encode_tlv(NULL, b"")) for oid in oids],
+    )
+
+
+def decode_tlv(data, offset):
+    """Decode a BER TLV (return its tag, its value and the offset of the next one)"""
+    try:
+        tag = data[offset]
+        length = data[offset + 1]
+        offset += 2
+        if length & 0x80:
+            length_size = length & 0x7F
+            if not length_size:
+                raise ValueError("Unsupported BER indefinite length")
+            length = int.from_bytes(data[offset : offset + length_size], "big")
+            offset += length_size
+    except IndexError as err:
+        raise ValueError("Truncated BER data") from err
+    if offset + length > len(data):
+        raise ValueError("Truncated BER data")
+    return tag, data[offset : offset + length], offset + length
+
+
+def decode_oid(value):
+    """Decode a BER object identifier (formatted like easysnmp ones, with "iso" prefix)"""
+    if not value:
+        raise ValueError("Empty OID")
+    sub_ids = list(divmod(value[0], 40)) if value[0] < 80 else [2, value[0] - 80]
+    sub_id = 0
+    for byte in value[1:]:
+        sub_id = (sub_id << 7) | (byte & 0x7F)
+        if not byte & 0x80:
+            sub_ids.append(sub_id)
+            sub_id = 0
+    if value[-1] & 0x80 and len(value) > 1:
+        raise ValueError("Truncated OID sub-identifier")
+    return ".".join(["iso" if sub_ids[0] == 1 else str(sub_ids[0])] + [str(i) for i in sub_ids[1:]])
+
+
+def decode_value(tag, value):
+    """Decode a varbind value (return its easysnmp formatted value and type)"""
+    snmp_type = VALUE_TYPES.get(tag, "UNKNOWN")
+    if tag == INTEGER:
+        return str(int.from_bytes(value, "big", signed=True)), snmp_type
+    if tag in (0x41, 0x42, 0x43, 0x46):
+        return str(int.from_bytes(value, "big")), snmp_type
+    if tag == 0x40:
+        return ".".join(str(byte) for byte in value), snmp_type
+    if tag == OBJECT_IDENTIFIER:
+        return decode_oid(value), snmp_type
+    if tag in (OCTET_STRING, 0x44):
+        return value.decode("latin-1"), snmp_type
+    return snmp_type, snmp_type
+
+
+def decode_message(data):
+    """Decode an SNMP message (varbinds are decoded as (OID, value, type) tuples)"""
+    tag, message, _ = decode_tlv(data, 0)
+    if tag != SEQUENCE:
+        raise ValueError("Invalid SNMP message")
+    _, version, offset = decode_tlv(message, 0)
+    _, community, offset = decode_tlv(message, offset)
+    pdu_type, pdu, _ = decode_tlv(message, offset)
+    fields = []
+    offset = 0
+    for _ in range(3):
+        _, value, offset = decode_tlv(pdu, offset)
+        fields.append(int.from_bytes(value, "big", signed=True))
+    _, varbinds_data, _ = decode_tlv(pdu, offset)
+    varbinds = []
+    offset = 0
+    while offset < len(varbinds_data):
+        _, varbind, offset = decode_tlv(varbinds_data, offset)
+        _, oid, value_offset = decode_tlv(varbind, 0)
+        tag, value, _ = decode_tlv(varbind, value_offset)
+        varbinds.append((decode_oid(oid),) + decode_value(tag, value))
+    return Message(
+        int.from_bytes(version, "big") + 1,
+        community.decode("utf-8", errors="replace"),
+        pdu_type,
+        *fields,
+        varbinds,
+    )
+
+
+# vim: tabstop=4 shiftwidth=4 softtabstop=4 expandtab
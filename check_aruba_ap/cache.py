@@ -0,0 +1,178 @@
+""" On-disk cache helpers """
+
+import fcntl
+import json
+import logging
+import os
+import re
+import tempfile
+import time
+
+log = logging.getLogger(__name__)
+
+# Process umask (atomically written files get the mode of the files created by open())
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+def load_json_file(path, default=None):
+    """Load a JSON file (return default value if not exist or on error)"""
+    if not path or not os.path.exists(path):
+        return default
+    try:
+        with open(path, encoding="utf-8") as fd:
+            return json.load(fd)
+    except (OSError, ValueError) as err:
+        log.warning("Fail to load JSON file %s: %s", path, err)
+        return default
+
+
+def write_json_file(path, data, mode=None):
+    """
+    Atomically write a JSON file, with the specified mode or the umask one by default (return True
+    on success, False otherwise)
+    """
+    try:
+        with tempfile.NamedTemporaryFile(
+            "w", encoding="utf-8", dir=os.path.dirname(os.path.abspath(path)), delete=False
+        ) as fd:
+            os.fchmod(fd.fileno(), 0o666 & ~_UMASK if mode is None else mode)
+            json.dump(data, fd)
+        os.replace(fd.name, path)
+    except (OSError, TypeError, ValueError) as err:
+        log.warning("Fail to write JSON file %s: %s", path, err)
+        return False
+    return True
+
+
+def write_text_file(path, content):
+    """Atomically write a text file (return True on success, False otherwise)"""
+    try:
+        with tempfile.NamedTemporaryFile(
+            "w", encoding="utf-8", dir=os.path.dirname(os.path.abspath(path)), delete=False
+        ) as fd:
+            os.fchmod(fd.fileno(), 0o666 & ~_UMASK)
+            fd.write(content)
+        os.replace(fd.name, path)
+    except OSError as err:
+        log.warning("Fail to write file %s: %s", path, err)
+        return False
+    return True
+
+
+def cache_file_name(*parts):
+    """Compute a safe cache file name from parts"""
+    return re.sub(r"[^A-Za-z0-9._-]", "_", "_".join(parts))
+
+
+class EngineCache:
+    """
+    SNMP v3 engines cache: the engine ID, boots & time of the SNMP hosts (by key) are stored in a
+    JSON file, only readable by its owner, to skip the engine discovery and time synchronization
+    on the next sessions
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def get(self, key):
+        """Get the engine ID (hex encoded), boots & current time of an SNMP host (or None)"""
+        entry = load_json_file(self.path, {}).get(key)
+        try:
+            return (
+                entry["engine_id"],
+                int(entry["boots"]),
+                int(entry["time"] + time.time() - entry["timestamp"]),
+            )
+        except (KeyError, TypeError, ValueError):
+            return None
+
+    def set(self, key, engine_id, boots, engine_time):
+        """Store the engine ID (hex encoded), boots & time of an SNMP host"""
+        engines = load_json_file(self.path, {})
+        engines[key] = {
+            "engine_id": engine_id,
+            "boots": boots,
+            "time": engine_time,
+            "timestamp": time.time(),
+        }
+        return write_json_file(self.path, engines, mode=0o600)
+
+    def invalidate(self, key):
+        """Forget the engine of an SNMP host"""
+        engines = load_json_file(self.path, {})
+        if engines.pop(key, None) is not None:
+            write_json_file(self.path, engines, mode=0o600)
+
+
+class PollCache:  # pylint: disable=too-few-public-methods
+    """
+    Shared on-disk poll cache
+
+    The first caller in a TTL window polls the SNMP host and atomically writes the result in the
+    cache file. Concurrent callers wait on a lock instead of polling the SNMP host too. If the
+    cached data expired since less than the stale TTL, it's returned without waiting when another
+    caller is already refreshing it (or if the refresh fail).
+    """
+
+    def __init__(self, cache_dir, key, ttl=60, stale_ttl=0, lock_timeout=30):
+        self.path = os.path.join(cache_dir, f"{cache_file_name(key)}.json")
+        self.lock_path = f"{self.path}.lock"
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.lock_timeout = lock_timeout
+
+    def _load(self):
+        """Load cached data (return a tuple of the data and its age, or (None, None))"""
+        data = load_json_file(self.path)
+        if not isinstance(data, dict) or "timestamp" not in data:
+            return None, None
+        return data, time.time() - data["timestamp"]
+
+    def _lock(self, fd, wait=True):
+        """Acquire the cache lock (return True if acquired, False otherwise)"""
+        timeout = time.monotonic() + self.lock_timeout
+        while True:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return True
+            except BlockingIOError:
+                if not wait or time.monotonic() >= timeout:
+                    return False
+                time.sleep(0.1)
+
+    def get(self, poll):
+        """Get data from cache or by calling the poll function (and cache it)"""
+        data, age = self._load()
+        if data and age < self.ttl:
+            log.debug("PollCache(%s): fresh data found (age: %.1fs)", self.path, age)
+            return data
+        stale = data if data and age < self.ttl + self.stale_ttl else None
+
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.lock_path, "a", encoding="utf-8") as lock_fd:
+            if not self._lock(lock_fd, wait=not stale):
+                if stale:
+                    log.debug("PollCache(%s): refresh in progress, use stale data", self.path)
+                    return stale
+                log.warning("PollCache(%s): timeout waiting for lock, poll anyway", self.path)
+            else:
+                # Another caller may have refreshed the data while we were waiting for the lock
+                data, age = self._load()
+                if data and age < self.ttl:
+                    log.debug("PollCache(%s): data refreshed in the meantime", self.path)
+                    return data
+            try:
+                data = poll()
+            except Exception:  # pylint: disable=broad-except
+                if not stale:
+                    raise
+                log.warning("PollCache(%s): fail to refresh data, use stale data", self.path)
+                return stale
+            data["timestamp"] = time.time()
+            write_json_file(self.path, data)
+            log.debug("PollCache(%s): data refreshed", self.path)
+        return data
+
+
+# vim: tabstop=4 shiftwidth=4 softtabstop=4 expandtab
@@ -0,0 +1,87 @@
+""" SNMP values codecs of the profiles columns """
+
+import logging
+import string
+
+log = logging.getLogger(__name__)
+
+# Translation table deleting the printable characters: a value is printable if nothing remains
+_DELETE_PRINTABLE = dict.fromkeys(map(ord, string.printable))
+
+# SNMP types of numeric values
+NUMERIC_TYPES = frozenset(
+    ("INTEGER", "INTEGER32", "UNSIGNED32", "GAUGE", "COUNTER", "COUNTER64", "TICKS")
+)
+
+
+def decode_text(item):
+    """Decode a text value (hex encoded if not printable)"""
+    if item.value.translate(_DELETE_PRINTABLE):
+        return item.value.encode("latin-1").hex()
+    return item.value
+
+
+def decode_int(item):
+    """Decode a numeric value (gauge, counter, timeticks, integer or enum)"""
+    try:
+        return int(item.value)
+    except ValueError:
+        log.warning("Invalid %s value %r (OID: %s)", item.snmp_type, item.value, item.oid)
+        return None
+
+
+def decode_mac(item):
+    """Decode a MAC address (6 bytes octet string) in colon format"""
+    if len(item.value) == 6:
+        return ":".join(f"{byte:02x}" for byte in item.value.encode("latin-1"))
+    # Already formatted as text by the agent
+    return item.value.lower()
+
+
+def decode_ipv4(item):
+    """Decode an IPv4 address (IpAddress or 4 bytes octet string)"""
+    if item.snmp_type == "OCTETSTR" and len(item.value) == 4:
+        return ".".join(map(str, item.value.encode("latin-1")))
+    return item.value
+
+
+def decode_auto(item):
+    """Decode a value of a column without declared codec according to its SNMP type"""
+    if item.snmp_type in NUMERIC_TYPES:
+        return decode_int(item)
+    if item.snmp_type == "OCTETSTR":
+        return decode_text(item)
+    return item.value
+
+
+# Decoders by codec name
+DECODERS = {
+    "text": decode_text,
+    "mac": decode_mac,
+    "ipv4": decode_ipv4,
+    "integer": decode_int,
+    "gauge": decode_int,
+    "counter32": decode_int,
+    "counter64": decode_int,
+    "timeticks": decode_int,
+    "status": decode_int,
+}
+
+
+def get_decoders(oids, codecs):
+    """
+    Get the decoders of the columns of a table by column OID (from its OIDs and codecs by key
+    name, columns without declared codec are decoded according to their SNMP type)
+    """
+    decoders = {}
+    for key_name, oid in oids.items():
+        if oid is None:
+            continue
+        codec = codecs.get(key_name)
+        if codec is not None and codec not in DECODERS:
+            raise ValueError(f"Unknown codec {codec} of column {key_name}")
+        decoders[oid] = DECODERS[codec] if codec else decode_auto
+    return decoders
+
+
+# vim: tabstop=4 shiftwidth=4 softtabstop=4 expandtab
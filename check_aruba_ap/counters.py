@@ -0,0 +1,128 @@
+""" Radio interfaces counters rates computation """
+
+import logging
+import os
+
+from check_aruba_ap.cache import cache_file_name, load_json_file, write_json_file
+
+log = logging.getLogger(__name__)
+
+# Radio interfaces cumulative counters
+COUNTERS = (
+    "tx_total_frames",
+    "tx_total_bytes",
+    "tx_dropped_frames",
+    "rx_total_frames",
+    "rx_total_bytes",
+    "rx_bad_frames",
+    "phy_events",
+)
+
+
+# Counters widths (in bits) by column codec
+CODEC_WIDTHS = {"counter32": 32, "counter64": 64}
+
+# Maximum plausible per-second rates of the counters (higher rates are considered as counter
+# resets): 50 Gbit/s and 10M frames or events per second
+MAX_RATES = {
+    "tx_total_frames": 10**7,
+    "tx_total_bytes": 50 * 10**9 / 8,
+    "tx_dropped_frames": 10**7,
+    "rx_total_frames": 10**7,
+    "rx_total_bytes": 50 * 10**9 / 8,
+    "rx_bad_frames": 10**7,
+    "phy_events": 10**7,
+}
+
+
+def get_counter_widths(codecs):
+    """Get the widths (in bits) of the counters declared by the radio columns codecs"""
+    return {
+        counter: CODEC_WIDTHS[codecs[counter]]
+        for counter in COUNTERS
+        if codecs.get(counter) in CODEC_WIDTHS
+    }
+
+
+def counter_delta(previous, current, width=None):
+    """
+    Compute the delta between two samples of a counter of the specified width (in bits): a
+    decrease is handled as a wrap of a 32-bit counter (if it does not exceed half its range) and
+    as a reset otherwise (return None)
+    """
+    if current >= previous:
+        return current - previous
+    if width == 32:
+        delta = current + 2**32 - previous
+        if delta < 2**31:
+            return delta
+    return None
+
+
+class CounterStore:
+    """
+    Per-AP counters state store
+
+    The previous sample of the radio interfaces counters (keyed by radio MAC address) is kept in a
+    compact local file with its timestamp and the AP uptime (used to detect AP reboots).
+    """
+
+    def __init__(self, state_dir, hostname, ap_ip):
+        self.path = os.path.join(state_dir, f"{cache_file_name(hostname, ap_ip)}.json")
+        self.state = load_json_file(self.path, {})
+
+    def compute_rates(self, ap, radio, timestamp, widths=None):
+        """
+        Compute per-second rates of the radio interfaces counters and update the state
+
+        Return a dict of counters rates by radio MAC address. Rates are not computed on the first
+        sample of a radio interface, after an AP reboot and on counter resets (decreasing counters
+        which are not wrapped 32-bit counters, according to their widths, or implausibly high
+        rates).
+        """
+        widths = widths or {}
+        uptime = ap.uptime
+        elapsed = timestamp - self.state["t"] if "t" in self.state else None
+        if elapsed is not None and elapsed <= 0:
+            # Same sample than the previous one (for instance, retrieved from cache)
+            return self.state.get("rates", {})
+        if elapsed is None:
+            previous = {}
+        elif uptime is not None and uptime < (self.state.get("uptime") or 0):
+            log.info("AP %s rebooted since last sample, reset counters", ap.name)
+            previous = {}
+        else:
+            previous = self.state.get("radios", {})
+
+        rates = {}
+        samples = {}
+        for it in radio:
+            samples[it.mac] = [getattr(it, counter) for counter in COUNTERS]
+            if it.mac not in previous:
+                continue
+            rates[it.mac] = {}
+            for counter, previous_value, value in zip(COUNTERS, previous[it.mac], samples[it.mac]):
+                if previous_value is None or value is None:
+                    continue
+                delta = counter_delta(previous_value, value, widths.get(counter))
+                if delta is None or delta / elapsed > MAX_RATES[counter]:
+                    log.info(
+                        "Radio interface %s of AP %s: %s counter reset (%d -> %d)",
+                        it.mac,
+                        ap.name,
+                        counter,
+                        previous_value,
+                        value,
+                    )
+                    continue
+                rates[it.mac][counter] = delta / elapsed
+        self.state = {"t": timestamp, "uptime": uptime, "radios": samples, "rates": rates}
+        return rates
+
+    def save(self):
+        """Save the state"""
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        write_json_file(self.path, self.state)
+
+
+# vim: tabstop=4 shiftwidth=4 softtabstop=4 expandtab
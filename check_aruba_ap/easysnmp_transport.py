@@ -0,0 +1,262 @@
+""" easysnmp SNMP transport backend """
+
+import contextlib
+import logging
+import math
+import time
+
+from easysnmp import Session
+from easysnmp.exceptions import EasySNMPError, EasySNMPNoSuchNameError, EasySNMPTimeoutError
+
+from check_aruba_ap.cache import EngineCache
+from check_aruba_ap.transport import (
+    END_OF_WALK_TYPES,
+    SNMPEngineError,
+    SNMPError,
+    SNMPNoSuchNameError,
+    SNMPTimeoutError,
+    SNMPTooBigError,
+    SNMPTransport,
+    item_oid,
+)
+
+log = logging.getLogger(__name__)
+
+# snmpEngineID, snmpEngineBoots & snmpEngineTime OIDs (SNMP-FRAMEWORK-MIB)
+ENGINE_OIDS = (
+    "iso.3.6.1.6.3.10.2.1.1.0",
+    "iso.3.6.1.6.3.10.2.1.2.0",
+    "iso.3.6.1.6.3.10.2.1.3.0",
+)
+# Symbolic names of the engine OIDs (as formatted by easysnmp if the SNMP-FRAMEWORK-MIB is loaded)
+ENGINE_NAMES = ("snmpEngineID.0", "snmpEngineBoots.0", "snmpEngineTime.0")
+# OIDs to request with GETNEXT (or as GETBULK non-repeaters) to retrieve them
+ENGINE_NEXT_OIDS = tuple(oid.rsplit(".", 1)[0] for oid in ENGINE_OIDS)
+
+# Error messages of the SNMP v3 requests sent with an outdated engine ID, boots or time
+ENGINE_ERRORS = ("unknown engine id", "not in time window")
+
+
+@contextlib.contextmanager
+def translate_errors():
+    """Translate easysnmp exceptions in transport ones"""
+    try:
+        yield
+    except EasySNMPTimeoutError as err:
+        raise SNMPTimeoutError(str(err)) from err
+    except EasySNMPNoSuchNameError as err:
+        raise SNMPNoSuchNameError(str(err)) from err
+    except EasySNMPError as err:
+        if "toobig" in str(err).lower().replace(" ", ""):
+            raise SNMPTooBigError(str(err)) from err
+        if any(error in str(err).lower() for error in ENGINE_ERRORS):
+            raise SNMPEngineError(str(err)) from err
+        raise SNMPError(str(err)) from err
+
+
+class EasySNMPTransport(SNMPTransport):
+    """
+    SNMP transport backend based on easysnmp (blocking, one request at a time)
+
+    With SNMP v3, the engine ID, boots & time of the SNMP host could be stored in an engine cache
+    file: sessions are then created with the cached ones, skipping the engine discovery and time
+    synchronization round trip. The engine OIDs are requested along with the first request of a
+    session created without a known engine (to cache it without an additional round trip, and to
+    create the sessions used close to the polling deadline without engine discovery), and the
+    cached engine is forgotten if the SNMP host reports an unknown engine ID or a not in time
+    window error (the request is then retried with a new session).
+    """
+
+    # SNMP session class (could be overridden, for instance to use a fake SNMP agent)
+    session_class = Session
+
+    def __init__(
+        self,
+        max_repetitions=20,
+        max_get_varbinds=32,
+        max_get_pdu_size=1400,
+        recorder=None,
+        deadline=None,
+        session_recorder=None,
+        engine_cache_file=None,
+        **kwargs,
+    ):
+        super().__init__(
+            hostname=kwargs["hostname"],
+            version=kwargs["version"],
+            max_repetitions=max_repetitions,
+            max_get_varbinds=max_get_varbinds,
+            max_get_pdu_size=max_get_pdu_size,
+            recorder=recorder,
+            deadline=deadline,
+            session_recorder=session_recorder,
+        )
+        self.session_kwargs = kwargs
+        # Requests timeout & retries (easysnmp defaults)
+        self.timeout = kwargs.get("timeout", 1)
+        self.retries = kwargs.get("retries", 3)
+        # SNMP v3 engine cache (and the key of the SNMP host in it)
+        self.engine_cache = (
+            EngineCache(engine_cache_file) if engine_cache_file and self.version == 3 else None
+        )
+        self.engine_key = f"{self.hostname}:{kwargs.get('remote_port', 161)}"
+        # Engine session parameters (None if not cached, and retrieved with the first request)
+        self.engine_kwargs = self.engine_cache.get(self.engine_key) if self.engine_cache else None
+        # time.monotonic() value at which the engine time was retrieved
+        self._engine_timestamp = time.monotonic()
+        self._init_session()
+
+    def _engine_session_kwargs(self):
+        """Get the session parameters with the known SNMP v3 engine, if any"""
+        if not self.engine_kwargs:
+            return self.session_kwargs
+        engine_id, boots, engine_time = self.engine_kwargs
+        return {
+            **self.session_kwargs,
+            "security_engine_id": engine_id,
+            "engine_boots": boots,
+            "engine_time": engine_time + int(time.monotonic() - self._engine_timestamp),
+        }
+
+    def _init_session(self):
+        """Init the SNMP session (with the cached SNMP v3 engine, if any)"""
+        if self.engine_kwargs:
+            log.debug(
+                "EasySNMPTransport(%s): use cached engine %s (boots: %d, time: %d)",
+                self.hostname,
+                *self.engine_kwargs,
+            )
+        self.session = self.session_class(**self._engine_session_kwargs())
+        # Session with shrunk timeout & retries used close to the deadline (and its budget)
+        self._deadline_session = (None, None)
+
+    def _cache_engine(self, items):
+        """
+        Store the SNMP v3 engine of the SNMP host (from the retrieved engine OIDs items), in the
+        engine cache if configured
+        """
+        # Only tried once by session
+        self.engine_kwargs = ()
+        try:
+            if len(items) != len(ENGINE_OIDS):
+                raise ValueError(f"{len(items)} items retrieved")
+            for item, oid, name in zip(items, ENGINE_OIDS, ENGINE_NAMES):
+                # GETNEXT requests return the next OID if the engine one is missing
+                retrieved = item_oid(item).strip(".").split("::")[-1]
+                if item.snmp_type in END_OF_WALK_TYPES or retrieved not in (
+                    oid,
+                    f"1{oid[3:]}",
+                    name,
+                ):
+                    raise ValueError(f"{retrieved} retrieved instead of {oid}")
+            engine_id, boots, engine_time = (
+                items[0].value.encode("latin-1").hex(),
+                int(items[1].value),
+                int(items[2].value),
+            )
+        except (IndexError, ValueError, UnicodeEncodeError) as err:
+            log.debug("EasySNMPTransport(%s): invalid engine: %s", self.hostname, err)
+            return
+        log.debug(
+            "EasySNMPTransport(%s): engine %s retrieved (boots: %d, time: %d)",
+            self.hostname,
+            engine_id,
+            boots,
+            engine_time,
+        )
+        self.engine_kwargs = (engine_id, boots, engine_time)
+        self._engine_timestamp = time.monotonic()
+        if self.engine_cache is not None:
+            self.engine_cache.set(self.engine_key, engine_id, boots, engine_time)
+
+    def _session(self):
+        """Get the SNMP session of the next request (see SNMPTransport.request_budget())"""
+        timeout, retries = self.request_budget(self.timeout, self.retries)
+        if (timeout, retries) == (self.timeout, self.retries):
+            return self.session
+        # Round the timeout down to avoid creating a new session for each request
+        budget = (max(0.1, math.floor(timeout * 10) / 10), retries)
+        if self._deadline_session[0] != budget:
+            # Created with the known SNMP v3 engine (without engine discovery round trip)
+            self._deadline_session = (
+                budget,
+                self.session_class(
+                    **{
+                        **self._engine_session_kwargs(),
+                        "timeout": budget[0],
+                        "retries": budget[1],
+                    }
+                ),
+            )
+        return self._deadline_session[1]
+
+    def _request(self, request_type, oids, send, max_repetitions=0, engine_oids=()):
+        """
+        Send a request on the SNMP session using the send function, called with the session and
+        the OIDs to request first (return the list of retrieved items). The SNMP v3 engine OIDs
+        (engine_oids) are requested first if the engine is unknown. On SNMP v3 engine error,
+        the cached engine is forgotten and the request retried.
+        """
+        session = self._session()
+        first_oids = list(engine_oids) if self.version == 3 and self.engine_kwargs is None else []
+        try:
+            with self._record(request_type, oids, max_repetitions) as answer, translate_errors():
+                items = send(session, first_oids)
+                if first_oids:
+                    self._cache_engine(items[: len(first_oids)])
+                    items = items[len(first_oids) :]
+                answer.extend(items)
+        except SNMPEngineError as err:
+            if not self.engine_kwargs:
+                raise
+            log.info(
+                "EasySNMPTransport(%s): outdated cached engine (%s), retry with engine discovery",
+                self.hostname,
+                err,
+            )
+            if self.engine_cache is not None:
+                self.engine_cache.invalidate(self.engine_key)
+            self.engine_kwargs = None
+            self._init_session()
+            self._record_retry()
+            return self._request(request_type, oids, send, max_repetitions, engine_oids)
+        return answer
+
+    def _get(self, oids):
+        return self._request(
+            "get",
+            oids,
+            lambda session, first_oids: session.get(first_oids + list(oids)),
+            engine_oids=ENGINE_OIDS,
+        )
+
+    def _get_next(self, oids):
+        return self._request(
+            "getnext",
+            oids,
+            lambda session, first_oids: session.get_next(first_oids + list(oids)),
+            engine_oids=ENGINE_NEXT_OIDS,
+        )
+
+    def _get_bulk(self, oids, max_repetitions):
+        return self._request(
+            "getbulk",
+            oids,
+            lambda session, first_oids: session.get_bulk(
+                first_oids + list(oids),
+                non_repeaters=len(first_oids),
+                max_repetitions=max_repetitions,
+            ),
+            max_repetitions,
+            engine_oids=ENGINE_NEXT_OIDS,
+        )
+
+    def _next_walk(self, oid):
+        if self.deadline is not None:
+            # Walk the subtree request by request to check the deadline before each of them
+            return super()._next_walk(oid)
+        # Let easysnmp walk the subtree itself
+        return self._request("walk", oid, lambda session, first_oids: session.walk(oid))
+
+
+# vim: tabstop=4 shiftwidth=4 softtabstop=4 expandtab
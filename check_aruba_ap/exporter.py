@@ -0,0 +1,316 @@
+""" OpenMetrics/Prometheus exporter of APs & radio interfaces metrics """
+
+import http.server
+import logging
+import threading
+import time
+import urllib.parse
+
+from check_aruba_ap.snmp_client import PROFILES
+
+log = logging.getLogger(__name__)
+
+# Exposition formats content types
+OPENMETRICS_CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+TEXT_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Metric types of the numeric column codecs (other columns are exported as info labels)
+METRIC_TYPES = {
+    "gauge": "gauge",
+    "integer": "gauge",
+    "status": "gauge",
+    "timeticks": "gauge",
+    "counter32": "counter",
+    "counter64": "counter",
+}
+
+# Metric name suffix & value divisor of the columns which need it (by table & key name)
+COLUMN_UNITS = {
+    ("ap", "uptime"): ("seconds", 100),
+    ("ap", "cpu_usage"): ("percent", 1),
+    ("radio", "usage"): ("percent", 1),
+    ("radio", "noise"): ("dbm", 1),
+}
+
+# Labels identifying the series of each table (label name & record attribute)
+SERIES_LABELS = {
+    "ap": (("name", "name"), ("ip", "ip")),
+    "radio": (("ap", "ap_name"), ("mac", "mac")),
+}
+
+
+def escape_label_value(value):
+    """Escape a label value"""
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_value(value, divisor=1):
+    """Format a sample value"""
+    return str(value) if divisor == 1 else repr(value / divisor)
+
+
+class LabelsCache:
+    """
+    Formatted label sets by label values: label strings are only built for new label values and
+    the ones not used by the last exposition are dropped (see rotate())
+    """
+
+    def __init__(self, names):
+        self.names = names
+        self._labels = {}
+        self._previous = {}
+
+    def get(self, values):
+        """Get the formatted label set of label values (a tuple, in names order)"""
+        labels = self._labels.get(values)
+        if labels is None:
+            labels = self._previous.get(values)
+            if labels is None:
+                labels = (
+                    "{"
+                    + ",".join(
+                        f'{name}="{escape_label_value(value)}"'
+                        for name, value in zip(self.names, values)
+                        if value is not None
+                    )
+                    + "}"
+                )
+            self._labels[values] = labels
+        return labels
+
+    def rotate(self):
+        """Start a new exposition"""
+        self._previous, self._labels = self._labels, {}
+
+
+class MetricFamily:
+    """Metric family (with its samples lines of the current exposition)"""
+
+    def __init__(self, name, metric_type, description):
+        self.name = name
+        self.sample_name = f"{name}_total" if metric_type == "counter" else name
+        # Family headers by exposition format (OpenMetrics or not)
+        self.headers = {
+            True: f"# HELP {name} {description}\n# TYPE {name} {metric_type}\n",
+            False: (
+                f"# HELP {self.sample_name} {description}\n"
+                f"# TYPE {self.sample_name} {metric_type}\n"
+            ),
+        }
+        self.lines = []
+
+    def add(self, labels, value):
+        """Add a sample (value already formatted)"""
+        self.lines.append(f"{self.sample_name}{labels} {value}\n")
+
+    def expose(self, openmetrics):
+        """Iterate on the exposition lines of the family"""
+        if self.lines:
+            yield self.headers[openmetrics]
+            yield from self.lines
+
+
+class TableMetrics:
+    """
+    Metrics of a table of an SNMP profile: one metric family by numeric column (according to its
+    codec) and one info metric with the text columns as labels
+    """
+
+    def __init__(self, table, profile):
+        self.table = table
+        self.series_labels = SERIES_LABELS[table]
+        # Metric family & value divisor by column key name
+        self.columns = {}
+        info_keys = []
+        codecs = profile.get(f"{table}_codecs", {})
+        for key, oid in profile[f"{table}_oids"].items():
+            if oid is None:
+                continue
+            metric_type = METRIC_TYPES.get(codecs.get(key))
+            if metric_type is None:
+                if key not in dict(self.series_labels).values():
+                    info_keys.append(key)
+                continue
+            suffix, divisor = COLUMN_UNITS.get((table, key), (None, 1))
+            name = key.replace("_total", "") if metric_type == "counter" else key
+            name = f"aruba_{table}_{name}" + (f"_{suffix}" if suffix else "")
+            self.columns[key] = (
+                MetricFamily(name, metric_type, f"Aruba {table} {key.replace('_', ' ')}"),
+                divisor,
+            )
+        self.info_keys = tuple(info_keys)
+        self.info = MetricFamily(f"aruba_{table}_info", "gauge", f"Aruba {table} info (as labels)")
+        self.labels = LabelsCache(tuple(name for name, _ in self.series_labels))
+        self.info_labels = LabelsCache(self.labels.names + self.info_keys)
+
+    def clear(self):
+        """Clear the samples of the current exposition"""
+        for family, _ in self.columns.values():
+            family.lines = []
+        self.info.lines = []
+
+    def rotate(self):
+        """Start a new exposition"""
+        self.clear()
+        self.labels.rotate()
+        self.info_labels.rotate()
+
+    def add(self, record, **extra):
+        """Add the samples of a record (extra attributes could be used as series labels)"""
+        values = tuple(
+            extra[attr] if attr in extra else getattr(record, attr)
+            for _, attr in self.series_labels
+        )
+        labels = self.labels.get(values)
+        for key, (family, divisor) in self.columns.items():
+            value = getattr(record, key)
+            if value is not None:
+                family.add(labels, format_value(value, divisor))
+        if self.info_keys:
+            self.info.add(
+                self.info_labels.get(
+                    values + tuple(getattr(record, key) for key in self.info_keys)
+                ),
+                "1",
+            )
+
+    def expose(self, openmetrics):
+        """Iterate on the exposition lines of the table metrics"""
+        yield from self.info.expose(openmetrics)
+        for family, _ in self.columns.values():
+            yield from family.expose(openmetrics)
+
+
+class ControllerExporter:
+    """
+    Metrics exporter of one SNMP host using a persistent SNMP client
+
+    Scrape results are cached for interval seconds: parallel scrapes (or scrapes of many
+    Prometheus replicas) wait for the same SNMP poll and share its exposition.
+    """
+
+    def __init__(self, hostname, get_client, interval=30):
+        self.hostname = hostname
+        self.get_client = get_client
+        self.interval = interval
+        # Metrics of each table (according to the SNMP client profile)
+        self.tables = {}
+        self.scrape_families = {
+            "up": MetricFamily("aruba_up", "gauge", "SNMP host successfully polled"),
+            "duration": MetricFamily(
+                "aruba_poll_duration_seconds", "gauge", "SNMP poll duration in seconds"
+            ),
+            "timestamp": MetricFamily(
+                "aruba_poll_timestamp_seconds", "gauge", "SNMP poll Unix timestamp"
+            ),
+        }
+        self._client = None
+        self._lock = threading.Lock()
+        # Monotonic time of the last poll and its expositions by format
+        self._polled = None
+        self._expositions = {}
+
+    def poll(self):
+        """Poll the SNMP host and collect its samples (return True on success)"""
+        for table_metrics in self.tables.values():
+            table_metrics.rotate()
+        try:
+            if self._client is None:
+                self._client = self.get_client(self.hostname)
+                self.tables = {
+                    table: TableMetrics(table, PROFILES[self._client.profile_name])
+                    for table in ("ap", "radio")
+                }
+            ap_names = {}
+            for ap in self._client.iter_aps_status():
+                ap_names[ap.ip] = ap.name
+                self.tables["ap"].add(ap)
+            for ip, radios in self._client.iter_radio_status_by_ap():
+                for it in radios:
+                    self.tables["radio"].add(it, ap_name=ap_names.get(ip) or ip)
+        except Exception:  # pylint: disable=broad-except
+            log.exception("%s: fail to poll SNMP host", self.hostname)
+            for table_metrics in self.tables.values():
+                table_metrics.clear()
+            return False
+        return True
+
+    def scrape(self, openmetrics=False):
+        """Get the exposition of the latest samples (the SNMP host is polled if they expired)"""
+        with self._lock:
+            if self._polled is None or time.monotonic() - self._polled >= self.interval:
+                start = time.monotonic()
+                success = self.poll()
+                self._polled = time.monotonic()
+                for family in self.scrape_families.values():
+                    family.lines = []
+                self.scrape_families["up"].add("", "1" if success else "0")
+                self.scrape_families["duration"].add("", repr(round(self._polled - start, 3)))
+                self.scrape_families["timestamp"].add("", repr(round(time.time(), 3)))
+                self._expositions = {}
+                log.info(
+                    "%s: polled in %.1fs (success: %s)",
+                    self.hostname,
+                    self._polled - start,
+                    success,
+                )
+            if openmetrics not in self._expositions:
+                self._expositions[openmetrics] = self.expose(openmetrics).encode("utf-8")
+            return self._expositions[openmetrics]
+
+    def expose(self, openmetrics):
+        """Format the exposition of the latest samples"""
+        lines = []
+        for family in self.scrape_families.values():
+            lines.extend(family.expose(openmetrics))
+        for table_metrics in self.tables.values():
+            lines.extend(table_metrics.expose(openmetrics))
+        if openmetrics:
+            lines.append("# EOF\n")
+        return "".join(lines)
+
+
+class ExporterRequestHandler(http.server.BaseHTTPRequestHandler):
+    """
+    Exporter HTTP request handler: the metrics of an SNMP host are served on /metrics?target=HOST
+    (the target parameter is optional if only one SNMP host is exported)
+    """
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """Handle GET requests"""
+        url = urllib.parse.urlsplit(self.path)
+        if url.path != "/metrics":
+            self.send_error(404)
+            return
+        target = urllib.parse.parse_qs(url.query).get("target", [None])[0]
+        exporters = self.server.exporters
+        if target is None and len(exporters) == 1:
+            target = next(iter(exporters))
+        if target not in exporters:
+            self.send_error(404, f"{target} is not exported by this exporter")
+            return
+        openmetrics = "application/openmetrics-text" in self.headers.get("Accept", "")
+        body = exporters[target].scrape(openmetrics)
+        self.send_response(200)
+        self.send_header(
+            "Content-Type", OPENMETRICS_CONTENT_TYPE if openmetrics else TEXT_CONTENT_TYPE
+        )
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        log.debug("%s - %s", self.address_string(), format % args)
+
+
+class ExporterServer(http.server.ThreadingHTTPServer):
+    """Exporter HTTP server serving the metrics of its controller exporters"""
+
+    daemon_threads = True
+
+    def __init__(self, address, exporters):
+        self.exporters = {exporter.hostname: exporter for exporter in exporters}
+        super().__init__(address, ExporterRequestHandler)
+
+
+# vim: tabstop=4 shiftwidth=4 softtabstop=4 expandtab
@@ -0,0 +1,125 @@
+""" Poller daemon & its client """
+
+import json
+import logging
+import os
+import socket
+import socketserver
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+
+class PollerException(Exception):
+    """Poller exception"""
+
+
+class ControllerPoller(threading.Thread):
+    """Thread polling on schedule one SNMP host using a persistent SNMP client"""
+
+    def __init__(self, hostname, get_client, poll, interval=60):
+        super().__init__(name=f"poller-{hostname}", daemon=True)
+        self.hostname = hostname
+        self.get_client = get_client
+        self.poll = poll
+        self.interval = interval
+        self.snapshot = None
+        self.error = None
+        self.ready = threading.Event()
+        self.stopped = threading.Event()
+
+    def run(self):
+        client = None
+        while not self.stopped.is_set():
+            start = time.monotonic()
+            try:
+                if client is None:
+                    client = self.get_client(self.hostname)
+                snapshot = self.poll(client)
+                snapshot["timestamp"] = time.time()
+                self.snapshot = snapshot
+                self.error = None
+                log.info(
+                    "%s: %d APs polled in %.1fs",
+                    self.hostname,
+                    len(snapshot["aps"]),
+                    time.monotonic() - start,
+                )
+            except Exception as err:  # pylint: disable=broad-except
+                log.exception("%s: fail to poll SNMP host", self.hostname)
+                self.error = f"Fail to poll {self.hostname}: {err or type(err).__name__}"
+            self.ready.set()
+            self.stopped.wait(max(0, self.interval - (time.monotonic() - start)))
+
+    def get_snapshot(self, timeout=10):
+        """Get the latest snapshot (wait for the first poll if not done yet)"""
+        if not self.ready.wait(timeout):
+            return {"error": f"{self.hostname} not polled yet"}
+        if self.snapshot is None:
+            return {"error": self.error}
+        return {**self.snapshot, **({"error": self.error} if self.error else {})}
+
+
+class PollerRequestHandler(socketserver.StreamRequestHandler):
+    """Poller UNIX socket request handler (one JSON line request, one JSON line answer)"""
+
+    def handle(self):
+        try:
+            request = json.loads(self.rfile.readline())
+            poller = self.server.pollers.get(request.get("hostname"))
+            if poller is None:
+                answer = {"error": f"{request.get('hostname')} is not polled by this poller"}
+            else:
+                answer = poller.get_snapshot()
+        except (ValueError, AttributeError) as err:
+            answer = {"error": f"Invalid request: {err}"}
+        self.wfile.write(json.dumps(answer).encode("utf-8") + b"\n")
+
+
+class PollerServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Poller UNIX socket server serving the latest snapshots of its controller pollers"""
+
+    daemon_threads = True
+
+    def __init__(self, socket_path, pollers):
+        self.socket_path = socket_path
+        self.pollers = {poller.hostname: poller for poller in pollers}
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        super().__init__(socket_path, PollerRequestHandler)
+
+    def serve_forever(self, poll_interval=0.5):
+        for poller in self.pollers.values():
+            poller.start()
+        try:
+            super().serve_forever(poll_interval=poll_interval)
+        finally:
+            for poller in self.pollers.values():
+                poller.stopped.set()
+
+    def server_close(self):
+        super().server_close()
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+
+def query_poller(socket_path, hostname, timeout=15):
+    """Query the poller daemon for the latest snapshot of an SNMP host"""
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(timeout)
+            sock.connect(socket_path)
+            sock.sendall(json.dumps({"hostname": hostname}).encode("utf-8") + b"\n")
+            with sock.makefile("rb") as fd:
+                answer = json.loads(fd.readline())
+    except (OSError, ValueError) as err:
+        raise PollerException(f"Fail to query poller on {socket_path}: {err}") from err
+    if "aps" not in answer:
+        raise PollerException(answer.get("error") or "Invalid poller answer")
+    if answer.get("error"):
+        log.warning("Poller error: %s", answer["error"])
+    return answer
+
+
+# vim: tabstop=4 shiftwidth=4 softtabstop=4 expandtab
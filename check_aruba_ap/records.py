@@ -0,0 +1,85 @@
+""" AP & radio interface records """
+
+
+class Record:
+    """
+    Compact typed record
+
+    Fields are declared as annotations (and used as slots). Values are converted once at ingest
+    (see SNMPClient) and missing columns are None. Records could be serialized as dicts (without
+    the missing values) to be cached or sent as JSON.
+    """
+
+    __slots__ = ()
+
+    def __init__(self, **values):
+        for name in self.__slots__:
+            setattr(self, name, values.pop(name, None))
+        if values:
+            raise TypeError(f"Unknown {type(self).__name__} fields: {', '.join(values)}")
+
+    @classmethod
+    def from_dict(cls, data):
+        """Load a record from a dict (unknown keys are ignored)"""
+        return cls(**{name: value for name, value in data.items() if name in cls.__slots__})
+
+    def to_dict(self):
+        """Dump the record as a dict (without the missing values)"""
+        return {
+            name: getattr(self, name) for name in self.__slots__ if getattr(self, name) is not None
+        }
+
+    def __repr__(self):
+        return (
+            f"{type(self).__name__}({', '.join(f'{k}={v!r}' for k, v in self.to_dict().items())})"
+        )
+
+
+class AccessPoint(Record):
+    """AP record"""
+
+    ip: str
+    name: str
+    group: str
+    serial: str
+    model: str
+    uptime: int
+    status: int
+    cpu_usage: int
+    free_mem: int
+    total_mem: int
+    __slots__ = tuple(__annotations__)
+
+    @property
+    def online(self):
+        """Check if the AP is online"""
+        return self.status == 1
+
+    @property
+    def mem_usage(self):
+        """Memory usage (in percent, None if unknown)"""
+        if self.free_mem is None or not self.total_mem:
+            return None
+        return self.free_mem * 100 / self.total_mem
+
+
+class RadioInterface(Record):
+    """Radio interface record"""
+
+    mac: str
+    ssid: str
+    noise: int
+    usage: int
+    tx_total_frames: int
+    tx_total_bytes: int
+    tx_dropped_frames: int
+    rx_total_frames: int
+    rx_total_bytes: int
+    rx_bad_frames: int
+    phy_events: int
+    status: int
+    clients_count: int
+    __slots__ = tuple(__annotations__)
+
+
+# vim: tabstop=4 shiftwidth=4 softtabstop=4 expandtab
@@ -0,0 +1,132 @@
+""" SNMP transport backend replaying a recorded SNMP session """
+
+import logging
+import time
+
+from check_aruba_ap.session_file import SessionFileError, SessionRecord
+from check_aruba_ap.transport import (
+    SNMPDeadlineError,
+    SNMPEngineError,
+    SNMPError,
+    SNMPNoSuchNameError,
+    SNMPTimeoutError,
+    SNMPTooBigError,
+    SNMPTransport,
+    SNMPVariable,
+)
+
+log = logging.getLogger(__name__)
+
+# Replayed errors classes by name
+ERRORS = {
+    error_class.__name__: error_class
+    for error_class in (
+        SNMPError,
+        SNMPTimeoutError,
+        SNMPDeadlineError,
+        SNMPNoSuchNameError,
+        SNMPTooBigError,
+        SNMPEngineError,
+    )
+}
+
+
+class ReplayTransport(SNMPTransport):
+    """
+    SNMP transport backend replaying the answers of an SNMP session record file (see
+    check_aruba_ap.session_file)
+
+    Requests have to be the same as the recorded ones (same SNMP client parameters & cache files
+    state). Answers are delayed by their recorded latency multiplied by latency_factor (0 to
+    replay them as fast as possible) and answers slower than the requests timeout (and retries)
+    are replayed as timeouts.
+    """
+
+    # Requests are replayed from a shared session record
+    thread_safe = True
+
+    def __init__(
+        self,
+        max_repetitions=20,
+        max_get_varbinds=32,
+        max_get_pdu_size=1400,
+        recorder=None,
+        deadline=None,
+        session_recorder=None,
+        hostname="localhost",
+        version=1,
+        timeout=5,
+        retries=3,
+        replay_file=None,
+        latency_factor=1,
+        **kwargs,
+    ):
+        super().__init__(
+            hostname=hostname,
+            version=version,
+            max_repetitions=max_repetitions,
+            max_get_varbinds=max_get_varbinds,
+            max_get_pdu_size=max_get_pdu_size,
+            recorder=recorder,
+            deadline=deadline,
+            session_recorder=session_recorder,
+        )
+        log.debug("ReplayTransport(%s): ignored session parameters: %s", hostname, list(kwargs))
+        if not replay_file:
+            raise SNMPError("A SNMP session record file is required by the replay transport")
+        try:
+            self.session = SessionRecord(replay_file)
+        except SessionFileError as err:
+            raise SNMPError(str(err)) from err
+        self.timeout = timeout
+        self.retries = retries
+        self.latency_factor = latency_factor
+
+    def _replay(self, request_type, oids, max_repetitions=0):
+        """
+        Replay a request (return the list of retrieved items): like the recorded transport, the
+        request is retried after an SNMP v3 engine error (if the retry was recorded)
+        """
+        timeout, retries = self.request_budget(self.timeout, self.retries)
+        try:
+            with self._record(request_type, oids, max_repetitions) as answer:
+                exchange = self.session.pop(self.hostname, request_type, oids, max_repetitions)
+                if exchange is None:
+                    oids = [oids] if isinstance(oids, str) else oids
+                    raise SNMPError(
+                        f"{request_type} request of {len(oids)} OIDs ({oids[0]}...) not recorded "
+                        "in the SNMP session record file"
+                    )
+                latency, items, error_type, error = exchange
+                latency *= self.latency_factor
+                if latency > timeout * (retries + 1):
+                    time.sleep(timeout * (retries + 1))
+                    raise SNMPTimeoutError(f"Timeout waiting for SNMP answer of {self.hostname}")
+                time.sleep(latency)
+                if error_type is not None:
+                    raise ERRORS.get(error_type, SNMPError)(error)
+                answer.extend(SNMPVariable(*item) for item in items)
+        except SNMPEngineError:
+            if not self.session.recorded(self.hostname, request_type, oids, max_repetitions):
+                raise
+            self._record_retry()
+            return self._replay(request_type, oids, max_repetitions)
+        return answer
+
+    def _get(self, oids):
+        return self._replay("get", oids)
+
+    def _get_next(self, oids):
+        return self._replay("getnext", oids)
+
+    def _get_bulk(self, oids, max_repetitions):
+        return self._replay("getbulk", oids, max_repetitions)
+
+    def _next_walk(self, oid):
+        if not self.session.recorded(self.hostname, "walk", oid):
+            return super()._next_walk(oid)
+        # Subtree walked by the recorded transport itself (see EasySNMPTransport._next_walk())
+        return self._replay("walk", oid)
+
+
+# vim: tabstop=4 shiftwidth=4 softtabstop=4 expandtab
@@ -1,62 +1,250 @@
 """ Common script stuff """
 
 import argparse
+import configparser
 import logging
 import os.path
 import sys
+import time
 
-from check_aruba_ap.snmp_client import DEFAULT_PROFILE, PROFILES, SNMPClient
+from check_aruba_ap.cache import PollCache
+from check_aruba_ap.poller import PollerException, query_poller
+from check_aruba_ap.records import AccessPoint, RadioInterface
+from check_aruba_ap.snmp_client import AUTO_PROFILE, DEFAULT_PROFILE, PROFILES, SNMPClient
+from check_aruba_ap.stats import SNMPStats
+from check_aruba_ap.thresholds import Range, ThresholdError, Thresholds, parse_rule
+from check_aruba_ap.transport import DEFAULT_TRANSPORT, TRANSPORTS
 
+STATUS_LABELS = {0: "OK", 1: "WARNING", 2: "CRITICAL", 3: "UNKNOWN"}
+# Icinga status ordered from the best to the worst one
+STATUS_ORDER = (0, 1, 3, 2)
 
-def get_parser(*args, **kwargs):
-    """Get script arguments parser"""
+
+def threshold_range(value):
+    """Parse a threshold range argument"""
+    try:
+        return Range(value)
+    except ThresholdError as err:
+        raise argparse.ArgumentTypeError(str(err)) from err
+
+
+def threshold_rule(value):
+    """Parse a threshold override rule argument"""
+    try:
+        return parse_rule(value)
+    except ThresholdError as err:
+        raise argparse.ArgumentTypeError(str(err)) from err
+
+
+def get_parser(*args, multiple_hostnames=False, **kwargs):
+    """
+    Get script arguments parser
+
+    If multiple_hostnames is True, the -H/--hostname parameter could be specified multiple times
+    and SNMP hosts could also be defined in a configuration file (see get_hosts_args()).
+    """
     parser = argparse.ArgumentParser(*args, **kwargs)
 
-    parser.add_argument(
-        "-H",
-        "--hostname",
-        type=str,
-        help="Aruba SNMP hostname (IP address required for the current elected virtual controller)",
-        required=True,
-    )
+    if multiple_hostnames:
+        parser.add_argument(
+            "-H",
+            "--hostname",
+            type=str,
+            action="append",
+            help=(
+                "Aruba SNMP hostname (IP address required for the current elected virtual "
+                "controller). Could be specified multiple times to check multiple controllers"
+            ),
+        )
+        parser.add_argument(
+            "--config",
+            help=(
+                "Configuration file path (INI format) defining the SNMP hosts to check: one "
+                "section by host, named with its hostname (or specifying it using the hostname "
+                "key), with parameters long names as keys (for instance, snmp_profile or "
+                "snmp_community). The DEFAULT section could be used to specify parameters of all "
+                "hosts"
+            ),
+        )
+    else:
+        parser.add_argument(
+            "-H",
+            "--hostname",
+            type=str,
+            help=(
+                "Aruba SNMP hostname (IP address required for the current elected virtual "
+                "controller)"
+            ),
+            required=True,
+        )
 
     parser.add_argument(
         "-cw",
         "--warning-cpu-threshold",
-        type=int,
-        help="Warning AP CPU usage threshold (default: 80%%)",
-        default=80,
+        type=threshold_range,
+        help=(
+            "Warning AP CPU usage threshold: a number N (alert if usage >= N) or a Nagios range "
+            "(for instance, ~:70 or @10:20) (default: 80%%)"
+        ),
+        default="80",
     )
     parser.add_argument(
         "-cc",
         "--critical-cpu-threshold",
-        type=int,
-        help="Critical AP CPU usage threshold (default: 95%%)",
-        default=95,
+        type=threshold_range,
+        help="Critical AP CPU usage threshold (same syntax, default: 95%%)",
+        default="95",
     )
     parser.add_argument(
         "-mc",
         "--warning-memory-threshold",
-        type=int,
-        help="Warning AP memory threshold (default: 80%%)",
-        default=80,
+        type=threshold_range,
+        help="Warning AP memory threshold (same syntax, default: 80%%)",
+        default="80",
     )
     parser.add_argument(
         "-mw",
         "--critical-memory-threshold",
+        type=threshold_range,
+        help="Critical AP memory threshold (same syntax, default: 95%%)",
+        default="95",
+    )
+    parser.add_argument(
+        "--threshold",
+        type=threshold_rule,
+        action="append",
+        help=(
+            "AP metric thresholds override rule: a metric name (cpu or mem) followed by "
+            "comma-separated warning, critical, model and/or group parameters, for instance "
+            "'cpu,warning=~:70,critical=~:90,model=AP-515' (the group is only available with "
+            "controller profiles). Could be specified multiple times, the last matching rule wins"
+        ),
+    )
+    parser.add_argument(
+        "--deadline",
+        type=float,
+        help=(
+            "Global SNMP polling time budget in seconds (should be lower than the Icinga check "
+            "timeout): requests timeout & retries are shrunk to fit in it and, once reached, the "
+            "APs & radio interfaces retrieved so far are checked, the other ones are reported as "
+            "unknown"
+        ),
+    )
+
+    add_snmp_options(parser)
+
+    cache_opts = parser.add_argument_group("Cache options")
+
+    cache_opts.add_argument(
+        "--cache-dir",
+        help=(
+            "Directory path of the shared on-disk poll cache. If provided, APs & radio tables of "
+            "the SNMP host are polled once by TTL window and the result is shared across "
+            "invocations"
+        ),
+    )
+    cache_opts.add_argument(
+        "--cache-ttl",
+        type=int,
+        help="Poll cache TTL in seconds (default: 60)",
+        default=60,
+    )
+    cache_opts.add_argument(
+        "--cache-stale-ttl",
         type=int,
-        help="Critical AP memory threshold (default: 95%%)",
+        help=(
+            "Duration in seconds after cache expiration during which stale data could be used "
+            "while another invocation is refreshing it or if the refresh fail (default: 0)"
+        ),
+        default=0,
+    )
+    cache_opts.add_argument(
+        "--cache-lock-timeout",
+        type=int,
+        help="Maximum duration in seconds to wait for the poll cache lock (default: 30)",
+        default=30,
+    )
+
+    poller_opts = parser.add_argument_group("Poller options")
+
+    poller_opts.add_argument(
+        "--poller-socket",
+        help=(
+            "Poller daemon UNIX socket path. If provided, APs & radio interfaces status are "
+            "retrieved from the poller daemon instead of the SNMP host"
+        ),
+    )
+    poller_opts.add_argument(
+        "--poller-max-age",
+        type=int,
+        help="Maximum age in seconds of the data retrieved from the poller daemon (default: 300)",
+        default=300,
+    )
+
+    stats_opts = parser.add_argument_group("Statistics options")
+
+    stats_opts.add_argument(
+        "--stats",
+        action="store_true",
+        help=(
+            "Add SNMP requests statistics (requests, varbinds, retries, timeouts, estimated "
+            "bytes and time by profile column) as extra perfdata"
+        ),
+    )
+    stats_opts.add_argument(
+        "--stats-file",
+        help=(
+            "File path used to dump SNMP requests statistics as JSON (including requests "
+            "latency histograms by profile column)"
+        ),
+    )
+
+    add_logging_options(parser)
+
+    return parser
+
+
+def add_radio_usage_options(parser):
+    """Add radio interfaces usage thresholds options to a script arguments parser (or group)"""
+    parser.add_argument(
+        "-rc",
+        "--warning-radio-usage-threshold",
+        type=int,
+        help="Warning AP radio interface usage threshold (default: 80%%)",
+        default=80,
+    )
+    parser.add_argument(
+        "-rw",
+        "--critical-radio-usage-threshold",
+        type=int,
+        help="Critical AP radio interface usage threshold (default: 95%%)",
         default=95,
     )
 
+
+def add_snmp_options(parser):
+    """Add SNMP options to a script arguments parser"""
     snmp_opts = parser.add_argument_group("SNMP options")
 
     snmp_opts.add_argument(
         "--snmp-profile",
-        choices=list(PROFILES.keys()),
-        help=f"SNMP profile (default: {DEFAULT_PROFILE})",
+        choices=list(PROFILES.keys()) + [AUTO_PROFILE],
+        help=(
+            f"SNMP profile, or {AUTO_PROFILE} to detect it from the sysObjectID of the SNMP host "
+            f"or by probing the OIDs of each profile (default: {DEFAULT_PROFILE})"
+        ),
         default=DEFAULT_PROFILE,
     )
+    snmp_opts.add_argument(
+        "--snmp-transport",
+        choices=list(TRANSPORTS.keys()),
+        help=(
+            f"SNMP transport backend (default: {DEFAULT_TRANSPORT}). The asyncio one only "
+            "supports SNMP v1 & v2c and pipelines the requests of the table walks. The replay one "
+            "replays a recorded SNMP session (see --snmp-replay-file)"
+        ),
+        default=DEFAULT_TRANSPORT,
+    )
     snmp_opts.add_argument(
         "-C",
         "--snmp-community",
@@ -95,7 +283,107 @@ def get_parser(*args, **kwargs):
     snmp_opts.add_argument(
         "-t", "--snmp-timeout", type=int, help="SNMP timeout (default: 5)", default=5
     )
+    snmp_opts.add_argument(
+        "--snmp-max-repetitions",
+        type=int,
+        help=(
+            "SNMP GETBULK max-repetitions used to walk tables with SNMP v2c/v3 (default: 20, "
+            "0 to disable GETBULK requests)"
+        ),
+        default=20,
+    )
+    snmp_opts.add_argument(
+        "--snmp-max-get-varbinds",
+        type=int,
+        help="Maximum number of OIDs packed in one SNMP GET request (default: 32)",
+        default=32,
+    )
+    snmp_opts.add_argument(
+        "--snmp-max-get-pdu-size",
+        type=int,
+        help=(
+            "Maximum estimated size (in bytes) of the OIDs packed in one SNMP GET request "
+            "(default: 1400, 0 for unlimited)"
+        ),
+        default=1400,
+    )
+    snmp_opts.add_argument(
+        "--snmp-max-workers",
+        type=int,
+        help=(
+            "Maximum number of concurrent SNMP requests chains on the SNMP host (used to fetch the "
+            "radio tables of all APs, default: 4, 1 to fetch them one by one)"
+        ),
+        default=4,
+    )
+    snmp_opts.add_argument(
+        "--ap-index-file",
+        help=(
+            "File path used to store and reuse the SNMP index of the APs (resolved from their IP "
+            "address) across invocations"
+        ),
+    )
+    snmp_opts.add_argument(
+        "--profile-file",
+        help=(
+            "File path used to store and reuse the SNMP profile detected on each SNMP host across "
+            f"invocations (with --snmp-profile {AUTO_PROFILE})"
+        ),
+    )
+    snmp_opts.add_argument(
+        "--inventory-refresh",
+        type=int,
+        help=(
+            "Refresh the inventory columns (AP name, serial, model, radio SSID...) every N polls "
+            "only, or when the AP uptime goes backwards or a new AP/radio appears (default: 10, 0 "
+            "to refresh them on each poll)"
+        ),
+        default=10,
+    )
+    snmp_opts.add_argument(
+        "--inventory-file",
+        help="File path used to store and reuse the inventory columns values across invocations",
+    )
+    snmp_opts.add_argument(
+        "--snmp-engine-cache-file",
+        help=(
+            "File path used to store and reuse the SNMP v3 engine ID, boots & time of the SNMP "
+            "hosts across invocations, to skip the engine discovery (easysnmp transport only, "
+            "the file is only readable by its owner)"
+        ),
+    )
+    snmp_opts.add_argument(
+        "--snmp-record-file",
+        help=(
+            "File path used to record the SNMP session (requests, answers and their latency, "
+            "written on exit) to replay it later with --snmp-transport replay"
+        ),
+    )
+    snmp_opts.add_argument(
+        "--snmp-replay-file",
+        help="SNMP session record file replayed by the replay SNMP transport",
+    )
+    snmp_opts.add_argument(
+        "--snmp-replay-latency-factor",
+        type=float,
+        help=(
+            "Multiplying factor of the replayed answers latency (default: 1, 0 to replay them as "
+            "fast as possible)"
+        ),
+        default=1,
+    )
+    snmp_opts.add_argument(
+        "--snmp-disable-table-fetch",
+        action="store_true",
+        help=(
+            "Disable table fetch mode (walk each table OID column once) and get each table cell "
+            "one by one"
+        ),
+    )
+
 
+def add_logging_options(parser):
+    """Add logging options to a script arguments parser"""
     log_opts = parser.add_argument_group("Logging options")
 
     log_opts.add_argument("-v", "--verbose", action="store_true", help="Enable verbose mode")
@@ -108,12 +396,14 @@ def get_parser(*args, **kwargs):
         help="Always log on console (even if log file is configured)",
     )
 
-    return parser
-
 
 def parse_args(parser, argv=None):
     """Parse and return script arguments"""
     args = parser.parse_args(argv if argv else sys.argv[1:])
+    # The polling deadline is counted from the script start
+    args.deadline_time = (
+        time.monotonic() + args.deadline if getattr(args, "deadline", None) else None
+    )
 
     # Init logging
     logformat = f"%(asctime)s - {os.path.basename(sys.argv[0])} - %(levelname)s - %(message)s"
@@ -140,12 +430,206 @@ def fatal_error(error):
     sys.exit(3)
 
 
-def get_snmp_client(args):
+def worst_status(statuses):
+    """Retrieve the worst of Icinga statuses"""
+    return max(statuses, key=STATUS_ORDER.index, default=0)
+
+
+def check_radio_usage(args, it):
+    """Check a radio interface usage against its thresholds (return status & exceeded threshold)"""
+    if it.usage is None:
+        return 0, None
+    if it.usage >= args.critical_radio_usage_threshold:
+        return 2, args.critical_radio_usage_threshold
+    if it.usage >= args.warning_radio_usage_threshold:
+        return 1, args.warning_radio_usage_threshold
+    return 0, None
+
+
+def format_perf_data(perf_data):
+    """Format Icinga perfdata (labels are quoted)"""
+    return " ".join([f"'{label}'={value}" for label, value in perf_data.items()])
+
+
+class DetailItems:
+    """
+    Detail items of a check long output, sorted by key
+
+    All added items are counted, but if max_items is set, only the max_items first ones are kept
+    (the list is trimmed each time its size doubles, so memory usage stays bounded).
+    """
+
+    def __init__(self, max_items=0, key=None):
+        self.max_items = max_items
+        self.key = key
+        self.count = 0
+        self._items = []
+
+    def add(self, item):
+        """Add an item"""
+        self.count += 1
+        self._items.append(item)
+        if self.max_items and len(self._items) >= 2 * self.max_items:
+            self._items = sorted(self._items, key=self.key)[: self.max_items]
+
+    @property
+    def items(self):
+        """Kept items (sorted)"""
+        return sorted(self._items, key=self.key)[: self.max_items or None]
+
+    @property
+    def more(self):
+        """Number of added items not kept"""
+        return self.count - min(len(self._items), self.max_items or len(self._items))
+
+    def __len__(self):
+        return self.count
+
+
+def get_hosts_args(parser, args):
+    """
+    Get arguments of each SNMP host to check (from -H/--hostname and --config parameters)
+
+    Return a list of arguments namespaces with a single hostname and the host name (the
+    hostname or the configuration section name) as name attribute.
+    """
+    hosts_args = [
+        argparse.Namespace(**{**vars(args), "hostname": hostname, "name": hostname})
+        for hostname in args.hostname or []
+    ]
+    if not args.config:
+        return hosts_args
+
+    config = configparser.ConfigParser(interpolation=None)
+    try:
+        if not config.read(args.config, encoding="utf-8"):
+            fatal_error(f"Fail to read configuration file {args.config}")
+    except configparser.Error as err:
+        fatal_error(f"Fail to parse configuration file {args.config}: {err}")
+    actions = {
+        action.dest: action for action in parser._actions  # pylint: disable=protected-access
+    }
+    for section in config.sections():
+        hostname = section
+        host_argv = []
+        for key, value in config.items(section):
+            dest = key.replace("-", "_")
+            if dest == "hostname":
+                hostname = value
+                continue
+            if (
+                dest not in actions
+                or dest in ("help", "config")
+                or not actions[dest].option_strings
+            ):
+                parser.error(f"Invalid parameter {key} in configuration section {section}")
+            if actions[dest].nargs == 0:
+                if config.getboolean(section, key):
+                    host_argv.append(actions[dest].option_strings[-1])
+                continue
+            host_argv += [actions[dest].option_strings[-1], value]
+        host_args = parser.parse_args(host_argv, namespace=argparse.Namespace(**vars(args)))
+        host_args.hostname = hostname
+        host_args.name = section
+        hosts_args.append(host_args)
+    return hosts_args
+
+
+def get_poll_cache(args, profile_name=None):
+    """
+    Get the configured PollCache instance from command arguments (or None): data are cached by
+    hostname & SNMP profile (the one provided in command arguments by default)
+    """
+    if not args.cache_dir:
+        return None
+    return PollCache(
+        args.cache_dir,
+        f"{args.hostname}_{profile_name or args.snmp_profile}",
+        ttl=args.cache_ttl,
+        stale_ttl=args.cache_stale_ttl,
+        lock_timeout=args.cache_lock_timeout,
+    )
+
+
+def poll_snapshot(snmp_client):
+    """
+    Poll all APs & radio interfaces status of the SNMP host (as JSON serializable data, with the
+    SNMP profile name)
+    """
+    return {
+        "profile": snmp_client.profile_name,
+        "aps": [ap.to_dict() for ap in snmp_client.get_aps_status()],
+        "radios": {
+            ip: [it.to_dict() for it in radio]
+            for ip, radio in snmp_client.get_radio_status_by_ap().items()
+        },
+    }
+
+
+def use_snapshot(args):
+    """Check if APs & radio interfaces status have to be retrieved from a snapshot"""
+    return bool(args.poller_socket or args.cache_dir)
+
+
+def get_snapshot(args):
+    """
+    Get all APs & radio interfaces status of the SNMP host from the poller or the poll cache (as
+    AccessPoint & RadioInterface records)
+    """
+    if args.poller_socket:
+        snapshot = query_poller(args.poller_socket, args.hostname)
+        age = time.time() - snapshot["timestamp"]
+        if age > args.poller_max_age:
+            raise PollerException(f"Poller data are too old ({int(age)}s)")
+    elif args.snmp_profile == AUTO_PROFILE:
+        # Cache data by detected profile (the SNMP client is needed to detect it)
+        snmp_client = get_snmp_client(args)
+        snapshot = get_poll_cache(args, snmp_client.profile_name).get(
+            lambda: poll_snapshot(snmp_client)
+        )
+    else:
+        snapshot = get_poll_cache(args).get(lambda: poll_snapshot(get_snmp_client(args)))
+    return {
+        **snapshot,
+        "aps": [AccessPoint.from_dict(ap) for ap in snapshot["aps"]],
+        "radios": {
+            ip: [RadioInterface.from_dict(it) for it in radio]
+            for ip, radio in snapshot["radios"].items()
+        },
+    }
+
+
+def get_thresholds(args):
+    """Get the AP metrics thresholds from command arguments"""
+    thresholds = Thresholds()
+    thresholds.add("cpu", args.warning_cpu_threshold, args.critical_cpu_threshold)
+    thresholds.add("mem", args.warning_memory_threshold, args.critical_memory_threshold)
+    for rule in args.threshold or []:
+        thresholds.add(*rule)
+    return thresholds
+
+
+def init_stats(args):
+    """Init the SNMP requests statistics of the SNMP clients of a check (if enabled)"""
+    args.snmp_stats = SNMPStats() if args.stats or args.stats_file else None
+    return args.snmp_stats
+
+
+def get_snmp_client(args, hostname=None):
     """Get a configured SNMPClient instance from command arguments"""
+    transport_kwargs = {}
+    if args.snmp_transport == "replay":
+        transport_kwargs = {
+            "replay_file": args.snmp_replay_file,
+            "latency_factor": args.snmp_replay_latency_factor,
+        }
+    elif args.snmp_transport == "easysnmp" and args.snmp_engine_cache_file:
+        transport_kwargs = {"engine_cache_file": args.snmp_engine_cache_file}
     return SNMPClient(
-        hostname=args.hostname,
+        hostname=hostname or args.hostname,
         community=args.snmp_community,
         version=args.snmp_version,
+        timeout=args.snmp_timeout,
         remote_port=args.snmp_remote_port,
         local_port=args.snmp_local_port or 0,  # An int is required and zero is the default value
         security_level=args.snmp_security_level,
@@ -155,6 +639,20 @@ def get_snmp_client(args):
         privacy_protocol=args.snmp_priv_protocol,
         privacy_password=args.snmp_priv_password,
         profile=args.snmp_profile,
+        transport=args.snmp_transport,
+        table_fetch=not args.snmp_disable_table_fetch,
+        max_repetitions=args.snmp_max_repetitions,
+        max_get_varbinds=args.snmp_max_get_varbinds,
+        max_get_pdu_size=args.snmp_max_get_pdu_size,
+        max_workers=args.snmp_max_workers,
+        ap_index_file=args.ap_index_file,
+        inventory_refresh=args.inventory_refresh,
+        inventory_file=args.inventory_file,
+        profile_file=args.profile_file,
+        record_file=args.snmp_record_file,
+        stats=getattr(args, "snmp_stats", None),
+        deadline=getattr(args, "deadline_time", None),
+        **transport_kwargs,
     )
 
 
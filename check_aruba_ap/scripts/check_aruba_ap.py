@@ -1,45 +1,250 @@
 """ Icinga plugin to check one Aruba AP state via SNMP """
 
-from easysnmp.exceptions import EasySNMPTimeoutError
+import json
+import sys
+import time
 
 from check_aruba_ap import format_ap_info, format_radio_info
-from check_aruba_ap.scripts import fatal_error, get_parser, get_snmp_client, parse_args
+from check_aruba_ap.cache import write_json_file, write_text_file
+from check_aruba_ap.counters import CounterStore, get_counter_widths
+from check_aruba_ap.poller import PollerException
+from check_aruba_ap.records import AccessPoint
+from check_aruba_ap.scripts import (
+    STATUS_LABELS,
+    add_radio_usage_options,
+    check_radio_usage,
+    fatal_error,
+    format_perf_data,
+    get_parser,
+    get_snapshot,
+    get_snmp_client,
+    get_thresholds,
+    init_stats,
+    parse_args,
+    use_snapshot,
+    worst_status,
+)
+from check_aruba_ap.snmp_client import PROFILES, SNMPClientException
+from check_aruba_ap.thresholds import METRICS
+from check_aruba_ap.transport import SNMPDeadlineError, SNMPError, SNMPTimeoutError
 
 
-def main(argv=None):
-    """Script main"""
-    parser = get_parser(description=__doc__)
+def get_ap_and_radio_status(args):
+    """
+    Get AP & its radio interfaces status (and the timestamp of this sample, if all the radio
+    interfaces were retrieved before the polling deadline and the SNMP profile name)
+    """
+    ip_address = args.ap_address or args.hostname
+    if use_snapshot(args):
+        try:
+            snapshot = get_snapshot(args)
+        except SNMPTimeoutError:
+            fatal_error("Aruba AP not reachable via SNMP")
+        except (SNMPError, SNMPClientException, PollerException) as err:
+            fatal_error(err)
+        aps = [ap for ap in snapshot["aps"] if ap.ip == ip_address]
+        if len(aps) != 1:
+            fatal_error(f"AP {ip_address} not found via SNMP")
+        if args.ap_address:
+            radio = snapshot["radios"].get(args.ap_address, [])
+        else:
+            radio = [it for ap_radio in snapshot["radios"].values() for it in ap_radio]
+        return (
+            aps[0],
+            radio,
+            snapshot["timestamp"],
+            True,
+            snapshot.get("profile", args.snmp_profile),
+        )
 
-    parser.add_argument(
-        "-A",
-        "--ap-address",
-        help=(
-            "If the SNMP host is a controler, the AP IP address have to be provided using this "
-            "parameter"
-        ),
+    try:
+        snmp_client = get_snmp_client(args)
+        ap = snmp_client.get_ap_status(ip_address=ip_address)
+    except SNMPDeadlineError as err:
+        fatal_error(err)
+    except SNMPTimeoutError:
+        fatal_error("Aruba AP not reachable via SNMP")
+    except (SNMPError, SNMPClientException) as err:
+        fatal_error(err)
+
+    radio = []
+    try:
+        for it in snmp_client.iter_radio_status(ip_address=args.ap_address):
+            radio.append(it)
+    except SNMPDeadlineError:
+        return ap, radio, time.time(), False, snmp_client.profile_name
+    except SNMPTimeoutError:
+        fatal_error("Fail to retreived radio status via SNMP")
+    except SNMPError as err:
+        fatal_error(err)
+    return ap, radio, time.time(), True, snmp_client.profile_name
+
+
+def get_batch_status(args):
+    """
+    Get the status of the APs of the batch & their radio interfaces (and the timestamp of this
+    sample, if all of them were retrieved before the polling deadline and the SNMP profile name):
+    the APs & radio tables are retrieved once for all of them
+
+    If the polling deadline is reached, the APs not retrieved have no status and the APs which
+    radio interfaces were not retrieved are missing in the radio interfaces dict.
+    """
+    complete = True
+    if use_snapshot(args):
+        try:
+            snapshot = get_snapshot(args)
+        except SNMPTimeoutError:
+            fatal_error("Aruba controller not reachable via SNMP")
+        except (SNMPError, SNMPClientException, PollerException) as err:
+            fatal_error(err)
+        aps, radios, timestamp = snapshot["aps"], snapshot["radios"], snapshot["timestamp"]
+        profile_name = snapshot.get("profile", args.snmp_profile)
+    else:
+        aps = []
+        aps_polled = False
+        radios = {}
+        try:
+            snmp_client = get_snmp_client(args)
+            profile_name = snmp_client.profile_name
+            for ap in snmp_client.iter_aps_status():
+                aps.append(ap)
+            aps_polled = True
+            for ip, radio in snmp_client.iter_radio_status_by_ap():
+                radios[ip] = radio
+        except SNMPDeadlineError:
+            complete = False
+            if not aps_polled:
+                aps += snmp_client.get_unpolled_aps()
+        except SNMPTimeoutError:
+            fatal_error("Aruba controller not reachable via SNMP")
+        except (SNMPError, SNMPClientException) as err:
+            fatal_error(err)
+        timestamp = time.time()
+
+    if args.batch == "all":
+        return aps, radios, timestamp, complete, profile_name
+    aps_by_ip = {ap.ip: ap for ap in aps}
+    return (
+        [aps_by_ip.get(ip, AccessPoint(ip=ip)) for ip in args.batch.split(",") if ip],
+        radios,
+        timestamp,
+        complete,
+        profile_name,
     )
-    parser.add_argument(
-        "-rc",
-        "--warning-radio-usage-threshold",
-        type=int,
-        help="Warning AP radio interface usage threshold (default: 80%%)",
-        default=80,
+
+
+def format_batch_result(args, ap, result):
+    """
+    Format the check result of an AP of the batch (status, output, perfdata & extra lines)
+    according to the batch output format
+    """
+    status, output, perf_data, extra_lines = result
+    try:
+        host_name = args.batch_host_name_format.format(**{"name": ap.ip, **ap.to_dict()})
+    except (KeyError, IndexError, ValueError) as err:
+        fatal_error(f"Invalid batch host name format {args.batch_host_name_format}: {err}")
+    if args.batch_format == "spool":
+        # Multi-lines plugin output have to be escaped in external commands
+        plugin_output = "\\n".join(
+            [f"{output} | {format_perf_data(perf_data)}" if perf_data else output] + extra_lines
+        )
+        return (
+            f"[{int(time.time())}] PROCESS_SERVICE_CHECK_RESULT;{host_name};"
+            f"{args.batch_service};{status};{plugin_output}"
+        )
+    return json.dumps(
+        {
+            "ap": ap.ip,
+            "name": ap.name,
+            "host_name": host_name,
+            "service": args.batch_service,
+            "status": status,
+            "output": output,
+            "perfdata": format_perf_data(perf_data),
+            "long_output": "\n".join(extra_lines),
+        }
     )
-    parser.add_argument(
-        "-rw",
-        "--critical-radio-usage-threshold",
-        type=int,
-        help="Critical AP radio interface usage threshold (default: 95%%)",
-        default=95,
+
+
+def check_batch(args, aps, radios, timestamp, complete=True, profile_name=None):
+    """
+    Check the APs of the batch, write their check results & print the batch summary (APs or radio
+    interfaces not retrieved before the polling deadline are reported as unknown)
+    """
+    results = []
+    counts = dict.fromkeys(STATUS_LABELS, 0)
+    thresholds = get_thresholds(args)
+    for ap in aps:
+        if ap.status is None and not complete:
+            result = (3, f"AP {ap.ip or ap.name} not polled before the polling deadline", {}, [])
+        elif ap.status is None:
+            result = (3, f"AP {ap.ip} not found via SNMP", {}, [])
+        elif not complete and ap.ip not in radios:
+            result = (
+                3,
+                f"AP {ap.name} radio interfaces not polled before the polling deadline",
+                {},
+                [],
+            )
+        else:
+            radio = radios.get(ap.ip, [])
+            rates = get_rates(args, ap, radio, timestamp, profile_name)
+            result = check_ap(args, ap, radio, rates, thresholds)
+        counts[result[0]] += 1
+        results.append(format_batch_result(args, ap, result))
+
+    summary = ("" if complete else "Polling deadline reached, ") + (
+        f"{len(aps)} APs checked: "
+        + ", ".join(f"{counts[status]} {label}" for status, label in STATUS_LABELS.items())
     )
+    perf_data = {label: str(counts[status]) for status, label in STATUS_LABELS.items()}
+    if args.stats:
+        perf_data.update(args.snmp_stats.perf_data())
 
-    args = parse_args(parser, argv)
-    snmp_client = get_snmp_client(args)
+    if args.batch_output != "-" and not write_text_file(
+        args.batch_output, "".join(f"{result}\n" for result in results)
+    ):
+        fatal_error(f"Fail to write batch check results in {args.batch_output}")
 
-    try:
-        ap = snmp_client.get_ap_status(ip_address=args.ap_address or args.hostname)
-    except EasySNMPTimeoutError:
-        fatal_error("Aruba AP not reachable via SNMP")
+    status = 0 if complete else 3
+    print(f"{STATUS_LABELS[status]} - {summary} | {format_perf_data(perf_data)}")
+    if args.batch_output == "-":
+        sys.stdout.write("".join(f"{result}\n" for result in results))
+    return status
+
+
+def check_rate(rate, warning, critical):
+    """Check a rate against its thresholds (return the status and the exceeded threshold)"""
+    if critical is not None and rate >= critical:
+        return 2, critical
+    if warning is not None and rate >= warning:
+        return 1, warning
+    return 0, None
+
+
+def get_rates(args, ap, radio, timestamp, profile_name=None):
+    """
+    Compute the counters rates of the AP radio interfaces (if a state directory is provided),
+    according to the counters widths declared by the SNMP profile
+    """
+    if not args.state_dir:
+        return {}
+    counter_store = CounterStore(args.state_dir, args.hostname, ap.ip)
+    rates = counter_store.compute_rates(
+        ap,
+        radio,
+        timestamp,
+        get_counter_widths(PROFILES.get(profile_name, {}).get("radio_codecs", {})),
+    )
+    counter_store.save()
+    return rates
+
+
+def check_ap(args, ap, radio, rates, thresholds=None):
+    """
+    Check one AP state (return status, message, perfdata & extra lines): thresholds are retrieved
+    from command arguments if not provided
+    """
     status = 0
     errors = []
     messages = []
@@ -47,105 +252,217 @@ def main(argv=None):
 
     perf_data = {}
 
-    if ap["status"] != "1":
+    if not ap.online:
         status = 2
-        errors.append(f"AP {ap['name']} is offline")
+        errors.append(f"AP {ap.name} is offline")
 
-    if "cpu_usage" in ap:
-        perf_data["cpu"] = ";".join(
-            [
-                f"{ap['cpu_usage']}%",
-                str(args.warning_cpu_threshold),
-                str(args.critical_cpu_threshold),
-                "0",
-                "100",
-            ]
-        )
-        if int(ap["cpu_usage"]) >= args.critical_cpu_threshold:
-            status = 2
-            errors.append(f"CPU usage >= {args.critical_cpu_threshold}%)")
-        elif int(ap["cpu_usage"]) >= args.warning_cpu_threshold:
-            status = status if status > 1 else 1
-            errors.append(f"CPU usage >= {args.warning_cpu_threshold}%)")
-
-    if "mem_usage" in ap:
-        perf_data["mem"] = ";".join(
+    if thresholds is None:
+        thresholds = get_thresholds(args)
+    for metric, (key, label, unit) in METRICS.items():
+        value = getattr(ap, key)
+        if value is None:
+            continue
+        warning, critical = thresholds.get(ap, metric)
+        perf_data[metric] = ";".join(
             [
-                f"{round(ap['mem_usage'], 1)}%",
-                str(args.warning_memory_threshold),
-                str(args.critical_memory_threshold),
+                f"{round(value, 1) if isinstance(value, float) else value}{unit}",
+                "" if warning is None else str(warning),
+                "" if critical is None else str(critical),
                 "0",
                 "100",
             ]
         )
-        if int(ap["mem_usage"]) >= args.critical_memory_threshold:
-            status = 2
-            errors.append(f"Memory usage >= {args.critical_memory_threshold}%)")
-        elif int(ap["mem_usage"]) >= args.warning_memory_threshold:
-            status = status if status > 1 else 1
-            errors.append(f"Memory usage >= {args.warning_memory_threshold}%)")
-
-    try:
-        radio = snmp_client.get_radio_status(ip_address=args.ap_address)
-    except EasySNMPTimeoutError:
-        fatal_error("Fail to retreived radio status via SNMP")
+        metric_status, threshold = thresholds.check(ap, metric)
+        if metric_status:
+            status = max(status, metric_status)
+            errors.append(f"{label[0].upper()}{label[1:]} {threshold.describe(unit)}")
 
     for it in radio:
-        if "usage" in it:
-            if int(it["usage"]) >= args.critical_radio_usage_threshold:
-                status = 2
-                errors.append(
-                    f"Interface {it['mac']} radio usage >= {args.critical_radio_usage_threshold}%)"
-                )
-            elif int(it["usage"]) >= args.warning_radio_usage_threshold:
-                status = status if status > 1 else 1
-                errors.append(
-                    f"Interface {it['mac']} radio usage >= {args.warning_radio_usage_threshold}%)"
-                )
-            perf_data[f"Interface {it['mac']} - Usage"] = ";".join(
+        if it.usage is not None:
+            usage_status, threshold = check_radio_usage(args, it)
+            if usage_status:
+                status = max(status, usage_status)
+                errors.append(f"Interface {it.mac} radio usage >= {threshold}%)")
+            perf_data[f"Interface {it.mac} - Usage"] = ";".join(
                 [
-                    f"{it['usage']}%",
+                    f"{it.usage}%",
                     str(args.warning_radio_usage_threshold),
                     str(args.critical_radio_usage_threshold),
                     "0",
                     "100",
                 ]
             )
-        if "noise" in it:
-            perf_data[f"Interface {it['mac']} - Noise"] = f"{it['noise']}dBm;;;;"
-        if "tx_total_frames" in it:
-            perf_data[f"Interface {it['mac']} - TX total frames"] = f"{it['tx_total_frames']};;;;"
-        if "tx_total_bytes" in it:
-            perf_data[f"Interface {it['mac']} - TX total bytes"] = f"{it['tx_total_bytes']};;;;"
-        if "tx_dropped_frames" in it:
-            perf_data[
-                f"Interface {it['mac']} - TX dropped frames"
-            ] = f"{it['tx_dropped_frames']};;;;"
-        if "rx_total_frames" in it:
-            perf_data[f"Interface {it['mac']} - RX total frames"] = f"{it['rx_total_frames']};;;;"
-        if "rx_total_bytes" in it:
-            perf_data[f"Interface {it['mac']} - RX total bytes"] = f"{it['rx_total_bytes']};;;;"
-        if "rx_bad_frames" in it:
-            perf_data[f"Interface {it['mac']} - RX bad frames"] = f"{it['rx_bad_frames']};;;;"
-        if "phy_events" in it:
-            perf_data[f"Interface {it['mac']} - Physical events"] = f"{it['phy_events']};;;;"
-        if "clients_count" in it:
-            perf_data[f"Interface {it['mac']} - Clients"] = f"{it['clients_count']};;;;"
-
-        extra_lines.append(f"Interface {it['mac']}:")
+        for attr, label, unit in (
+            ("noise", "Noise", "dBm"),
+            ("tx_total_frames", "TX total frames", ""),
+            ("tx_total_bytes", "TX total bytes", ""),
+            ("tx_dropped_frames", "TX dropped frames", ""),
+            ("rx_total_frames", "RX total frames", ""),
+            ("rx_total_bytes", "RX total bytes", ""),
+            ("rx_bad_frames", "RX bad frames", ""),
+            ("phy_events", "Physical events", ""),
+            ("clients_count", "Clients", ""),
+        ):
+            if getattr(it, attr) is not None:
+                perf_data[f"Interface {it.mac} - {label}"] = f"{getattr(it, attr)}{unit};;;;"
+
+        it_rates = rates.get(it.mac, {})
+        for counter, label, warning, critical in (
+            ("tx_total_frames", "TX frames rate", None, None),
+            ("tx_total_bytes", "TX bytes rate", None, None),
+            (
+                "tx_dropped_frames",
+                "TX dropped frames rate",
+                args.warning_tx_drop_rate,
+                args.critical_tx_drop_rate,
+            ),
+            ("rx_total_frames", "RX frames rate", None, None),
+            ("rx_total_bytes", "RX bytes rate", None, None),
+            (
+                "rx_bad_frames",
+                "RX bad frames rate",
+                args.warning_rx_error_rate,
+                args.critical_rx_error_rate,
+            ),
+            ("phy_events", "Physical events rate", None, None),
+        ):
+            if counter not in it_rates:
+                continue
+            perf_data[f"Interface {it.mac} - {label}"] = ";".join(
+                [
+                    f"{round(it_rates[counter], 2)}",
+                    "" if warning is None else str(warning),
+                    "" if critical is None else str(critical),
+                    "",
+                    "",
+                ]
+            )
+            rate_status, threshold = check_rate(it_rates[counter], warning, critical)
+            if rate_status:
+                status = max(status, rate_status)
+                errors.append(f"Interface {it.mac} {label} >= {threshold}/s")
+
+        extra_lines.append(f"Interface {it.mac}:")
         extra_lines += [f"  {k}: {v}" for k, v in format_radio_info(it).items()]
 
     if not errors:
-        messages.append(f"AP {ap['name']} is online and in optimal state")
+        messages.append(f"AP {ap.name} is online and in optimal state")
+
+    return status, ", ".join(errors + messages), perf_data, extra_lines
 
-    # Add quotes on perf_data labels (can't be done using f-string)
-    perf_data = {f"'{label}'": value for label, value in perf_data.items()}
 
-    status_labels = {0: "OK", 1: "WARNING", 2: "CRITICAL", 3: "UNKNOWN"}
-    print(
-        f"{status_labels[status]} - {', '.join(errors + messages)}"
-        f" | {' '.join([f'{k}={v}' for k, v in perf_data.items()])}"
+def main(argv=None):
+    """Script main"""
+    parser = get_parser(description=__doc__)
+
+    parser.add_argument(
+        "-A",
+        "--ap-address",
+        help=(
+            "If the SNMP host is a controler, the AP IP address have to be provided using this "
+            "parameter"
+        ),
+    )
+    add_radio_usage_options(parser)
+
+    rates_opts = parser.add_argument_group("Counters rates options")
+    rates_opts.add_argument(
+        "--state-dir",
+        help=(
+            "Directory path of the counters state files. If provided, previous samples of radio "
+            "interfaces counters are kept to compute and emit per-second rates"
+        ),
+    )
+    rates_opts.add_argument(
+        "--warning-tx-drop-rate",
+        type=float,
+        help="Warning AP radio interface TX dropped frames rate threshold (frames/s)",
+    )
+    rates_opts.add_argument(
+        "--critical-tx-drop-rate",
+        type=float,
+        help="Critical AP radio interface TX dropped frames rate threshold (frames/s)",
+    )
+    rates_opts.add_argument(
+        "--warning-rx-error-rate",
+        type=float,
+        help="Warning AP radio interface RX bad frames rate threshold (frames/s)",
     )
+    rates_opts.add_argument(
+        "--critical-rx-error-rate",
+        type=float,
+        help="Critical AP radio interface RX bad frames rate threshold (frames/s)",
+    )
+
+    batch_opts = parser.add_argument_group("Batch mode options")
+    batch_opts.add_argument(
+        "-B",
+        "--batch",
+        help=(
+            "Check many APs in one invocation: comma-separated list of AP IP addresses or 'all' "
+            "to check all the APs of the controler. The APs & radio tables are retrieved once and "
+            "one check result by AP is written (see --batch-format)"
+        ),
+    )
+    batch_opts.add_argument(
+        "--batch-format",
+        choices=("jsonl", "spool"),
+        help=(
+            "Batch mode check results format: one JSON object by line (jsonl) or one Icinga "
+            "PROCESS_SERVICE_CHECK_RESULT external command by line (spool), to submit them as "
+            "passive check results (default: jsonl)"
+        ),
+        default="jsonl",
+    )
+    batch_opts.add_argument(
+        "--batch-output",
+        help=(
+            "Batch mode check results file path, atomically written (default: '-', check results "
+            "are printed after the batch summary line)"
+        ),
+        default="-",
+    )
+    batch_opts.add_argument(
+        "--batch-service",
+        help="Batch mode check results service name (default: aruba_ap)",
+        default="aruba_ap",
+    )
+    batch_opts.add_argument(
+        "--batch-host-name-format",
+        help=(
+            "Batch mode check results host name format, using the AP info as fields (for "
+            "instance: '{name}' or 'ap-{ip}', default: '{name}')"
+        ),
+        default="{name}",
+    )
+
+    args = parse_args(parser, argv)
+    if args.batch and args.ap_address:
+        parser.error("-A/--ap-address and -B/--batch parameters are mutually exclusive")
+    stats = init_stats(args)
+    try:
+        if args.batch:
+            return check_batch(args, *get_batch_status(args))
+        ap, radio, timestamp, complete, profile_name = get_ap_and_radio_status(args)
+    finally:
+        if args.stats_file:
+            write_json_file(args.stats_file, stats.to_dict())
+
+    status, message, perf_data, extra_lines = check_ap(
+        args, ap, radio, get_rates(args, ap, radio, timestamp, profile_name)
+    )
+
+    if not complete:
+        status = worst_status((status, 3))
+        message = (
+            f"Polling deadline reached before retrieving all radio interfaces "
+            f"({len(radio)} retrieved), {message}"
+        )
+
+    if args.stats:
+        perf_data.update(stats.perf_data())
+
+    print(f"{STATUS_LABELS[status]} - {message} | {format_perf_data(perf_data)}")
     print("\n".join(extra_lines))
 
     return status
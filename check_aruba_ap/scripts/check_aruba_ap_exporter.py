@@ -0,0 +1,81 @@
+""" OpenMetrics/Prometheus exporter of Aruba APs & radio interfaces metrics polled via SNMP """
+
+import argparse
+import signal
+import sys
+
+from check_aruba_ap.exporter import ControllerExporter, ExporterServer
+from check_aruba_ap.scripts import (
+    add_logging_options,
+    add_snmp_options,
+    get_snmp_client,
+    parse_args,
+)
+
+
+def main(argv=None):
+    """Script main"""
+    parser = argparse.ArgumentParser(description=__doc__)
+
+    parser.add_argument(
+        "-H",
+        "--hostname",
+        type=str,
+        action="append",
+        help=(
+            "Aruba SNMP hostname (IP address required for the current elected virtual "
+            "controller). Could be specified multiple times to export multiple controllers, "
+            "selected using the target parameter (/metrics?target=HOSTNAME)"
+        ),
+        required=True,
+    )
+    parser.add_argument(
+        "--listen-address",
+        help="Exporter HTTP server listen address (default: 0.0.0.0)",
+        default="0.0.0.0",
+    )
+    parser.add_argument(
+        "--listen-port",
+        type=int,
+        help="Exporter HTTP server listen port (default: 9810)",
+        default=9810,
+    )
+    parser.add_argument(
+        "-i",
+        "--cache-interval",
+        type=int,
+        help=(
+            "Scrape results cache interval in seconds: scrapes received during this interval "
+            "after a poll share its results (default: 30)"
+        ),
+        default=30,
+    )
+
+    add_snmp_options(parser)
+    add_logging_options(parser)
+
+    args = parse_args(parser, argv)
+
+    server = ExporterServer(
+        (args.listen_address, args.listen_port),
+        [
+            ControllerExporter(
+                hostname,
+                lambda hostname: get_snmp_client(args, hostname=hostname),
+                interval=args.cache_interval,
+            )
+            for hostname in args.hostname
+        ],
+    )
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+    return 0
+
+
+# vim: tabstop=4 shiftwidth=4 softtabstop=4 expandtab
@@ -0,0 +1,87 @@
+""" Poller daemon polling Aruba APs state via SNMP and serving it to check plugins """
+
+import argparse
+import signal
+import sys
+
+from check_aruba_ap.poller import ControllerPoller, PollerServer
+from check_aruba_ap.scripts import (
+    add_logging_options,
+    add_snmp_options,
+    get_hosts_args,
+    get_snmp_client,
+    parse_args,
+    poll_snapshot,
+)
+
+
+def main(argv=None):
+    """Script main"""
+    parser = argparse.ArgumentParser(description=__doc__)
+
+    parser.add_argument(
+        "-H",
+        "--hostname",
+        type=str,
+        action="append",
+        help=(
+            "Aruba SNMP hostname (IP address required for the current elected virtual "
+            "controller). Could be specified multiple times to poll multiple controllers"
+        ),
+    )
+    parser.add_argument(
+        "--config",
+        help=(
+            "Configuration file path (INI format) defining the SNMP hosts to poll: one section "
+            "by host, named with its hostname (or specifying it using the hostname key), with "
+            "SNMP parameters long names as keys (for instance, snmp_profile or snmp_community). "
+            "The DEFAULT section could be used to specify parameters of all hosts"
+        ),
+    )
+    parser.add_argument(
+        "-S",
+        "--socket",
+        help="Poller UNIX socket path (default: /run/check_aruba_ap_poller.sock)",
+        default="/run/check_aruba_ap_poller.sock",
+    )
+    parser.add_argument(
+        "-i",
+        "--interval",
+        type=int,
+        help="Poll interval in seconds (default: 60)",
+        default=60,
+    )
+
+    add_snmp_options(parser)
+    add_logging_options(parser)
+
+    args = parse_args(parser, argv)
+    hosts_args = get_hosts_args(parser, args)
+    if not hosts_args:
+        parser.error("No controller to poll (use -H/--hostname or --config parameters)")
+
+    server = PollerServer(
+        args.socket,
+        [
+            # Each SNMP host is polled with its own parameters (from its configuration section)
+            ControllerPoller(
+                host_args.hostname,
+                lambda hostname, host_args=host_args: get_snmp_client(host_args, hostname=hostname),
+                poll_snapshot,
+                interval=host_args.interval,
+            )
+            for host_args in hosts_args
+        ],
+    )
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+    return 0
+
+
+# vim: tabstop=4 shiftwidth=4 softtabstop=4 expandtab
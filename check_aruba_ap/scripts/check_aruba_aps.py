@@ -1,109 +1,359 @@
 """ Icinga plugin to check all Aruba APs state via SNMP on the controller """
 
-from easysnmp.exceptions import EasySNMPTimeoutError
+import logging
+from concurrent.futures import ThreadPoolExecutor
 
-from check_aruba_ap import format_ap_status
-from check_aruba_ap.scripts import fatal_error, get_parser, get_snmp_client, parse_args
+from check_aruba_ap import format_ap_status, format_radio_info
+from check_aruba_ap.aggregates import FleetAggregates
+from check_aruba_ap.cache import write_json_file
+from check_aruba_ap.poller import PollerException
+from check_aruba_ap.scripts import (
+    STATUS_LABELS,
+    DetailItems,
+    add_radio_usage_options,
+    check_radio_usage,
+    fatal_error,
+    format_perf_data,
+    get_hosts_args,
+    get_parser,
+    get_snapshot,
+    get_snmp_client,
+    get_thresholds,
+    init_stats,
+    parse_args,
+    use_snapshot,
+    worst_status,
+)
+from check_aruba_ap.snmp_client import SNMPClientException
+from check_aruba_ap.thresholds import METRICS
+from check_aruba_ap.transport import SNMPDeadlineError, SNMPError, SNMPTimeoutError
 
+log = logging.getLogger(__name__)
 
-def main(argv=None):
-    """Script main"""
-    parser = get_parser(description=__doc__)
-    args = parse_args(parser, argv)
-    snmp_client = get_snmp_client(args)
 
+def ap_sort_key(ap):
+    """Sort key of APs in the check long output"""
+    return ap.name or ""
+
+
+def radio_sort_key(radio):
+    """Sort key of radio interfaces (AP name & radio interface tuples), most used first"""
+    ap_name, it = radio
+    return (-(it.usage or 0), ap_name or "", it.mac or "")
+
+
+def iter_radios(snmp_client, snapshot, ap_names):
+    """
+    Iterate on the radio interfaces of all APs (yield AP name & radio interface tuples): the whole
+    radio table is streamed using one set of column walks
+    """
+    if snapshot is not None:
+        radios_by_ap = snapshot["radios"].items()
+    else:
+        radios_by_ap = snmp_client.iter_radio_status_by_ap()
+    for ip, radio in radios_by_ap:
+        for it in radio:
+            yield ap_names.get(ip) or ip, it
+
+
+class RadioUsageCheck:
+    """
+    Radio interfaces usage check of all APs
+
+    Radio interfaces are checked as soon as they are retrieved: only the most used alerting ones
+    are kept (up to max_items by status, if set).
+    """
+
+    def __init__(self, args, max_items=0):
+        self.args = args
+        self.count = 0
+        self.most_used = None
+        # Radio interfaces exceeding the radio usage thresholds by status
+        self.alerts = {status: DetailItems(max_items, key=radio_sort_key) for status in (2, 1)}
+
+    def add(self, ap_name, it):
+        """Check a radio interface"""
+        self.count += 1
+        if it.usage is None:
+            return
+        if self.most_used is None or radio_sort_key((ap_name, it)) < radio_sort_key(self.most_used):
+            self.most_used = (ap_name, it)
+        status, _ = check_radio_usage(self.args, it)
+        if status:
+            self.alerts[status].add((ap_name, it))
+
+    def iter_errors(self):
+        """Iterate on the status & message of each alert"""
+        for status, radios in self.alerts.items():
+            if radios:
+                yield status, (
+                    f"{len(radios)} radio interfaces with {STATUS_LABELS[status].lower()} radio "
+                    f"usage (>={self.threshold(status)}%)"
+                )
+
+    def threshold(self, status):
+        """Get the radio usage threshold of a status"""
+        if status == 2:
+            return self.args.critical_radio_usage_threshold
+        return self.args.warning_radio_usage_threshold
+
+    def iter_lines(self):
+        """Iterate on the long output lines"""
+        for status, radios in self.alerts.items():
+            if not radios:
+                continue
+            yield f"Radio interfaces with {STATUS_LABELS[status].lower()} radio usage:"
+            for ap_name, it in radios.items:
+                yield f"- {format_radio_status(ap_name, it)}"
+            if radios.more:
+                yield f"- ... and {radios.more} more radio interfaces"
+        if self.most_used is not None and not any(self.alerts.values()):
+            yield f"Most used radio interface: {format_radio_status(*self.most_used)}"
+
+
+def format_radio_status(ap_name, it):
+    """Format a radio interface status (with its AP name)"""
+    info = ", ".join([f"{k}: {v}" for k, v in format_radio_info(it).items()])
+    return f"{ap_name} interface {it.mac} ({info})"
+
+
+def check_controller(args):
+    """
+    Check all APs state of one controller (return status, message, perfdata & an iterator on extra
+    lines)
+
+    APs are checked as soon as they are retrieved: only the APs listed in the long output are kept
+    in memory (up to --max-detail-lines by list, if set), counts in the message stay exact. The
+    fleet aggregates perfdata are also updated on the fly (see FleetAggregates). If the polling
+    deadline is reached, the retrieved APs are checked and the other known ones are reported as not
+    polled.
+
+    With --check-radios, the radio interfaces of all APs are then checked against the radio usage
+    thresholds and the most used ones are reported.
+    """
+    init_stats(args)
+    thresholds = get_thresholds(args)
+    aps_count = 0
+    offline_aps = DetailItems(args.max_detail_lines, key=ap_sort_key)
+    online_aps = DetailItems(args.max_detail_lines, key=ap_sort_key)
+    # APs exceeding a threshold and the exceeded threshold ranges by metric & status
+    alert_aps = {
+        (metric, status): (DetailItems(args.max_detail_lines, key=ap_sort_key), set())
+        for metric in METRICS
+        for status in (2, 1)
+    }
+    radio_check = RadioUsageCheck(args, args.max_detail_lines) if args.check_radios else None
+    aggregates = FleetAggregates()
+    # AP names by IP address (to report radio interfaces)
+    ap_names = {}
+    snmp_client = None
+    snapshot = None
+    aps_polled = False
+    radios_polled = False
+    unpolled_aps = None
     try:
-        aps = snmp_client.get_aps_status()
-    except EasySNMPTimeoutError:
-        fatal_error("Aruba virtual controller not reachable via SNMP")
-
-    aps = sorted(aps, key=lambda ap: ap["name"])
-    offline_aps = [ap for ap in aps if ap["status"] != "1"]
-    critical_cpu_aps = [
-        ap
-        for ap in aps
-        if "cpu_usage" in ap and int(ap["cpu_usage"]) >= args.critical_cpu_threshold
-    ]
-    warning_cpu_aps = [
-        ap
-        for ap in aps
-        if "cpu_usage" in ap
-        and int(ap["cpu_usage"]) >= args.warning_cpu_threshold
-        and ap not in critical_cpu_aps
-    ]
-    critical_memory_aps = [
-        ap
-        for ap in aps
-        if "mem_usage" in ap and int(ap["mem_usage"]) >= args.critical_memory_threshold
-    ]
-    warning_memory_aps = [
-        ap
-        for ap in aps
-        if "mem_usage" in ap
-        and int(ap["mem_usage"]) >= args.warning_memory_threshold
-        and ap not in critical_memory_aps
-    ]
+        if use_snapshot(args):
+            snapshot = get_snapshot(args)
+            aps = snapshot["aps"]
+        else:
+            snmp_client = get_snmp_client(args)
+            aps = snmp_client.iter_aps_status()
+        for ap in aps:
+            aps_count += 1
+            aggregates.add_ap(ap)
+            if radio_check is not None:
+                ap_names[ap.ip] = ap.name
+            (online_aps if ap.online else offline_aps).add(ap)
+            for metric, (_, _, unit) in METRICS.items():
+                metric_status, threshold = thresholds.check(ap, metric)
+                if metric_status:
+                    alert_aps[(metric, metric_status)][0].add(ap)
+                    alert_aps[(metric, metric_status)][1].add(threshold.describe(unit))
+        aps_polled = True
+        if radio_check is not None:
+            for ap_name, it in iter_radios(snmp_client, snapshot, ap_names):
+                radio_check.add(ap_name, it)
+                aggregates.add_radio(it)
+            radios_polled = True
+    except SNMPDeadlineError as err:
+        if snmp_client is None:
+            return 3, str(err), {}, iter(())
+        if not aps_polled:
+            unpolled_aps = DetailItems(args.max_detail_lines, key=ap_sort_key)
+            for ap in snmp_client.get_unpolled_aps():
+                unpolled_aps.add(ap)
+    except SNMPTimeoutError:
+        return 3, "Aruba virtual controller not reachable via SNMP", {}, iter(())
+    except (SNMPError, SNMPClientException, PollerException) as err:
+        return 3, str(err), {}, iter(())
+
     status = 0
     errors = []
     messages = []
-    extra_lines = []
-    if offline_aps:
-        status = 2
-        errors.append(f"{len(offline_aps)} offline APs detected on {len(aps)} APs")
-        extra_lines.append("Offline APs:")
-        extra_lines.append("\n".join([f"- {format_ap_status(ap)}" for ap in offline_aps]))
-
-    if critical_cpu_aps:
-        status = 2
+    alerts = []
+    if unpolled_aps is not None:
+        status = 3
         errors.append(
-            f"{len(critical_cpu_aps)} APs with critical CPU usage "
-            f"(>={args.critical_cpu_threshold}%)"
+            f"Polling deadline reached after {aps_count} APs"
+            + (f" ({len(unpolled_aps)} known APs not polled)" if unpolled_aps else "")
         )
-        extra_lines.append(
-            f"APs with critical CPU usage: {', '.join([ap['name'] for ap in critical_cpu_aps])}"
-        )
-    if warning_cpu_aps:
-        status = status if status > 1 else 1
+    elif radio_check is not None and not radios_polled:
+        status = 3
         errors.append(
-            f"{len(warning_cpu_aps)} APs with warning CPU usage (>={args.warning_cpu_threshold}%)"
-        )
-        extra_lines.append(
-            f"APs with warning CPU usage: {', '.join([ap['name'] for ap in warning_cpu_aps])}"
+            "Polling deadline reached before retrieving all radio interfaces "
+            f"({radio_check.count} retrieved)"
         )
-    if critical_memory_aps:
+
+    if offline_aps:
         status = 2
+        errors.append(f"{len(offline_aps)} offline APs detected on {aps_count} APs")
+
+    for (metric, metric_status), (metric_aps, ranges) in alert_aps.items():
+        if not metric_aps:
+            continue
+        status = worst_status((status, metric_status))
+        label = f"{STATUS_LABELS[metric_status].lower()} {METRICS[metric][1]}"
         errors.append(
-            f"{len(critical_memory_aps)} APs with critical memory usage "
-            f"(>={args.critical_memory_threshold}%)"
-        )
-        extra_lines.append(
-            "APs with critical memory usage: "
-            f"{', '.join([ap['name'] for ap in critical_memory_aps])}"
-        )
-    if warning_memory_aps:
-        status = status if status > 1 else 1
-        errors.append(
-            f"{len(warning_memory_aps)} APs with warning memory usage "
-            f"(>={args.warning_memory_threshold}%)"
-        )
-        extra_lines.append(
-            "APs with warning memory usage: "
-            f"{', '.join([ap['name'] for ap in warning_memory_aps])}"
+            f"{len(metric_aps)} APs with {label}"
+            + (f" ({next(iter(ranges))})" if len(ranges) == 1 else "")
         )
+        alerts.append((label, metric_aps))
+
+    if radio_check is not None:
+        for radio_status, error in radio_check.iter_errors():
+            status = worst_status((status, radio_status))
+            errors.append(error)
 
     if not errors:
-        messages.append(f"All {len(aps)} APs are online and in optimal state")
+        messages.append(
+            f"All {aps_count} APs"
+            + (f" and {radio_check.count} radio interfaces" if radio_check is not None else "")
+            + " are online and in optimal state"
+        )
+
+    return (
+        status,
+        ", ".join(errors + messages),
+        aggregates.perf_data(),
+        iter_extra_lines(offline_aps, alerts, online_aps, unpolled_aps, radio_check),
+    )
 
+
+def safe_check_controller(args):
+    """
+    Check all APs state of one controller (see check_controller()): unexpected errors are reported
+    as an UNKNOWN status of this controller, so the other controllers are still checked
+    """
+    try:
+        return check_controller(args)
+    except Exception as err:  # pylint: disable=broad-except
+        log.exception("%s: unexpected error checking the controller", args.hostname)
+        return 3, f"Unexpected error: {err}", {}, iter(())
+
+
+def iter_aps_lines(aps):
+    """Iterate on the long output lines listing APs"""
+    for ap in aps.items:
+        yield f"- {format_ap_status(ap)}"
+    if aps.more:
+        yield f"- ... and {aps.more} more APs"
+
+
+def iter_extra_lines(offline_aps, alerts, online_aps, unpolled_aps=None, radio_check=None):
+    """Iterate on the long output lines of a controller check"""
+    if unpolled_aps:
+        yield "APs not polled before the deadline:"
+        yield from iter_aps_lines(unpolled_aps)
     if offline_aps:
-        extra_lines.append("Online APs:")
-    extra_lines.append(
-        "\n".join([f"- {format_ap_status(ap)}" for ap in aps if ap not in offline_aps])
+        yield "Offline APs:"
+        yield from iter_aps_lines(offline_aps)
+    for label, metric_aps in alerts:
+        yield f"APs with {label}: {', '.join([ap.name for ap in metric_aps.items])}" + (
+            f" (and {metric_aps.more} more)" if metric_aps.more else ""
+        )
+    if radio_check is not None:
+        yield from radio_check.iter_lines()
+    if offline_aps or unpolled_aps:
+        yield "Online APs:"
+    yield from iter_aps_lines(online_aps)
+
+
+def main(argv=None):
+    """Script main"""
+    parser = get_parser(description=__doc__, multiple_hostnames=True)
+    parser.add_argument(
+        "--max-workers",
+        type=int,
+        help="Maximum number of controllers checked concurrently (default: 8)",
+        default=8,
     )
+    parser.add_argument(
+        "--max-detail-lines",
+        type=int,
+        help=(
+            "Maximum number of APs (or radio interfaces) listed in each part of the long output "
+            "(offline, online & alerting ones), the others are only counted (default: 0, "
+            "unlimited)"
+        ),
+        default=0,
+    )
+
+    radio_opts = parser.add_argument_group("Radio interfaces options")
+    radio_opts.add_argument(
+        "--check-radios",
+        action="store_true",
+        help=(
+            "Also check the radio interfaces usage of all APs (the whole radio table is walked "
+            "once) and report the most used ones"
+        ),
+    )
+    add_radio_usage_options(radio_opts)
+    args = parse_args(parser, argv)
+    hosts_args = get_hosts_args(parser, args)
+    if not hosts_args:
+        fatal_error("No controller to check (use -H/--hostname or --config parameters)")
 
-    status_labels = {0: "OK", 1: "WARNING", 2: "CRITICAL", 3: "UNKNOWN"}
-    print(f"{status_labels[status]} - {', '.join(errors + messages)}")
-    print("\n".join(extra_lines))
+    with ThreadPoolExecutor(max_workers=max(1, min(args.max_workers, len(hosts_args)))) as pool:
+        results = list(pool.map(safe_check_controller, hosts_args))
 
+    if args.stats_file:
+        write_json_file(
+            args.stats_file,
+            {host_args.name: host_args.snmp_stats.to_dict() for host_args in hosts_args},
+        )
+
+    if len(results) == 1:
+        status, message, perf_data, extra_lines = results[0]
+        if args.stats:
+            perf_data.update(hosts_args[0].snmp_stats.perf_data())
+        print(
+            f"{STATUS_LABELS[status]} - {message}"
+            + (f" | {format_perf_data(perf_data)}" if perf_data else "")
+        )
+        for line in extra_lines:
+            print(line)
+        return status
+
+    status = worst_status(result[0] for result in results)
+    perf_data = {}
+    for host_args, (_, _, host_perf_data, _) in zip(hosts_args, results):
+        perf_data.update(
+            {f"{host_args.name} - {label}": value for label, value in host_perf_data.items()}
+        )
+        if args.stats:
+            perf_data.update(host_args.snmp_stats.perf_data(prefix=f"{host_args.name} - "))
+    print(
+        f"{STATUS_LABELS[status]} - "
+        + ", ".join(
+            f"{host_args.name}: {message}"
+            for host_args, (_, message, _, _) in zip(hosts_args, results)
+        )
+        + (f" | {format_perf_data(perf_data)}" if perf_data else "")
+    )
+    for host_args, (host_status, message, _, extra_lines) in zip(hosts_args, results):
+        print(f"[{host_args.name}] {STATUS_LABELS[host_status]} - {message}")
+        for line in extra_lines:
+            print(f"  {line}")
     return status
 
 
@@ -0,0 +1,156 @@
+""" SNMP session record files (requests & answers with their latency) """
+
+import atexit
+import collections
+import functools
+import gzip
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+# Record file format name & version (first line of the files)
+RECORD_FORMAT = "check_aruba_ap-snmp-session"
+RECORD_VERSION = 1
+
+
+class SessionFileError(Exception):
+    """Invalid SNMP session record file"""
+
+
+class SessionRecorder:
+    """
+    SNMP session recorder
+
+    Requests of the transports using it (with their SNMP host, type, OIDs & GETBULK
+    max-repetitions) are recorded with their answer items or error and their latency. The record
+    file is written on exit: one JSON array by request after a header line, gzip compressed.
+    """
+
+    _instances = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, path):
+        self.path = path
+        self.exchanges = []
+        self._lock = threading.Lock()
+
+    @classmethod
+    def get_instance(cls, path):
+        """Get the recorder of a record file (shared by all the SNMP clients of the process)"""
+        with cls._instances_lock:
+            if path not in cls._instances:
+                cls._instances[path] = cls(path)
+                atexit.register(cls._instances[path].save)
+            return cls._instances[path]
+
+    def record(
+        self, hostname, request_type, oids, max_repetitions, latency, items=None, error=None
+    ):
+        """Record a request with its answer items (or its error)"""
+        exchange = [
+            hostname,
+            request_type,
+            [oids] if isinstance(oids, str) else list(oids),
+            max_repetitions,
+            round(latency, 6),
+        ]
+        if error is None:
+            exchange.append(
+                [[item.oid, item.oid_index, item.value, item.snmp_type] for item in items]
+            )
+        else:
+            exchange += [None, type(error).__name__, str(error)]
+        with self._lock:
+            self.exchanges.append(exchange)
+
+    def save(self):
+        """Write the record file (return True on success, False otherwise)"""
+        with self._lock:
+            exchanges = list(self.exchanges)
+        try:
+            with tempfile.NamedTemporaryFile(
+                dir=os.path.dirname(os.path.abspath(self.path)), delete=False
+            ) as fd:
+                with gzip.GzipFile(fileobj=fd, mode="wb") as gz_fd:
+                    header = {
+                        "format": RECORD_FORMAT,
+                        "version": RECORD_VERSION,
+                        "timestamp": time.time(),
+                    }
+                    gz_fd.write(json.dumps(header).encode("utf-8") + b"\n")
+                    for exchange in exchanges:
+                        gz_fd.write(json.dumps(exchange, separators=(",", ":")).encode("utf-8"))
+                        gz_fd.write(b"\n")
+            os.replace(fd.name, self.path)
+        except OSError as err:
+            log.warning("Fail to write SNMP session record file %s: %s", self.path, err)
+            return False
+        log.info("%d SNMP requests recorded in %s", len(exchanges), self.path)
+        return True
+
+
+@functools.lru_cache(maxsize=4)
+def _load_exchanges(path, mtime):  # pylint: disable=unused-argument
+    """Load the recorded requests of a record file (cached until the file is modified)"""
+    try:
+        with gzip.open(path, "rt", encoding="utf-8") as fd:
+            header = json.loads(fd.readline())
+            if header.get("format") != RECORD_FORMAT or header.get("version") != RECORD_VERSION:
+                raise SessionFileError(f"{path} is not a supported SNMP session record file")
+            return [json.loads(line) for line in fd]
+    except (OSError, ValueError, AttributeError) as err:
+        raise SessionFileError(f"Fail to load SNMP session record file {path}: {err}") from err
+
+
+class SessionRecord:
+    """
+    SNMP session loaded from a record file: recorded answers are popped by request (same SNMP
+    host, type, OIDs & GETBULK max-repetitions), in their record order
+    """
+
+    def __init__(self, path):
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError as err:
+            raise SessionFileError(f"Fail to load SNMP session record file {path}: {err}") from err
+        self.exchanges = collections.defaultdict(collections.deque)
+        self.hostnames = set()
+        for hostname, request_type, oids, max_repetitions, *answer in _load_exchanges(path, mtime):
+            self.hostnames.add(hostname)
+            self.exchanges[(hostname, request_type, tuple(oids), max_repetitions)].append(answer)
+        self._lock = threading.Lock()
+        log.debug("SessionRecord(%s): %d requests loaded", path, len(self.exchanges))
+
+    def _key(self, hostname, request_type, oids, max_repetitions):
+        """Get the key of the recorded answers of a request"""
+        if len(self.hostnames) == 1:
+            # Only one SNMP host recorded: replay it whatever the requested hostname
+            hostname = next(iter(self.hostnames))
+        oids = (oids,) if isinstance(oids, str) else tuple(oids)
+        return hostname, request_type, oids, max_repetitions
+
+    def recorded(self, hostname, request_type, oids, max_repetitions=0):
+        """Check if a request has recorded answers left"""
+        return bool(self.exchanges.get(self._key(hostname, request_type, oids, max_repetitions)))
+
+    def pop(self, hostname, request_type, oids, max_repetitions=0):
+        """
+        Pop the next recorded answer of a request: return its latency, its answer items (a list of
+        oid, oid_index, value & snmp_type lists, None on error) and its error type name &
+        message (None if it was successful). Return None if the request was not recorded.
+        """
+        key = self._key(hostname, request_type, oids, max_repetitions)
+        with self._lock:
+            queue = self.exchanges.get(key)
+            if not queue:
+                return None
+            latency, items, *error = queue.popleft()
+        return latency, items, error[0] if error else None, error[1] if error else None
+
+
+# vim: tabstop=4 shiftwidth=4 softtabstop=4 expandtab
@@ -1,18 +1,27 @@
 """ SNMP Client """
 
+import functools
 import logging
-import string
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
-from easysnmp import Session
-from easysnmp.exceptions import EasySNMPNoSuchNameError
+from check_aruba_ap.cache import load_json_file, write_json_file
+from check_aruba_ap.column_codecs import decode_auto, get_decoders
+from check_aruba_ap.records import AccessPoint, RadioInterface
+from check_aruba_ap.session_file import SessionRecorder
+from check_aruba_ap.stats import RequestRecorder
+from check_aruba_ap.transport import DEFAULT_TRANSPORT, SNMPError, get_transport_class, item_oid
 
 log = logging.getLogger(__name__)
 
 PROFILES = {
     "instant_node": {
+        # sysObjectID prefixes of the SNMP hosts of this profile (Aruba APs products)
+        "sys_object_ids": ("iso.3.6.1.4.1.14823.1.2",),
         "ap_oids": {
             "ip": "iso.3.6.1.4.1.14823.2.3.3.1.2.1.1.3",
             "name": "iso.3.6.1.4.1.14823.2.3.3.1.2.1.1.2",
+            "group": None,
             "serial": "iso.3.6.1.4.1.14823.2.3.3.1.2.1.1.4",
             "uptime": "iso.3.6.1.4.1.14823.2.3.3.1.2.1.1.9",
             "status": "iso.3.6.1.4.1.14823.2.3.3.1.2.1.1.11",
@@ -34,11 +43,43 @@ PROFILES = {
             "status": "iso.3.6.1.4.1.14823.2.3.3.1.2.2.1.20",
             "clients_count": "iso.3.6.1.4.1.14823.2.3.3.1.2.2.1.21",
         },
+        # Values codecs of the columns (see check_aruba_ap.column_codecs, columns without codec
+        # are decoded according to their SNMP type)
+        "ap_codecs": {
+            "ip": "ipv4",
+            "name": "text",
+            "serial": "text",
+            "uptime": "timeticks",
+            "status": "status",
+            "cpu_usage": "gauge",
+            "free_mem": "gauge",
+            "total_mem": "gauge",
+        },
+        "radio_codecs": {
+            "mac": "mac",
+            "noise": "integer",
+            "usage": "gauge",
+            "tx_total_frames": "counter32",
+            "tx_total_bytes": "counter32",
+            "tx_dropped_frames": "counter32",
+            "rx_total_frames": "counter32",
+            "rx_total_bytes": "counter32",
+            "rx_bad_frames": "counter32",
+            "phy_events": "counter32",
+            "status": "status",
+            "clients_count": "gauge",
+        },
+        # Columns that almost never change (refreshed less often than metrics ones)
+        "ap_inventory_keys": ("name", "serial", "total_mem"),
+        "radio_inventory_keys": (),
     },
     "a7010": {
+        # sysObjectID prefixes of the SNMP hosts of this profile (Aruba controllers products)
+        "sys_object_ids": ("iso.3.6.1.4.1.14823.1.1",),
         "ap_oids": {
             "ip": "iso.3.6.1.4.1.14823.2.2.1.5.2.1.4.1.2",
             "name": "iso.3.6.1.4.1.14823.2.2.1.5.2.1.4.1.3",
+            "group": "iso.3.6.1.4.1.14823.2.2.1.5.2.1.4.1.4",
             "serial": "iso.3.6.1.4.1.14823.2.2.1.5.2.1.4.1.6",
             "model": "iso.3.6.1.4.1.14823.2.2.1.5.2.1.4.1.13",
             "uptime": "iso.3.6.1.4.1.14823.2.2.1.5.2.1.4.1.12",
@@ -62,17 +103,125 @@ PROFILES = {
             "status": "iso.3.6.1.4.1.14823.2.3.3.1.2.2.1.20",
             "clients_count": "iso.3.6.1.4.1.14823.2.2.1.5.3.1.1.1.2",
         },
+        # Values codecs of the columns
+        "ap_codecs": {
+            "ip": "ipv4",
+            "name": "text",
+            "group": "text",
+            "serial": "text",
+            "model": "text",
+            "uptime": "timeticks",
+            "status": "status",
+        },
+        "radio_codecs": {
+            "mac": "mac",
+            "ssid": "text",
+            "noise": "integer",
+            "usage": "gauge",
+            "tx_total_frames": "counter32",
+            "tx_total_bytes": "counter64",
+            "rx_total_frames": "counter32",
+            "rx_total_bytes": "counter64",
+            "rx_bad_frames": "counter32",
+            "phy_events": "counter32",
+            "status": "status",
+            "clients_count": "gauge",
+        },
+        # Columns that almost never change (refreshed less often than metrics ones)
+        "ap_inventory_keys": ("name", "group", "serial", "model"),
+        "radio_inventory_keys": ("ssid",),
+        # Radio table columns located in other tables with indexes that do not line up with the
+        # AP table ones: they could not be walked and have to be retrieved row by row
+        "radio_get_keys": ("noise", "usage"),
     },
 }
 DEFAULT_PROFILE = next(iter(PROFILES))
+# Profile name requesting its detection (see detect_profile())
+AUTO_PROFILE = "auto"
+# Expected number of radio interfaces of an AP (to size the requests walking the ones of one AP)
+AP_RADIOS = 3
+SYS_OBJECT_ID_OID = "iso.3.6.1.2.1.1.2.0"
+
+
+def index_key(index):
+    """Sort key of a table index suffix (numeric order of its sub-identifiers)"""
+    return tuple(int(sub_id) for sub_id in index.strip(".").split(".") if sub_id)
 
 
 class SNMPClientException(Exception):
     """SNMP client exception"""
 
 
+def normalize_oid(oid):
+    """Normalize a numeric OID in the profiles format (iso.3.6.1...)"""
+    oid = str(oid).strip(".")
+    return f"iso{oid[1:]}" if oid.startswith("1.") else oid
+
+
+def probe_sys_object_id(transport):
+    """Detect the profile of an SNMP host from its sysObjectID (return None if unknown)"""
+    item = transport.get(SYS_OBJECT_ID_OID)
+    if item is None:
+        return None
+    sys_object_id = normalize_oid(item.value)
+    log.debug("probe_sys_object_id(): sysObjectID is %s", sys_object_id)
+    for profile_name, profile in PROFILES.items():
+        for prefix in profile.get("sys_object_ids", ()):
+            if sys_object_id == prefix or sys_object_id.startswith(f"{prefix}."):
+                return profile_name
+    return None
+
+
+def probe_key_column(transport, profile_name):
+    """
+    Detect the profile of an SNMP host by probing the AP table key column of a profile (return the
+    profile name if it exists, None otherwise)
+    """
+    key_oid = PROFILES[profile_name]["ap_oids"]["ip"]
+    item = transport.get_next(key_oid)
+    if item is not None and item_oid(item).startswith(f"{key_oid}."):
+        return profile_name
+    return None
+
+
+def detect_profile(transport_factory):
+    """
+    Detect the profile of an SNMP host: its sysObjectID and the AP table key column of each
+    profile are probed concurrently (using transports created by transport_factory) and the first
+    hit wins
+    """
+    probes = [(probe_sys_object_id, ())] + [
+        (probe_key_column, (profile_name,)) for profile_name in PROFILES
+    ]
+    transport = transport_factory()
+    pool = ThreadPoolExecutor(max_workers=len(probes), thread_name_prefix="snmp-profile-probe")
+    futures = [
+        pool.submit(probe, transport if transport.thread_safe else transport_factory(), *args)
+        for probe, args in probes
+    ]
+    errors = []
+    try:
+        for future in as_completed(futures):
+            try:
+                profile_name = future.result()
+            except SNMPError as err:
+                errors.append(err)
+                continue
+            if profile_name:
+                log.info("SNMP profile %s detected on %s", profile_name, transport.hostname)
+                return profile_name
+    finally:
+        # Do not wait for the other probes (and cancel the pending ones)
+        for future in futures:
+            future.cancel()
+        pool.shutdown(wait=False)
+    if len(errors) == len(probes):
+        raise errors[0]
+    raise SNMPClientException(f"Fail to detect the SNMP profile of {transport.hostname}")
+
+
 class SNMPClient:
-    """SNMP client (based on easysnmp session usage)"""
+    """SNMP client (based on a pluggable SNMP transport backend)"""
 
     _default = {
         "hostname": "localhost",
@@ -82,7 +231,27 @@ class SNMPClient:
         "remote_port": 161,
     }
 
-    def __init__(self, profile=None, **kwargs):
+    # Key column of each table
+    _table_keys = {"ap": "ip", "radio": "mac"}
+
+    def __init__(
+        self,
+        profile=None,
+        transport=None,
+        table_fetch=True,
+        max_repetitions=20,
+        max_get_varbinds=32,
+        max_get_pdu_size=1400,
+        ap_index_file=None,
+        inventory_refresh=10,
+        inventory_file=None,
+        stats=None,
+        max_workers=4,
+        deadline=None,
+        profile_file=None,
+        record_file=None,
+        **kwargs,
+    ):
         for key, default_value in self._default.items():
             kwargs[key] = kwargs.get(key, default_value)
         log.info(
@@ -99,105 +268,621 @@ class SNMPClient:
                 ]
             ),
         )
-        self.session = Session(**kwargs)
+        self.hostname = kwargs["hostname"]
+        self.table_fetch = table_fetch
+        try:
+            transport_class = get_transport_class(transport or DEFAULT_TRANSPORT)
+        except SNMPError as err:
+            raise SNMPClientException(str(err)) from err
+        self.profile_file = profile_file
+        # SNMP session recorder (shared by all the SNMP clients recording in the same file)
+        session_recorder = SessionRecorder.get_instance(record_file) if record_file else None
         self.profile_name = profile or DEFAULT_PROFILE
+        if self.profile_name == AUTO_PROFILE:
+            self.profile_name = self._detect_profile(
+                functools.partial(
+                    transport_class,
+                    deadline=deadline,
+                    session_recorder=session_recorder,
+                    **kwargs,
+                )
+            )
         try:
             self.profile = PROFILES[self.profile_name]
         except KeyError as err:
             raise SNMPClientException(f"Unsupported SNMP profile {self.profile_name}") from err
+        # Values decoders by column OID
+        self.decoders = {}
+        for table in self._table_keys:
+            self.decoders.update(
+                get_decoders(self.profile[f"{table}_oids"], self.profile.get(f"{table}_codecs", {}))
+            )
+        self.ap_index_file = ap_index_file
+        self.ap_indexes = self._load_ap_indexes()
+        # IP addresses of APs for which the index suffix was checked on the SNMP host
+        self._checked_ap_indexes = set()
+        self.inventory_refresh = inventory_refresh
+        self.inventory_file = inventory_file
+        self.inventory = load_json_file(self.inventory_file, {}).get(self._cache_key, {})
+        self.stats = stats
+        recorder = None
+        if self.stats is not None:
+            columns = {}
+            for table in self._table_keys:
+                for key_name, oid in self.profile[f"{table}_oids"].items():
+                    if oid is not None:
+                        columns.setdefault(oid, f"{table}.{key_name}")
+            recorder = RequestRecorder(self.stats, columns, community=kwargs["community"])
+        # Index suffixes of the APs yielded by the last iter_aps_status() call
+        self._polled_ap_indexes = set()
+        # Maximum number of concurrent requests chains (see _map_parallel())
+        self.max_workers = max_workers
+        # SNMP transport of the worker threads (if the transport is not thread safe)
+        self._local = threading.local()
+        try:
+            self._transport_factory = functools.partial(
+                transport_class,
+                max_repetitions=max_repetitions,
+                max_get_varbinds=max_get_varbinds,
+                max_get_pdu_size=max_get_pdu_size,
+                recorder=recorder,
+                deadline=deadline,
+                session_recorder=session_recorder,
+                **kwargs,
+            )
+            self._transport = self._transport_factory()
+        except SNMPError as err:
+            raise SNMPClientException(str(err)) from err
 
-    def _item_value(self, item):
-        if item.snmp_type == "OCTETSTR":
-            value = "".join(filter(lambda c: c in string.printable, item.value))
-            if value != item.value:
-                return item.value.encode("latin-1").hex()
-        return item.value
-
-    def _iter_get(self, oids, key_info, oid_suffix=None):
-        """Iteractive get all items info"""
-        key_oid = oids[key_info]
-
-        log.debug("_iter_get(%s, oid_suffix=%s): key OID=%s", key_info, oid_suffix, key_oid)
-        result = []
-        for item in self.session.walk(key_oid + (oid_suffix if oid_suffix else "")):
-            info = {key_info: self._item_value(item)}
+    def _detect_profile(self, transport_factory):
+        """
+        Detect the profile of the SNMP host (see detect_profile()): the detected profile is stored
+        by hostname in the profile file (if configured) and reused across invocations
+        """
+        profiles = load_json_file(self.profile_file, {})
+        if profiles.get(self.hostname) in PROFILES:
+            log.debug(
+                "_detect_profile(): profile %s of %s loaded from the profile file",
+                profiles[self.hostname],
+                self.hostname,
+            )
+            return profiles[self.hostname]
+        profile_name = detect_profile(transport_factory)
+        if self.profile_file:
+            profiles = load_json_file(self.profile_file, {})
+            profiles[self.hostname] = profile_name
+            write_json_file(self.profile_file, profiles)
+        return profile_name
+
+    @property
+    def transport(self):
+        """SNMP transport (of the current worker thread, see _map_parallel())"""
+        return getattr(self._local, "transport", self._transport)
+
+    def _init_worker(self):
+        """Init a worker thread (with its own SNMP transport if the transport is not thread safe)"""
+        if not self._transport.thread_safe:
+            self._local.transport = self._transport_factory()
+
+    def _map_parallel(self, func, values):
+        """
+        Call a function on each value using up to max_workers concurrent threads (return the list
+        of results, in values order)
+        """
+        values = list(values)
+        if self.max_workers <= 1 or len(values) <= 1:
+            return [func(value) for value in values]
+        with ThreadPoolExecutor(
+            max_workers=min(self.max_workers, len(values)), initializer=self._init_worker
+        ) as pool:
+            return list(pool.map(func, values))
+
+    @property
+    def _cache_key(self):
+        """Key of the data of this SNMP host & profile in the AP index and inventory files"""
+        return f"{self.hostname}:{self.profile_name}"
+
+    def _load_ap_indexes(self):
+        """Load AP IP address to index suffix map from the AP index file (if configured)"""
+        return load_json_file(self.ap_index_file, {}).get(self._cache_key, {})
+
+    def _save_ap_indexes(self):
+        """Save AP IP address to index suffix map in the AP index file (if configured)"""
+        if not self.ap_index_file:
+            return
+        data = load_json_file(self.ap_index_file, {})
+        data[self._cache_key] = self.ap_indexes
+        write_json_file(self.ap_index_file, data)
+
+    def _save_inventory(self):
+        """Save the inventory cache in the inventory file (if configured)"""
+        if not self.inventory_file:
+            return
+        data = load_json_file(self.inventory_file, {})
+        data[self._cache_key] = self.inventory
+        write_json_file(self.inventory_file, data)
+
+    def _item_value(self, item, oid):
+        """Decode a retrieved item value using the codec of its column (by column OID)"""
+        return self.decoders.get(oid, decode_auto)(item)
+
+    def _oid_index(self, item, base_oid):
+        """Retrieve the index suffix of a walked item OID (relatively to the walked base OID)"""
+        return item_oid(item).replace(base_oid, "")
+
+    def _iter_get_chunks(self, oids, key_info, oid_suffix=None, get_keys=None, stream=False):
+        """
+        Iteractive get all items info (yield chunks of items info, as dicts by index suffix)
+
+        The key column is walked first. Each other OID column is then walked once (in table fetch
+        mode) and cells are joined on their index suffix. The cells of columns listed in get_keys
+        (or of all columns if table fetch mode is disabled) are retrieved using packed GET
+        requests. All rows are yielded in one chunk.
+
+        In stream mode, the key column and the other walked columns are walked in lock-step and
+        rows are yielded by chunks as soon as all the columns walks passed their index suffix (only
+        the pending rows are kept in memory).
+
+        The rows of the sub-table of one AP (retrieved with its index suffix) are only a few: the
+        key column walk is sized to the expected number of radio interfaces and all the other
+        cells are retrieved using packed GET requests.
+        """
+        oid_suffix = oid_suffix if oid_suffix else ""
+        get_keys = (get_keys or ()) if self.table_fetch else oids.keys()
+        max_repetitions = None
+        if oid_suffix:
+            get_keys = oids.keys()
+            # One more repetition to reach the end of the walk in one request
+            max_repetitions = AP_RADIOS + 1
+        walked = {
+            key_name: oid
+            for key_name, oid in oids.items()
+            if key_name != key_info and oid is not None and key_name not in get_keys
+        }
+        log.debug(
+            "_iter_get_chunks(%s, oid_suffix=%s): key OID=%s, stream=%s",
+            key_info,
+            oid_suffix,
+            oids[key_info],
+            stream,
+        )
+        if stream:
+            chunks = self._iter_walked_rows(
+                oids[key_info], key_info, oid_suffix, walked, max_repetitions
+            )
+        else:
+            chunks = [
+                self._walk_rows(oids[key_info], key_info, oid_suffix, walked, max_repetitions)
+            ]
+
+        for rows in chunks:
+            if not rows:
+                continue
+            cells = {}
+            for key_name, oid in oids.items():
+                if key_name == key_info or oid is None or key_name not in get_keys:
+                    continue
+                for index in rows:
+                    cells.setdefault(oid + index, []).append((key_name, index))
+            for oid, item in self.transport.get_many(list(cells)):
+                for key_name, index in cells[oid]:
+                    self._set_row_value(
+                        rows, key_info, oid_suffix, key_name, index, item, oids[key_name]
+                    )
+
+            # Keep columns order of the profile in rows
+            yield {
+                index: {key_name: row[key_name] for key_name in oids if key_name in row}
+                for index, row in rows.items()
+            }
+
+    def _walk_rows(self, key_oid, key_info, oid_suffix, walked, max_repetitions=None):
+        """
+        Walk the key column (with the specified max-repetitions), then the other walked columns
+        (return rows by index suffix)
+        """
+        rows = {}
+        for item in self.transport.walk(key_oid + oid_suffix, max_repetitions):
+            index = self._oid_index(item, key_oid)
+            rows[index] = {key_info: self._item_value(item, key_oid)}
             log.debug(
                 "_iter_get(%s, oid_suffix=%s): %s=%s (OID=%s)",
                 key_info,
                 oid_suffix,
                 key_info,
-                info[key_info],
-                item.oid,
+                rows[index][key_info],
+                item_oid(item),
             )
-            for key_name, oid in oids.items():
-                if key_name == key_info or oid is None:
+
+        if not rows:
+            return {}
+
+        # Walk the columns at once to let the transport pipeline them
+        for (key_name, oid), items in zip(
+            walked.items(), self.transport.walk_many([oid + oid_suffix for oid in walked.values()])
+        ):
+            for item in items:
+                index = self._oid_index(item, oid)
+                # Ignore cells without matching row in key column
+                if index in rows:
+                    self._set_row_value(rows, key_info, oid_suffix, key_name, index, item, oid)
+        return rows
+
+    def _iter_walked_rows(self, key_oid, key_info, oid_suffix, walked, max_repetitions=None):
+        """
+        Walk the key column and the other walked columns in lock-step, with the specified
+        max-repetitions (yield chunks of complete rows by index suffix)
+        """
+        columns = {key_info: key_oid, **walked}
+        rows = {}
+        # Last walked index suffix of each column (None once its walk is over)
+        positions = dict.fromkeys(columns, ())
+        for page in self.transport.walk_rows(
+            [oid + oid_suffix for oid in columns.values()], max_repetitions
+        ):
+            for (key_name, oid), items in zip(columns.items(), page):
+                if items is None:
+                    positions[key_name] = None
                     continue
-                oid = item.oid.replace(key_oid, oid)
-                try:
-                    key_item = self.session.get(oid)
-                    info[key_name] = self._item_value(key_item)
-                except EasySNMPNoSuchNameError:
-                    pass
-                log.debug(
-                    "_iter_get(%s, oid_suffix=%s): %s=%s / %s (%s) = %s",
-                    key_info,
-                    oid_suffix,
-                    key_info,
-                    info[key_info],
-                    key_name,
-                    oid,
-                    info.get(key_name),
+                for item in items:
+                    index = self._oid_index(item, oid)
+                    rows.setdefault(index, {})[key_name] = self._item_value(item, oid)
+                    positions[key_name] = index_key(index)
+            limit = min(
+                (position for position in positions.values() if position is not None), default=None
+            )
+            complete = sorted(
+                (index for index in rows if limit is None or index_key(index) <= limit),
+                key=index_key,
+            )
+            log.debug(
+                "_iter_walked_rows(%s, oid_suffix=%s): %d complete rows, %d pending",
+                key_info,
+                oid_suffix,
+                len(complete),
+                len(rows) - len(complete),
+            )
+            # Ignore cells without matching row in key column
+            page = {}
+            for index in complete:
+                row = rows.pop(index)
+                if key_info in row:
+                    page[index] = row
+            yield page
+        if rows:
+            yield {
+                index: rows[index]
+                for index in sorted(rows, key=index_key)
+                if key_info in rows[index]
+            }
+
+    def _iter_get(self, oids, key_info, oid_suffix=None, get_keys=None):
+        """Iteractive get all items info (return a dict of items info by index suffix)"""
+        rows = {}
+        for chunk in self._iter_get_chunks(oids, key_info, oid_suffix, get_keys):
+            rows.update(chunk)
+        return rows
+
+    def _iter_table_chunks(self, table, oid_suffix=None, stream=False, save_inventory=True):
+        """
+        Iteractive get all items info of a table ("ap" or "radio", yield chunks of items info, as
+        dicts by index suffix, see _iter_get_chunks())
+
+        Inventory columns of the table (listed in the profile) are only retrieved every N polls,
+        when the row uptime goes backwards or when a new index suffix appears. Otherwise, their
+        values are retrieved from the inventory cache.
+        """
+        oids = self.profile[f"{table}_oids"]
+        key_info = self._table_keys[table]
+        get_keys = self.profile.get(f"{table}_get_keys")
+        inventory_keys = [
+            key_name
+            for key_name in self.profile.get(f"{table}_inventory_keys", ())
+            if oids.get(key_name) is not None
+        ]
+        if not self.inventory_refresh or not inventory_keys:
+            yield from self._iter_get_chunks(oids, key_info, oid_suffix, get_keys, stream)
+            return
+
+        inventory = self.inventory.setdefault(
+            f"{table}{oid_suffix or ''}", {"polls": 0, "rows": {}}
+        )
+        refresh = inventory["polls"] % self.inventory_refresh == 0
+        if refresh:
+            log.debug("_iter_table_chunks(%s, %s): refresh inventory", table, oid_suffix)
+        inventory_rows = {}
+        for rows in self._iter_get_chunks(
+            oids
+            if refresh
+            else {
+                key_name: oid for key_name, oid in oids.items() if key_name not in inventory_keys
+            },
+            key_info,
+            oid_suffix,
+            get_keys,
+            stream,
+        ):
+            if not refresh:
+                rows = self._fill_inventory(
+                    table, oid_suffix, rows, inventory["rows"], inventory_keys
                 )
+            for index, row in rows.items():
+                inventory_rows[index] = {
+                    key_name: row[key_name] for key_name in inventory_keys if key_name in row
+                }
+                if row.get("uptime") is not None:
+                    inventory_rows[index]["uptime"] = row["uptime"]
+            yield rows
 
-            result.append(info)
+        inventory["polls"] += 1
+        inventory["rows"] = inventory_rows
+        if save_inventory:
+            self._save_inventory()
 
-        return result
+    def _fill_inventory(self, table, oid_suffix, rows, known_rows, inventory_keys):
+        """
+        Fill the inventory columns of table rows from the inventory cache (or retrieve them if the
+        row is unknown or its uptime goes backwards)
+        """
+        oids = self.profile[f"{table}_oids"]
+        cells = {}
+        for index, row in rows.items():
+            known = known_rows.get(index)
+            if known is not None and (row.get("uptime") or 0) >= known.get("uptime", 0):
+                row.update(
+                    {key_name: known[key_name] for key_name in inventory_keys if key_name in known}
+                )
+                continue
+            log.debug("_fill_inventory(%s, %s): refresh %s inventory", table, oid_suffix, index)
+            for key_name in inventory_keys:
+                cells.setdefault(oids[key_name] + index, []).append((key_name, index))
+        for oid, item in self.transport.get_many(list(cells)):
+            for key_name, index in cells[oid]:
+                rows[index][key_name] = self._item_value(item, oids[key_name])
+        return {
+            index: {key_name: row[key_name] for key_name in oids if key_name in row}
+            for index, row in rows.items()
+        }
+
+    def _iter_get_table(self, table, oid_suffix=None, save_inventory=True):
+        """
+        Iteractive get all items info of a table ("ap" or "radio", return a dict of items info by
+        index suffix)
+        """
+        rows = {}
+        for chunk in self._iter_table_chunks(table, oid_suffix, save_inventory=save_inventory):
+            rows.update(chunk)
+        return rows
+
+    def _set_row_value(self, rows, key_info, oid_suffix, key_name, index, item, oid):
+        """Set a table row value from a retrieved item (of the column OID)"""
+        rows[index][key_name] = self._item_value(item, oid)
+        log.debug(
+            "_iter_get(%s, oid_suffix=%s): %s=%s / %s (%s) = %s",
+            key_info,
+            oid_suffix,
+            key_info,
+            rows[index][key_info],
+            key_name,
+            item_oid(item),
+            rows[index][key_name],
+        )
 
     def _iter_key_oid(self, key_oid):
         """Iteractive get key info"""
         result = {}
-        for item in self.session.walk(key_oid):
-            result[item.oid.replace(key_oid, "")] = self._item_value(item)
+        for item in self.transport.walk(key_oid):
+            result[self._oid_index(item, key_oid)] = self._item_value(item, key_oid)
         return result
 
+    @staticmethod
+    def _ap_status(ap):
+        """Build an AP record from a table row"""
+        return AccessPoint(**ap)
+
+    @staticmethod
+    def _radio_status(it):
+        """Build a radio interface record from a table row"""
+        return RadioInterface(**it)
+
+    def _refresh_ap_indexes(self):
+        """Refresh the AP IP address to index suffix map by walking the AP IP address column"""
+        self.ap_indexes = {
+            ip: oid_suffix
+            for oid_suffix, ip in self._iter_key_oid(self.profile["ap_oids"]["ip"]).items()
+        }
+        self._checked_ap_indexes = set(self.ap_indexes)
+        log.debug("_refresh_ap_indexes(): %d AP indexes retrieved", len(self.ap_indexes))
+        self._save_ap_indexes()
+
+    def _get_ap_index(self, ip_address, check=True):
+        """
+        Resolve the index suffix of an AP from its IP address (None if not found)
+
+        If check is True, an already known index suffix not checked yet on the SNMP host is
+        checked using a GET request on the AP IP address column.
+        """
+        oid_suffix = self.ap_indexes.get(ip_address)
+        if check and oid_suffix is not None and ip_address not in self._checked_ap_indexes:
+            # Check that the known index suffix still match with this AP
+            ip_oid = self.profile["ap_oids"]["ip"] + oid_suffix
+            cells = dict(self.transport.get_many([ip_oid]))
+            if (
+                ip_oid in cells
+                and self._item_value(cells[ip_oid], self.profile["ap_oids"]["ip"]) == ip_address
+            ):
+                self._checked_ap_indexes.add(ip_address)
+            else:
+                oid_suffix = None
+        if oid_suffix is None:
+            self._refresh_ap_indexes()
+            oid_suffix = self.ap_indexes.get(ip_address)
+        log.debug("_get_ap_index(%s): OID suffix = %s", ip_address, oid_suffix)
+        return oid_suffix
+
+    def _get_row(self, oids, oid_suffix):
+        """Get one table row info by its index suffix"""
+        cells = {}
+        for key_name, oid in oids.items():
+            if oid is not None:
+                cells.setdefault(oid + oid_suffix, []).append(key_name)
+        row = {}
+        for oid, item in self.transport.get_many(list(cells)):
+            for key_name in cells[oid]:
+                row[key_name] = self._item_value(item, oids[key_name])
+        log.debug("_get_row(%s): %s", oid_suffix, row)
+        return {key_name: row[key_name] for key_name in oids if key_name in row}
+
     def get_aps_status(self):
         """Get all APs status"""
+        return [self._ap_status(ap) for ap in self._iter_get_table("ap").values()]
+
+    def iter_aps_status(self):
+        """
+        Iterate on all APs status (APs are yielded as soon as their table row is retrieved, without
+        keeping the whole table in memory)
+
+        If the polling deadline is reached, SNMPDeadlineError is raised: the APs not yielded could
+        then be retrieved using get_unpolled_aps().
+        """
+        self._polled_ap_indexes = set()
+        for rows in self._iter_table_chunks("ap", stream=True):
+            for index, ap in rows.items():
+                self._polled_ap_indexes.add(index)
+                yield self._ap_status(ap)
+
+    def get_unpolled_aps(self):
+        """
+        Get the APs not yielded by the last iter_aps_status() call, as known from the AP index &
+        inventory caches (only their IP address and inventory info are set)
+        """
+        ips = {oid_suffix: ip for ip, oid_suffix in self.ap_indexes.items()}
+        inventory = self.inventory.get("ap", {}).get("rows", {})
+        inventory_keys = self.profile.get("ap_inventory_keys", ())
         return [
-            ap
-            | {
-                "mem_usage": int(ap["free_mem"]) * 100 / int(ap["total_mem"])
-                if ap.get("free_mem") is not None and ap["total_mem"] is not None
-                else 0
-            }
-            for ap in self._iter_get(self.profile["ap_oids"], "ip")
+            AccessPoint(
+                ip=ips.get(index),
+                **{
+                    key_name: value
+                    for key_name, value in inventory.get(index, {}).items()
+                    if key_name in inventory_keys
+                },
+            )
+            for index in sorted(set(ips) | set(inventory), key=index_key)
+            if index not in self._polled_ap_indexes
         ]
 
-    def get_radio_status(self, ip_address=None):
-        """Get all radio interfaces status"""
-        radio = {} if ip_address else []
-        for oid_suffix, ip in self._iter_key_oid(self.profile["ap_oids"]["ip"]).items():
-            if ip_address and ip_address != ip:
+    def _get_ap_radio_status(self, oid_suffix, save_inventory=True):
+        """Get radio interfaces status of one AP by its index suffix"""
+        log.debug("_get_ap_radio_status(%s)", oid_suffix)
+        return [
+            self._radio_status(it)
+            for it in self._iter_get_table(
+                "radio", oid_suffix=oid_suffix, save_inventory=save_inventory
+            ).values()
+        ]
+
+    def get_radio_status_by_ap(self):
+        """
+        Get all radio interfaces status by AP IP address
+
+        The whole radio table is retrieved at once (one walk by column) and its rows are
+        dispatched to the APs on their index suffix (the AP index suffix followed by the radio
+        number).
+        """
+        ap_ips = self._iter_key_oid(self.profile["ap_oids"]["ip"])
+        radio = {ip: [] for ip in ap_ips.values()}
+        for index, it in self._iter_get_table("radio").items():
+            ip = ap_ips.get(index.rsplit(".", 1)[0])
+            if ip is None:
+                log.debug("get_radio_status_by_ap(): no AP found for radio %s, ignore it", index)
                 continue
-            log.debug("get_radio_status(%s): IP %s OID suffix = %s", ip_address, ip, oid_suffix)
-            if ip_address:
-                radio[ip] = []
-            for it in self._iter_get(self.profile["radio_oids"], "mac", oid_suffix=oid_suffix):
-                it["mac"] = ":".join([it["mac"][i : i + 2] for i in range(0, len(it["mac"]), 2)])
-                if ip_address:
-                    radio[ip].append(it)
-                else:
-                    radio.append(it)
-
-        return radio.get(ip_address, []) if ip_address else radio  # pylint: disable=no-member
+            radio[ip].append(self._radio_status(it))
+        return radio
+
+    def iter_radio_status_by_ap(self):
+        """
+        Iterate on all radio interfaces status grouped by AP (yield AP IP address & radio
+        interfaces list tuples): the whole radio table is streamed and the radio interfaces of an
+        AP are yielded once all of them are retrieved (APs without radio interface are skipped)
+        """
+        ap_ips = self._iter_key_oid(self.profile["ap_oids"]["ip"])
+        # AP IP address & radio interfaces of the current AP
+        current_ip, radios = None, []
+        for rows in self._iter_table_chunks("radio", stream=True):
+            for index, it in rows.items():
+                ip = ap_ips.get(index.rsplit(".", 1)[0])
+                if ip is None:
+                    log.debug(
+                        "iter_radio_status_by_ap(): no AP found for radio %s, ignore it", index
+                    )
+                    continue
+                if radios and current_ip != ip:
+                    yield current_ip, radios
+                    radios = []
+                current_ip = ip
+                radios.append(self._radio_status(it))
+        if radios:
+            yield current_ip, radios
+
+    def get_radio_status(self, ip_address=None):
+        """
+        Get all radio interfaces status (or the ones of one AP): the radio tables of the APs are
+        fetched by up to max_workers concurrent threads and merged in AP order
+        """
+        if ip_address:
+            oid_suffix = self._get_ap_index(ip_address)
+            return self._get_ap_radio_status(oid_suffix) if oid_suffix is not None else []
+        # Fetch the radio interfaces of the APs concurrently (the inventory cache is saved once)
+        radios = self._map_parallel(
+            functools.partial(self._get_ap_radio_status, save_inventory=False),
+            self._iter_key_oid(self.profile["ap_oids"]["ip"]),
+        )
+        self._save_inventory()
+        return [it for radio in radios for it in radio]
+
+    def iter_radio_status(self, ip_address=None):
+        """
+        Iterate on all radio interfaces status (or on the ones of one AP): radio interfaces are
+        yielded as soon as their table row is retrieved, without keeping the whole table in memory
+        """
+        if ip_address:
+            oid_suffix = self._get_ap_index(ip_address)
+            if oid_suffix is None:
+                return
+            chunks = self._iter_table_chunks("radio", oid_suffix=oid_suffix, stream=True)
+        else:
+            chunks = self._iter_table_chunks("radio", stream=True)
+        for rows in chunks:
+            for it in rows.values():
+                yield self._radio_status(it)
 
     def get_ap_status(self, ip_address=None):
         """Get one AP status"""
-        aps = [ap for ap in self.get_aps_status() if ip_address is None or ip_address == ap["ip"]]
-        log.debug("get_ap_status(%s): APs found: %s", ip_address, aps)
-        assert (
-            len(aps) == 1
-        ), f"More than one AP IP address retreived via SNMP (OID: {self.profile['ap_oids']['ip']})"
-        return aps[0]
+        if ip_address is None:
+            aps = self.get_aps_status()
+            log.debug("get_ap_status(%s): APs found: %s", ip_address, aps)
+            if len(aps) != 1:
+                raise SNMPClientException(
+                    f"{len(aps)} APs retrieved via SNMP, AP IP address is required"
+                )
+            return aps[0]
+
+        # Do not check index suffix here: it's done by retrieving the AP IP address in its row
+        oid_suffix = self._get_ap_index(ip_address, check=False)
+        ap = self._get_row(self.profile["ap_oids"], oid_suffix) if oid_suffix else {}
+        if oid_suffix and ap.get("ip") != ip_address:
+            # The AP index suffix changed in the meantime: refresh them and retry
+            self._refresh_ap_indexes()
+            oid_suffix = self.ap_indexes.get(ip_address)
+            ap = self._get_row(self.profile["ap_oids"], oid_suffix) if oid_suffix else {}
+        log.debug("get_ap_status(%s): AP found: %s", ip_address, ap)
+        if ap.get("ip") != ip_address:
+            raise SNMPClientException(
+                f"AP {ip_address} not found via SNMP (OID: {self.profile['ap_oids']['ip']})"
+            )
+        self._checked_ap_indexes.add(ip_address)
+        return self._ap_status(ap)
 
 
 # vim: tabstop=4 shiftwidth=4 softtabstop=4 expandtab
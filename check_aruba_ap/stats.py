@@ -0,0 +1,232 @@
+""" SNMP wire instrumentation """
+
+import collections
+import contextlib
+import logging
+import threading
+import time
+
+from check_aruba_ap.transport import SNMPError, SNMPTimeoutError, estimate_varbind_size, item_oid
+
+log = logging.getLogger(__name__)
+
+# Upper bounds (in seconds) of the requests latency histograms buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# Estimated size (in bytes) of an SNMP message without its varbinds (and community)
+MESSAGE_OVERHEAD = 30
+
+# Perfdata labels of the requests counters
+REQUEST_LABELS = {
+    "get": "SNMP GET requests",
+    "getnext": "SNMP GETNEXT requests",
+    "getbulk": "SNMP GETBULK requests",
+}
+
+
+class ColumnStats:  # pylint: disable=too-few-public-methods
+    """Requests statistics of a profile column"""
+
+    def __init__(self):
+        self.requests = 0
+        self.varbinds = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.time = 0
+        self.latency_histogram = [0] * (len(LATENCY_BUCKETS) + 1)
+
+    def to_dict(self):
+        """Export statistics as a dict"""
+        return {
+            "requests": self.requests,
+            "varbinds": self.varbinds,
+            "bytes_sent": self.bytes_sent,
+            "bytes_received": self.bytes_received,
+            "time": round(self.time, 6),
+            "latency_histogram": dict(
+                zip([str(bound) for bound in LATENCY_BUCKETS] + ["+Inf"], self.latency_histogram)
+            ),
+        }
+
+
+class SNMPStats:
+    """
+    SNMP requests statistics
+
+    Requests, varbinds and estimated bytes are counted by request type and by profile column (the
+    "<table>.<key>" label of the requested OIDs, "*" for OIDs out of the profile tables). A request
+    covering many columns (for instance, a lock-step GETBULK request) is counted in each of them,
+    with the varbinds & bytes of its OIDs and an equal share of the request latency.
+    """
+
+    def __init__(self):
+        self.requests = collections.Counter()
+        self.varbinds = 0
+        self.retries = 0
+        self.timeouts = 0
+        self.errors = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.time = 0
+        self.columns = collections.defaultdict(ColumnStats)
+        self._lock = threading.Lock()
+
+    def record(self, request_type, columns, latency, requests=1):
+        """
+        Record a (successful or not) request: columns is a dict of the varbinds count and the
+        bytes sent & received of the request by profile column
+        """
+        bucket = next(
+            (idx for idx, bound in enumerate(LATENCY_BUCKETS) if latency / requests <= bound),
+            len(LATENCY_BUCKETS),
+        )
+        with self._lock:
+            self.requests[request_type] += requests
+            self.time += latency
+            for column, (varbinds, bytes_sent, bytes_received) in columns.items():
+                self.varbinds += varbinds
+                self.bytes_sent += bytes_sent
+                self.bytes_received += bytes_received
+                column_stats = self.columns[column]
+                column_stats.requests += requests
+                column_stats.varbinds += varbinds
+                column_stats.bytes_sent += bytes_sent
+                column_stats.bytes_received += bytes_received
+                column_stats.time += latency / len(columns)
+                column_stats.latency_histogram[bucket] += requests
+
+    def record_error(self, timeout=False):
+        """Record a request error (timeout or error answer)"""
+        with self._lock:
+            if timeout:
+                self.timeouts += 1
+            else:
+                self.errors += 1
+
+    def record_retry(self):
+        """Record a request re-issued (after a timeout or an error answer)"""
+        with self._lock:
+            self.retries += 1
+
+    def to_dict(self):
+        """Export statistics as a dict"""
+        return {
+            "requests": dict(self.requests),
+            "varbinds": self.varbinds,
+            "retries": self.retries,
+            "timeouts": self.timeouts,
+            "errors": self.errors,
+            "bytes_sent": self.bytes_sent,
+            "bytes_received": self.bytes_received,
+            "time": round(self.time, 6),
+            "columns": {
+                column: column_stats.to_dict()
+                for column, column_stats in sorted(self.columns.items())
+            },
+        }
+
+    def perf_data(self, prefix=""):
+        """Compute Icinga perfdata of the statistics (as a dict of values by label)"""
+        perf_data = {
+            f"{prefix}{label}": f"{self.requests[request_type]};;;;"
+            for request_type, label in REQUEST_LABELS.items()
+        }
+        perf_data.update(
+            {
+                f"{prefix}SNMP varbinds": f"{self.varbinds};;;;",
+                f"{prefix}SNMP retries": f"{self.retries};;;;",
+                f"{prefix}SNMP timeouts": f"{self.timeouts};;;;",
+                f"{prefix}SNMP bytes sent": f"{self.bytes_sent}B;;;;",
+                f"{prefix}SNMP bytes received": f"{self.bytes_received}B;;;;",
+                f"{prefix}SNMP time": f"{round(self.time, 3)}s;;;;",
+            }
+        )
+        for column, column_stats in sorted(self.columns.items()):
+            perf_data[f"{prefix}SNMP {column} requests"] = f"{column_stats.requests};;;;"
+            perf_data[f"{prefix}SNMP {column} varbinds"] = f"{column_stats.varbinds};;;;"
+            perf_data[
+                f"{prefix}SNMP {column} bytes received"
+            ] = f"{column_stats.bytes_received}B;;;;"
+            perf_data[f"{prefix}SNMP {column} time"] = f"{round(column_stats.time, 3)}s;;;;"
+        return perf_data
+
+
+class RequestRecorder:
+    """
+    SNMP requests recorder (used by transport backends to record their requests in an SNMPStats
+    instance)
+
+    Walks handled by a backend itself (using GETNEXT requests) are counted as one GETNEXT request
+    by walked item (plus the last one). Sizes of messages are estimated from their varbinds.
+    Retries are reported by the backends themselves (see record_retry()): the recorder is shared
+    by concurrent requests.
+    """
+
+    def __init__(self, stats, columns, community=""):
+        self.stats = stats
+        # Profile column label by column OID
+        self.columns = columns
+        self.overhead = MESSAGE_OVERHEAD + len(community or "")
+
+    def _column(self, oid):
+        """Retrieve the profile column label of an OID"""
+        return next(
+            (
+                label
+                for column_oid, label in self.columns.items()
+                if oid == column_oid or oid.startswith(f"{column_oid}.")
+            ),
+            "*",
+        )
+
+    def record_retry(self):
+        """Record a request re-issued (after a timeout or an error answer)"""
+        self.stats.record_retry()
+
+    def _columns_stats(self, oids, items, requests=1, answered=True):
+        """
+        Compute the varbinds count and the estimated bytes sent & received of a request by profile
+        column: answer items are ordered by requested OID (as GETBULK answers repetitions) and the
+        messages overhead is shared by the requested OIDs
+        """
+        labels = [self._column(oid) for oid in oids]
+        columns = {label: [0, 0, 0] for label in labels}
+        overhead = self.overhead * requests
+        for pos, (label, oid) in enumerate(zip(labels, oids)):
+            share = overhead // len(oids) + (pos < overhead % len(oids))
+            columns[label][1] += estimate_varbind_size(oid) * requests + share
+            if answered:
+                columns[label][2] += share
+        for idx, item in enumerate(items):
+            column = columns[labels[idx % len(oids)]]
+            column[0] += 1
+            column[2] += estimate_varbind_size(item_oid(item), item.value)
+        return columns
+
+    @contextlib.contextmanager
+    def request(self, request_type, oids):
+        """Record a request: context manager yielding a list to fill with the answer items"""
+        oids = list(oids) if isinstance(oids, (list, tuple)) else [oids]
+        items = []
+        start = time.perf_counter()
+        try:
+            yield items
+        except SNMPError as err:
+            latency = time.perf_counter() - start
+            columns = self._columns_stats(oids, [], answered=False)
+            self.stats.record(request_type, columns, latency)
+            self.stats.record_error(timeout=isinstance(err, SNMPTimeoutError))
+            log.debug("%s(%s) failed in %.3fs: %s", request_type, ",".join(columns), latency, err)
+            raise
+        latency = time.perf_counter() - start
+        requests = 1
+        if request_type == "walk":
+            # The subtree was walked using GETNEXT requests
+            request_type = "getnext"
+            requests = len(items) + 1
+        self.stats.record(
+            request_type, self._columns_stats(oids, items, requests), latency, requests
+        )
+
+
+# vim: tabstop=4 shiftwidth=4 softtabstop=4 expandtab
@@ -0,0 +1,138 @@
+""" Thresholds engine (Nagios ranges, with per-model & per-AP group overrides) """
+
+import collections
+
+# Checked AP metrics: AP info key, label & unit by metric name
+METRICS = {
+    "cpu": ("cpu_usage", "CPU usage", "%"),
+    "mem": ("mem_usage", "memory usage", "%"),
+}
+
+# Threshold override rule (None values are not overridden)
+ThresholdRule = collections.namedtuple(
+    "ThresholdRule", ("metric", "warning", "critical", "model", "group")
+)
+
+
+class ThresholdError(ValueError):
+    """Invalid threshold"""
+
+
+class Range:
+    """
+    Nagios threshold range ([@][start:][end], start could be ~ for negative infinity)
+
+    An alert is raised if the value is outside the range (or inside it if prefixed by @). For
+    backward compatibility, a plain number N (without colon) keeps the historical meaning of the
+    plugin thresholds: an alert is raised if the value is greater than or equal to N.
+    """
+
+    def __init__(self, spec):
+        self.spec = str(spec).strip()
+        self.inside = self.spec.startswith("@")
+        body = self.spec[1:] if self.inside else self.spec
+        if not body:
+            raise ThresholdError(f"Invalid threshold range '{spec}' (empty)")
+        self.legacy = ":" not in body and not self.inside
+        start, end = body.split(":", 1) if ":" in body else ("", body)
+        try:
+            self.start = None if start == "~" else float(start or 0)
+            self.end = float(end) if end else None
+        except ValueError as err:
+            raise ThresholdError(f"Invalid threshold range '{spec}'") from err
+        if self.start is not None and self.end is not None and self.start > self.end:
+            raise ThresholdError(f"Invalid threshold range '{spec}' (start > end)")
+
+    def alert(self, value):
+        """Check if a value raise an alert"""
+        if self.legacy:
+            return value >= self.end
+        in_range = (self.start is None or value >= self.start) and (
+            self.end is None or value <= self.end
+        )
+        return in_range == self.inside
+
+    def describe(self, unit=""):
+        """Describe the alert condition of the range"""
+        if self.legacy:
+            return f">={self.spec}{unit}"
+        return f"{'in' if self.inside else 'out of'} {self.spec.lstrip('@')}{unit} range"
+
+    def __str__(self):
+        return self.spec
+
+    def __repr__(self):
+        return f"Range({self.spec!r})"
+
+
+def parse_rule(spec):
+    """
+    Parse a threshold override rule: a metric name followed by comma-separated key=value
+    parameters (warning, critical, model and group), for instance: "cpu,warning=~:70,model=AP-515"
+    """
+    metric, *params = [part.strip() for part in spec.split(",")]
+    if metric not in METRICS:
+        raise ThresholdError(
+            f"Invalid threshold metric '{metric}' (supported: {', '.join(METRICS)})"
+        )
+    values = dict.fromkeys(("warning", "critical", "model", "group"))
+    for param in params:
+        key, sep, value = param.partition("=")
+        if not sep or key not in values:
+            raise ThresholdError(f"Invalid threshold rule parameter '{param}'")
+        values[key] = Range(value) if key in ("warning", "critical") else value
+    return ThresholdRule(metric, **values)
+
+
+class Thresholds:
+    """
+    Thresholds of the checked AP metrics
+
+    Default thresholds could be overridden by rules matching on the AP model and/or group: the
+    last matching rule of a metric wins. Thresholds are resolved once by model & group.
+    """
+
+    def __init__(self, rules=None):
+        self.rules = list(rules or [])
+        self._resolved = {}
+
+    def add(self, metric, warning=None, critical=None, model=None, group=None):
+        """Add a threshold rule"""
+        self.rules.append(ThresholdRule(metric, warning, critical, model, group))
+        self._resolved.clear()
+
+    def get(self, ap, metric):
+        """Get the (warning, critical) thresholds of an AP metric"""
+        key = (metric, ap.model, ap.group)
+        if key not in self._resolved:
+            thresholds = [None, None]
+            for rule in self.rules:
+                if rule.metric != metric:
+                    continue
+                if rule.model is not None and rule.model != ap.model:
+                    continue
+                if rule.group is not None and rule.group != ap.group:
+                    continue
+                for idx, threshold in enumerate((rule.warning, rule.critical)):
+                    if threshold is not None:
+                        thresholds[idx] = threshold
+            self._resolved[key] = tuple(thresholds)
+        return self._resolved[key]
+
+    def check(self, ap, metric):
+        """
+        Check an AP metric against its thresholds: return the status and the exceeded threshold
+        range (status is None if the metric is not available for this AP)
+        """
+        value = getattr(ap, METRICS[metric][0])
+        if value is None:
+            return None, None
+        warning, critical = self.get(ap, metric)
+        if critical is not None and critical.alert(value):
+            return 2, critical
+        if warning is not None and warning.alert(value):
+            return 1, warning
+        return 0, None
+
+
+# vim: tabstop=4 shiftwidth=4 softtabstop=4 expandtab
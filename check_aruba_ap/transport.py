@@ -0,0 +1,381 @@
+""" SNMP transport backends interface """
+
+import collections
+import contextlib
+import importlib
+import logging
+import time
+
+log = logging.getLogger(__name__)
+
+# Transport backends classes (module & class names) by name
+TRANSPORTS = {
+    "easysnmp": "check_aruba_ap.easysnmp_transport.EasySNMPTransport",
+    "asyncio": "check_aruba_ap.asyncio_transport.AsyncioTransport",
+    "replay": "check_aruba_ap.replay_transport.ReplayTransport",
+}
+DEFAULT_TRANSPORT = next(iter(TRANSPORTS))
+
+# Retrieved SNMP variable (with the same attributes as easysnmp ones)
+SNMPVariable = collections.namedtuple("SNMPVariable", ("oid", "oid_index", "value", "snmp_type"))
+
+# SNMP types of varbinds past the end of the MIB view or missing
+END_OF_WALK_TYPES = ("ENDOFMIBVIEW", "NOSUCHOBJECT", "NOSUCHINSTANCE")
+MISSING_TYPES = ("NOSUCHOBJECT", "NOSUCHINSTANCE")
+
+
+class SNMPError(Exception):
+    """SNMP transport error"""
+
+
+class SNMPTimeoutError(SNMPError):
+    """SNMP host not reachable (no answer before timeout)"""
+
+
+class SNMPDeadlineError(SNMPTimeoutError):
+    """Polling deadline reached (no time left to wait for an answer)"""
+
+
+class SNMPNoSuchNameError(SNMPError):
+    """SNMP noSuchName error answer (SNMP v1 GET request on a missing OID)"""
+
+
+class SNMPTooBigError(SNMPError):
+    """SNMP tooBig error answer"""
+
+
+class SNMPEngineError(SNMPError):
+    """SNMP v3 unknown engine ID or not in time window error"""
+
+
+def estimate_varbind_size(oid, value=None):
+    """Estimate the BER encoded size (in bytes) of a varbind (with a NULL value by default)"""
+    sub_ids = [1 if sub_id == "iso" else int(sub_id) for sub_id in oid.strip(".").split(".")]
+    # The two first sub-identifiers are encoded on one byte
+    size = 1
+    for sub_id in sub_ids[2:]:
+        size += max(1, (sub_id.bit_length() + 6) // 7)
+    # Add varbind sequence, OID & value type/length headers
+    return size + 6 + (len(str(value)) if value is not None else 0)
+
+
+def get_transport_class(name):
+    """Get a transport backend class from its name (backend modules are imported on demand)"""
+    if name not in TRANSPORTS:
+        raise SNMPError(f"Unsupported SNMP transport {name}")
+    module_name, class_name = TRANSPORTS[name].rsplit(".", 1)
+    try:
+        return getattr(importlib.import_module(module_name), class_name)
+    except ImportError as err:
+        raise SNMPError(f"SNMP transport {name} is not available: {err}") from err
+
+
+def item_oid(item):
+    """Retrieve the full OID of an item"""
+    return f"{item.oid}.{item.oid_index}" if item.oid_index else item.oid
+
+
+class SNMPTransport:
+    """
+    SNMP transport backend
+
+    Backends implement the GET, GETNEXT and GETBULK requests (_get(), _get_next() and _get_bulk()
+    methods, raising SNMPError exceptions). This class implements on top of them the get, get-many,
+    walk and bulk-walk operations used by SNMPClient. Backends able to keep many requests in flight
+    could also override get_many() and walk_many() to pipeline them.
+    """
+
+    # Could the same instance be used by many threads at the same time
+    thread_safe = False
+
+    def __init__(
+        self,
+        hostname="localhost",
+        version=1,
+        max_repetitions=20,
+        max_get_varbinds=32,
+        max_get_pdu_size=1400,
+        recorder=None,
+        deadline=None,
+        session_recorder=None,
+    ):
+        self.hostname = hostname
+        self.version = version
+        self.max_repetitions = max_repetitions
+        self.max_get_varbinds = max(1, max_get_varbinds)
+        self.max_get_pdu_size = max_get_pdu_size
+        # Requests recorder (see check_aruba_ap.stats.RequestRecorder)
+        self.recorder = recorder
+        # Polling deadline (time.monotonic() value, None if unlimited)
+        self.deadline = deadline
+        # SNMP session recorder (see check_aruba_ap.session_file.SessionRecorder)
+        self.session_recorder = session_recorder
+
+    @contextlib.contextmanager
+    def _record(self, request_type, oids, max_repetitions=0):
+        """
+        Record a request statistics and its answer in the SNMP session record (if configured):
+        context manager yielding the answer
+
+        Timeouts occurring once the polling deadline is reached are raised as SNMPDeadlineError.
+        """
+        start = time.perf_counter()
+        try:
+            if self.recorder is None:
+                answer = []
+                yield answer
+            else:
+                with self.recorder.request(request_type, oids) as answer:
+                    yield answer
+        except SNMPError as err:
+            if self.session_recorder is not None:
+                self.session_recorder.record(
+                    self.hostname,
+                    request_type,
+                    oids,
+                    max_repetitions,
+                    time.perf_counter() - start,
+                    error=err,
+                )
+            if (
+                not isinstance(err, SNMPTimeoutError)
+                or isinstance(err, SNMPDeadlineError)
+                or not self.deadline_reached()
+            ):
+                raise
+            raise SNMPDeadlineError(f"Polling deadline reached ({err})") from err
+        if self.session_recorder is not None:
+            self.session_recorder.record(
+                self.hostname,
+                request_type,
+                oids,
+                max_repetitions,
+                time.perf_counter() - start,
+                items=answer,
+            )
+
+    def _record_retry(self):
+        """Record a request re-issued (after a timeout or an error answer) in the statistics"""
+        if self.recorder is not None:
+            self.recorder.record_retry()
+
+    def deadline_reached(self):
+        """Check if the polling deadline is reached"""
+        return self.deadline is not None and time.monotonic() >= self.deadline
+
+    def request_budget(self, timeout, retries):
+        """
+        Compute the timeout & retries of the next request, shrunk to fit in the remaining time
+        before the polling deadline (raise SNMPDeadlineError if it's reached)
+        """
+        if self.deadline is None:
+            return timeout, retries
+        remaining = self.deadline - time.monotonic()
+        if remaining <= 0:
+            raise SNMPDeadlineError("Polling deadline reached")
+        # Drop retries first, then shorten the timeout of the last attempt
+        retries = min(retries, int(remaining // timeout) - 1)
+        if retries < 0:
+            return remaining, 0
+        return timeout, retries
+
+    def _get(self, oids):
+        """Send a GET request of a list of OIDs (return the list of retrieved items)"""
+        raise NotImplementedError()
+
+    def _get_next(self, oids):
+        """Send a GETNEXT request of a list of OIDs (return the list of next items)"""
+        raise NotImplementedError()
+
+    def _get_bulk(self, oids, max_repetitions):
+        """
+        Send a GETBULK request of a list of OIDs (return the list of retrieved items, ordered by
+        repetition then by requested OID)
+        """
+        raise NotImplementedError()
+
+    def get(self, oid):
+        """Get one OID value (return None if missing)"""
+        return dict(self.get_many([oid])).get(oid)
+
+    def get_next(self, oid):
+        """Get the next item of an OID (return None past the end of the MIB view)"""
+        try:
+            item = self._get_next([oid])[0]
+        except SNMPNoSuchNameError:
+            # SNMP v1 end of MIB view
+            return None
+        return None if item.snmp_type in END_OF_WALK_TYPES else item
+
+    def walk(self, oid, max_repetitions=None):
+        """
+        Walk an OID subtree (using GETBULK requests if the SNMP version support it): max_repetitions
+        could be used to size the GETBULK requests to the expected subtree size (it's capped to the
+        transport one)
+        """
+        if self.version == 1 or not self.max_repetitions:
+            return list(self._next_walk(oid))
+        return list(self.bulk_walk(oid, max_repetitions))
+
+    def walk_many(self, oids):
+        """Walk many OID subtrees (return the list of the walked items of each one)"""
+        return [self.walk(oid) for oid in oids]
+
+    def _next_walk(self, oid):
+        """Walk an OID subtree using GETNEXT requests"""
+        next_oid = oid
+        while True:
+            try:
+                item = self._get_next([next_oid])[0]
+            except SNMPNoSuchNameError:
+                # SNMP v1 end of MIB view
+                return
+            if item.snmp_type in END_OF_WALK_TYPES or not item_oid(item).startswith(f"{oid}."):
+                return
+            yield item
+            next_oid = item_oid(item)
+
+    def bulk_walk(self, oid, max_repetitions=None):
+        """Walk an OID subtree using GETBULK requests (see walk())"""
+        max_repetitions = min(max_repetitions or self.max_repetitions, self.max_repetitions)
+        next_oid = oid
+        while True:
+            try:
+                items = self._get_bulk([next_oid], max_repetitions)
+            except SNMPTooBigError:
+                if max_repetitions <= 1:
+                    raise
+                max_repetitions = max(1, max_repetitions // 2)
+                # Remember it for next walks to avoid retrieving the same tooBig answer again
+                self.max_repetitions = min(self.max_repetitions, max_repetitions)
+                log.debug(
+                    "bulk_walk(%s): tooBig answer received, retry with max-repetitions=%d",
+                    oid,
+                    max_repetitions,
+                )
+                self._record_retry()
+                continue
+            if not items:
+                return
+            for item in items:
+                oid_item = item_oid(item)
+                if item.snmp_type in END_OF_WALK_TYPES or not oid_item.startswith(f"{oid}."):
+                    return
+                yield item
+            if oid_item == next_oid:
+                return
+            next_oid = oid_item
+
+    def _get_next_rows(self, oids, max_repetitions):
+        """
+        Retrieve the next items of many OIDs, at once if possible (using a GETBULK request if the
+        SNMP version support it, a GETNEXT one otherwise): return the list of the retrieved items of
+        each OID and the max-repetitions to use for the next requests
+        """
+        while True:
+            # Keep the answers size close to the single OID ones
+            repetitions = -(-max_repetitions // len(oids))
+            bulk = self.version != 1 and repetitions
+            try:
+                items = self._get_bulk(oids, repetitions) if bulk else self._get_next(oids)
+                return [items[pos :: len(oids)] for pos in range(len(oids))], max_repetitions
+            except SNMPTooBigError:
+                if bulk and repetitions > 1:
+                    max_repetitions = max(1, max_repetitions // 2)
+                    log.debug(
+                        "_get_next_rows(): tooBig answer received, retry with max-repetitions=%d",
+                        max_repetitions,
+                    )
+                    self._record_retry()
+                    continue
+                if len(oids) == 1:
+                    raise
+            except SNMPNoSuchNameError:
+                # SNMP v1 end of MIB view (of at least one of the OIDs)
+                if len(oids) == 1:
+                    end_of_mib = SNMPVariable(oids[0], "", "ENDOFMIBVIEW", "ENDOFMIBVIEW")
+                    return [[end_of_mib]], max_repetitions
+            break
+
+        # Retrieve the next items of each OID separately
+        self._record_retry()
+        rows = []
+        for oid in oids:
+            items, max_repetitions = self._get_next_rows([oid], max_repetitions)
+            rows.extend(items)
+        return rows, max_repetitions
+
+    def walk_rows(self, oids, max_repetitions=None):
+        """
+        Walk many OID subtrees in lock-step: each request retrieves the next items of all the
+        subtrees not ended yet. Yield pages of walked items (one list of items by subtree, None once
+        the walk of a subtree is over). max_repetitions could be used to size the requests to the
+        expected subtrees size (see walk()).
+        """
+        next_oids = list(oids)
+        active = list(range(len(oids)))
+        max_repetitions = min(max_repetitions or self.max_repetitions, self.max_repetitions)
+        while active:
+            answers, max_repetitions = self._get_next_rows(
+                [next_oids[idx] for idx in active], max_repetitions
+            )
+            page = [None] * len(oids)
+            ended = set() if any(answers) else set(active)
+            for idx, items in zip(active, answers):
+                page[idx] = []
+                for item in items:
+                    oid_item = item_oid(item)
+                    if (
+                        item.snmp_type in END_OF_WALK_TYPES
+                        or not oid_item.startswith(f"{oids[idx]}.")
+                        or oid_item == next_oids[idx]
+                    ):
+                        ended.add(idx)
+                        break
+                    page[idx].append(item)
+                    next_oids[idx] = oid_item
+            active = [idx for idx in active if idx not in ended]
+            yield page
+
+    def iter_get_batches(self, oids):
+        """Split a list of OIDs in batches according to max varbinds count & PDU size"""
+        batch = []
+        batch_size = 0
+        for oid in oids:
+            size = estimate_varbind_size(oid)
+            if batch and (
+                len(batch) >= self.max_get_varbinds
+                or (self.max_get_pdu_size and batch_size + size > self.max_get_pdu_size)
+            ):
+                yield batch
+                batch = []
+                batch_size = 0
+            batch.append(oid)
+            batch_size += size
+        if batch:
+            yield batch
+
+    def get_batch(self, oids):
+        """Get a batch of OIDs using one GET request (return a list of items, None if missing)"""
+        try:
+            items = self._get(oids)
+        except SNMPNoSuchNameError:
+            # With SNMP v1, one missing OID make the whole request fail: split the batch to
+            # retrieve the other ones
+            if len(oids) == 1:
+                return [None]
+            self._record_retry()
+            middle = len(oids) // 2
+            return self.get_batch(oids[:middle]) + self.get_batch(oids[middle:])
+        return [None if item.snmp_type in MISSING_TYPES else item for item in items]
+
+    def get_many(self, oids):
+        """Get many OIDs values by packing them in GET requests (missing ones are ignored)"""
+        for batch in self.iter_get_batches(oids):
+            log.debug("get_many(): get %d OIDs in one request", len(batch))
+            for oid, item in zip(batch, self.get_batch(batch)):
+                if item is not None:
+                    yield oid, item
+
+
+# vim: tabstop=4 shiftwidth=4 softtabstop=4 expandtab
@@ -21,6 +21,8 @@ setup(
         "console_scripts": [
             "check_aruba_aps = check_aruba_ap.scripts.check_aruba_aps:main",
             "check_aruba_ap = check_aruba_ap.scripts.check_aruba_ap:main",
+            "check_aruba_ap_poller = check_aruba_ap.scripts.check_aruba_ap_poller:main",
+            "check_aruba_ap_exporter = check_aruba_ap.scripts.check_aruba_ap_exporter:main",
         ],
     },
 )
@@ -0,0 +1,11 @@
+""" Tests configuration """
+
+import os
+import sys
+
+# Make the tools (fake SNMP agent) importable by the tests
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tools")
+)
+
+# vim: tabstop=4 shiftwidth=4 softtabstop=4 expandtab
@@ -0,0 +1,71 @@
+""" Tests of the fleet aggregates """
+
+import random
+
+import pytest
+
+from check_aruba_ap.aggregates import EXACT_VALUES, MetricSummary, P2Quantile, nearest_rank
+
+
+def exact_percentile(values, percentile):
+    """Compute a percentile by definition: the smallest value not exceeded by percentile% values"""
+    return min(
+        value
+        for value in values
+        if sum(other <= value for other in values) * 100 >= percentile * len(values)
+    )
+
+
+@pytest.mark.parametrize(
+    "values, quantile, expected",
+    [
+        ([1], 0.5, 1),
+        ([1, 2], 0.5, 1),
+        ([1, 2, 3, 4], 0.5, 2),
+        ([1, 2, 3, 4], 0.99, 4),
+        (list(range(1, 11)), 0.9, 9),
+        (list(range(1, 101)), 0.07, 7),
+        (list(range(1, 101)), 0.99, 99),
+        ([5, 6, 7], 0, 5),
+        ([5, 6, 7], 1, 7),
+    ],
+)
+def test_nearest_rank(values, quantile, expected):
+    """Quantiles are the values of rank ceil(quantile * count)"""
+    assert nearest_rank(values, quantile) == expected
+
+
+@pytest.mark.parametrize("count", [1, 2, 3, 5, 10, 11, 37, 99, EXACT_VALUES])
+def test_exact_percentiles(count):
+    """Percentiles of up to EXACT_VALUES values are exact"""
+    values = [random.Random(count).randint(0, 100) for _ in range(count)]
+    summary = MetricSummary()
+    for value in values:
+        summary.add(value)
+    result = summary.values()
+    assert (result["min"], result["max"]) == (min(values), max(values))
+    assert result["avg"] == pytest.approx(sum(values) / count)
+    for percentile in (50, 90, 99):
+        assert result[f"p{percentile}"] == exact_percentile(values, percentile)
+
+
+@pytest.mark.parametrize("quantile", [0.5, 0.9, 0.99])
+@pytest.mark.parametrize("distribution", ["uniform", "normal", "sorted"])
+def test_p2_quantile(quantile, distribution):
+    """The P² estimator stays close to the exact quantile of a long stream"""
+    rand = random.Random(42)
+    if distribution == "normal":
+        values = [rand.gauss(50, 10) for _ in range(10000)]
+    else:
+        values = [rand.uniform(0, 100) for _ in range(10000)]
+    if distribution == "sorted":
+        values.sort()
+    estimator = P2Quantile(quantile)
+    for value in values:
+        estimator.add(value)
+    exact = nearest_rank(sorted(values), quantile)
+    # Tolerance of 1% of the values range
+    assert estimator.value == pytest.approx(exact, abs=(max(values) - min(values)) / 100)
+
+
+# vim: tabstop=4 shiftwidth=4 softtabstop=4 expandtab
@@ -0,0 +1,95 @@
+""" Tests of the asyncio SNMP transport backend (against the fake SNMP agent) """
+
+import pytest
+
+from check_aruba_ap.asyncio_transport import AsyncioTransport
+from check_aruba_ap.snmp_client import PROFILES
+from check_aruba_ap.stats import RequestRecorder, SNMPStats
+from check_aruba_ap.transport import SNMPTimeoutError
+
+# The fake SNMP agent module also provides a fake easysnmp session
+fake_agent = pytest.importorskip("fake_agent")
+
+AP_OIDS = PROFILES["instant_node"]["ap_oids"]
+
+
+@pytest.fixture(name="agent", scope="module")
+def fixture_agent():
+    """Fake SNMP agent serving 5 APs (answering GETBULK requests of up to 20 varbinds)"""
+    agent = fake_agent.FakeAgent(fake_agent.FakeMIB("instant_node", 5), max_response_varbinds=20)
+    agent.start()
+    yield agent
+    agent.stop()
+
+
+def get_transport(agent, version, **kwargs):
+    """Get an asyncio transport of the fake SNMP agent"""
+    return AsyncioTransport(
+        hostname="127.0.0.1",
+        version=version,
+        remote_port=agent.port,
+        timeout=1,
+        retries=0,
+        **kwargs,
+    )
+
+
+def get_column(agent, oid):
+    """Retrieve the (OID, value) items of a column of the fake MIB"""
+    return [
+        (item_oid, value)
+        for item_oid, (value, _) in zip(agent.mib.oids, agent.mib.values)
+        if item_oid.startswith(f"{oid}.")
+    ]
+
+
+@pytest.mark.parametrize("version", [1, 2])
+def test_walk(agent, version):
+    """Columns are walked entirely (with GETNEXT or GETBULK requests)"""
+    transport = get_transport(agent, version, max_repetitions=2)
+    for oid in (AP_OIDS["name"], AP_OIDS["uptime"]):
+        assert [(item.oid, item.value) for item in transport.walk(oid)] == get_column(agent, oid)
+
+
+def test_walk_too_big(agent):
+    """GETBULK requests are re-issued with a smaller max-repetitions on tooBig answers"""
+    stats = SNMPStats()
+    transport = get_transport(agent, 2, max_repetitions=40, recorder=RequestRecorder(stats, {}))
+    oid = AP_OIDS["name"]
+    assert [(item.oid, item.value) for item in transport.walk(oid)] == get_column(agent, oid)
+    assert transport.max_repetitions == 20
+    assert stats.retries == 1
+
+
+@pytest.mark.parametrize("version", [1, 2])
+def test_get_many(agent, version):
+    """Many OIDs are retrieved at once, missing ones are ignored"""
+    transport = get_transport(agent, version, max_get_varbinds=4)
+    items = get_column(agent, AP_OIDS["name"])
+    oids = [oid for oid, _ in items]
+    missing = [f"{AP_OIDS['name']}.0.0.0.0.0.0", f"{AP_OIDS['name']}.255"]
+    result = transport.get_many(missing[:1] + oids + missing[1:])
+    assert [(oid, item.value) for oid, item in result] == items
+
+
+def test_timeout_retries(agent):
+    """Requests unanswered before the timeout are re-sent, then fail"""
+    stats = SNMPStats()
+    agent.latency = 0.5
+    try:
+        transport = AsyncioTransport(
+            hostname="127.0.0.1",
+            version=2,
+            remote_port=agent.port,
+            timeout=0.1,
+            retries=2,
+            recorder=RequestRecorder(stats, {}),
+        )
+        with pytest.raises(SNMPTimeoutError):
+            transport.get_many([f"{AP_OIDS['name']}.0.11.134.0.0.0"])
+    finally:
+        agent.latency = 0
+    assert (stats.retries, stats.timeouts) == (2, 1)
+
+
+# vim: tabstop=4 shiftwidth=4 softtabstop=4 expandtab
@@ -0,0 +1,181 @@
+""" Tests of the BER codec of SNMP messages """
+
+import pytest
+
+from check_aruba_ap import ber
+
+
+def round_trip(varbinds, version=2):
+    """Encode an SNMP message with (OID, value, type) varbinds and decode it"""
+    return ber.decode_message(
+        ber.encode_message(
+            version,
+            "public",
+            ber.GET_RESPONSE,
+            1234,
+            0,
+            0,
+            [(oid, ber.encode_value(value, snmp_type)) for oid, value, snmp_type in varbinds],
+        )
+    )
+
+
+@pytest.mark.parametrize(
+    "value, snmp_type",
+    [
+        ("0", "INTEGER"),
+        ("-1", "INTEGER"),
+        ("-128", "INTEGER"),
+        ("-129", "INTEGER"),
+        ("-2147483648", "INTEGER"),
+        ("2147483647", "INTEGER"),
+        ("4294967295", "COUNTER"),
+        ("4294967295", "GAUGE"),
+        ("8640000", "TICKS"),
+        ("0", "COUNTER64"),
+        ("18446744073709551615", "COUNTER64"),
+        ("10.0.255.1", "IPADDR"),
+        ("AP-00001", "OCTETSTR"),
+        ("\x00\x0b\x86\xff\x80\x10", "OCTETSTR"),
+        ("iso.3.6.1.4.1.14823.1.2.70", "OBJECTID"),
+        ("NOSUCHOBJECT", "NOSUCHOBJECT"),
+        ("NOSUCHINSTANCE", "NOSUCHINSTANCE"),
+        ("ENDOFMIBVIEW", "ENDOFMIBVIEW"),
+    ],
+)
+def test_value_round_trip(value, snmp_type):
+    """Values are decoded as encoded (as easysnmp formats them)"""
+    oid = "iso.3.6.1.4.1.14823.2.2.1.5.2.1.4.1.3.0"
+    assert round_trip([(oid, value, snmp_type)]).varbinds == [(oid, value, snmp_type)]
+
+
+@pytest.mark.parametrize(
+    "oid",
+    [
+        "iso.3.6.1.2.1.1.2.0",
+        "iso.3.6.1.4.1.14823.2.2.1.5.2.1.4.1.3.0.11.134.128.255.16",
+        "iso.3.6.1.4.1.127.128.16383.16384.2097151.2097152.4294967295",
+    ],
+)
+def test_oid_round_trip(oid):
+    """OIDs are decoded as encoded (sub-identifiers >= 128 are encoded on many bytes)"""
+    assert ber.decode_oid(ber.decode_tlv(ber.encode_oid(oid), 0)[1]) == oid
+
+
+def test_oid_multi_bytes_sub_ids():
+    """Sub-identifiers are encoded in base 128 with the continuation bit"""
+    assert ber.encode_oid("1.3.6.1.4.1.14823") == bytes.fromhex("06072b06010401f367")
+    assert ber.encode_oid("1.3.128") == bytes.fromhex("06032b8100")
+
+
+@pytest.mark.parametrize("value", [b"", bytes.fromhex("2b060181")])
+def test_invalid_oid(value):
+    """Empty OIDs and OIDs ending with a truncated sub-identifier are rejected"""
+    with pytest.raises(ValueError):
+        ber.decode_oid(value)
+
+
+def test_indefinite_length():
+    """BER indefinite lengths (not allowed by SNMP) are rejected"""
+    with pytest.raises(ValueError):
+        ber.decode_tlv(bytes.fromhex("30800000"), 0)
+
+
+@pytest.mark.parametrize("length", [0, 127, 128, 255, 256, 65536])
+def test_long_form_length(length):
+    """Lengths above 127 are encoded in the long form"""
+    data = ber.encode_tlv(ber.OCTET_STRING, b"x" * length)
+    assert data[1] & 0x80 == (0x80 if length > 127 else 0)
+    assert ber.decode_tlv(data, 0) == (ber.OCTET_STRING, b"x" * length, len(data))
+
+
+def test_message_round_trip():
+    """A message with many varbinds and a long-form length is decoded as encoded"""
+    varbinds = [
+        (f"iso.3.6.1.4.1.14823.2.2.1.5.2.1.4.1.3.{idx}", f"AP-{idx:05d}", "OCTETSTR")
+        for idx in range(50)
+    ]
+    message = round_trip(varbinds, version=1)
+    assert (message.version, message.community, message.pdu_type, message.request_id) == (
+        1,
+        "public",
+        ber.GET_RESPONSE,
+        1234,
+    )
+    assert message.varbinds == varbinds
+
+
+def test_request_round_trip():
+    """GETBULK requests carry the max-repetitions in the error-index field"""
+    message = ber.decode_message(
+        ber.encode_request(2, "public", ber.GET_BULK_REQUEST, 2**31 - 1, ["iso.3.6.1"], 25)
+    )
+    assert (message.version, message.request_id, message.error_status, message.error_index) == (
+        2,
+        2**31 - 1,
+        0,
+        25,
+    )
+    assert message.varbinds == [("iso.3.6.1", "NULL", "NULL")]
+
+
+def test_truncated_message():
+    """Truncated messages are rejected"""
+    data = ber.encode_request(2, "public", ber.GET_REQUEST, 1, ["iso.3.6.1.2.1.1.2.0"])
+    for size in range(len(data)):
+        with pytest.raises(ValueError):
+            ber.decode_message(data[:size])
+
+
+@pytest.mark.parametrize(
+    "data",
+    [
+        # Not a sequence
+        bytes.fromhex("040474657374"),
+        # Empty sequence
+        bytes.fromhex("3000"),
+        # Long-form length larger than the data
+        bytes.fromhex("3084ffffffff"),
+        # Varbind without value
+        ber.encode_tlv(
+            ber.SEQUENCE,
+            ber.encode_integer(1)
+            + ber.encode_tlv(ber.OCTET_STRING, b"public")
+            + ber.encode_tlv(
+                ber.GET_RESPONSE,
+                ber.encode_integer(1)
+                + ber.encode_integer(0)
+                + ber.encode_integer(0)
+                + ber.encode_tlv(
+                    ber.SEQUENCE, ber.encode_tlv(ber.SEQUENCE, ber.encode_oid("1.3.6.1"))
+                ),
+            ),
+        ),
+        # Empty OID
+        ber.encode_tlv(
+            ber.SEQUENCE,
+            ber.encode_integer(1)
+            + ber.encode_tlv(ber.OCTET_STRING, b"public")
+            + ber.encode_tlv(
+                ber.GET_RESPONSE,
+                ber.encode_integer(1)
+                + ber.encode_integer(0)
+                + ber.encode_integer(0)
+                + ber.encode_tlv(
+                    ber.SEQUENCE,
+                    ber.encode_tlv(
+                        ber.SEQUENCE,
+                        ber.encode_tlv(ber.OBJECT_IDENTIFIER, b"") + ber.encode_tlv(ber.NULL, b""),
+                    ),
+                ),
+            ),
+        ),
+    ],
+)
+def test_malformed_message(data):
+    """Malformed messages are rejected"""
+    with pytest.raises(ValueError):
+        ber.decode_message(data)
+
+
+# vim: tabstop=4 shiftwidth=4 softtabstop=4 expandtab
@@ -0,0 +1,96 @@
+""" Tests of the SNMP values codecs """
+
+import pytest
+
+from check_aruba_ap.column_codecs import (
+    decode_auto,
+    decode_int,
+    decode_ipv4,
+    decode_mac,
+    decode_text,
+    get_decoders,
+)
+from check_aruba_ap.transport import SNMPVariable
+
+
+def item(value, snmp_type="OCTETSTR"):
+    """Build a retrieved item"""
+    return SNMPVariable("iso.3.6.1.4.1.14823.2.2.1.5.2.1.4.1.1", "", value, snmp_type)
+
+
+@pytest.mark.parametrize(
+    "value, mac",
+    [
+        ("\x00\x0b\x86\xab\xcd\x10", "00:0b:86:ab:cd:10"),
+        ("\xff\xff\xff\xff\xff\xff", "ff:ff:ff:ff:ff:ff"),
+        ("00:0B:86:AB:CD:10", "00:0b:86:ab:cd:10"),
+    ],
+)
+def test_decode_mac(value, mac):
+    """MAC addresses are decoded from raw bytes or from the text formatted by the agent"""
+    assert decode_mac(item(value)) == mac
+
+
+@pytest.mark.parametrize(
+    "value, text",
+    [
+        ("AP-00001", "AP-00001"),
+        ("", ""),
+        ("CNK\x00\x01", "434e4b0001"),
+        ("caf\xe9", "636166e9"),
+    ],
+)
+def test_decode_text(value, text):
+    """Not printable texts are hex encoded"""
+    assert decode_text(item(value)) == text
+
+
+@pytest.mark.parametrize(
+    "value, snmp_type, ip",
+    [
+        ("10.0.255.1", "IPADDR", "10.0.255.1"),
+        ("\x0a\x00\xff\x01", "OCTETSTR", "10.0.255.1"),
+        ("10.0.255.1", "OCTETSTR", "10.0.255.1"),
+    ],
+)
+def test_decode_ipv4(value, snmp_type, ip):
+    """IPv4 addresses are decoded from IpAddress values or 4 bytes octet strings"""
+    assert decode_ipv4(item(value, snmp_type)) == ip
+
+
+@pytest.mark.parametrize(
+    "value, number",
+    [("42", 42), ("-90", -90), ("18446744073709551615", 2**64 - 1), ("", None), ("N/A", None)],
+)
+def test_decode_int(value, number):
+    """Numeric values are decoded as integers, invalid ones as None"""
+    assert decode_int(item(value, "GAUGE")) == number
+
+
+@pytest.mark.parametrize(
+    "value, snmp_type, decoded",
+    [
+        ("42", "COUNTER", 42),
+        ("AP-00001", "OCTETSTR", "AP-00001"),
+        ("\x00\x0b", "OCTETSTR", "000b"),
+        ("10.0.0.1", "IPADDR", "10.0.0.1"),
+    ],
+)
+def test_decode_auto(value, snmp_type, decoded):
+    """Values of columns without codec are decoded according to their SNMP type"""
+    assert decode_auto(item(value, snmp_type)) == decoded
+
+
+def test_get_decoders():
+    """Decoders are retrieved by column OID (missing columns are skipped)"""
+    decoders = get_decoders({"mac": "1.1", "name": "1.2", "ssid": None}, {"mac": "mac"})
+    assert decoders == {"1.1": decode_mac, "1.2": decode_auto}
+
+
+def test_get_decoders_unknown_codec():
+    """Unknown codecs are rejected"""
+    with pytest.raises(ValueError):
+        get_decoders({"mac": "1.1"}, {"mac": "macaddress"})
+
+
+# vim: tabstop=4 shiftwidth=4 softtabstop=4 expandtab
@@ -0,0 +1,105 @@
+""" Tests of the radio interfaces counters rates computation """
+
+import pytest
+
+from check_aruba_ap.counters import COUNTERS, MAX_RATES, CounterStore, counter_delta
+from check_aruba_ap.records import AccessPoint, RadioInterface
+
+MAC = "00:0b:86:00:00:10"
+
+
+@pytest.mark.parametrize(
+    "previous, current, width, delta",
+    [
+        (100, 150, 32, 50),
+        (100, 100, 64, 0),
+        # 32-bit counter wrap
+        (2**32 - 10, 5, 32, 15),
+        # Decrease of more than half the range of a 32-bit counter: reset
+        (2**31 - 10, 5, 32, None),
+        # 64-bit counters do not wrap in practice: reset
+        (2**32 - 10, 5, 64, None),
+        (2**64 - 10, 5, 64, None),
+        # Unknown width: reset
+        (2**32 - 10, 5, None, None),
+    ],
+)
+def test_counter_delta(previous, current, width, delta):
+    """Deltas are computed according to the counter width"""
+    assert counter_delta(previous, current, width) == delta
+
+
+def sample(store, timestamp, uptime, widths=None, **counters):
+    """Compute the rates of a radio interface sample"""
+    return store.compute_rates(
+        AccessPoint(name="AP-00001", uptime=uptime),
+        [RadioInterface(mac=MAC, **counters)],
+        timestamp,
+        widths=widths,
+    )
+
+
+@pytest.fixture(name="store")
+def fixture_store(tmp_path):
+    """Counters store of an AP"""
+    return CounterStore(str(tmp_path), "controller", "10.0.0.1")
+
+
+def test_rates(store, tmp_path):
+    """Rates are computed from the previous sample (kept across invocations)"""
+    assert not sample(store, 1000, 100, tx_total_frames=1000, rx_total_bytes=None)
+    store.save()
+    store = CounterStore(str(tmp_path), "controller", "10.0.0.1")
+    rates = sample(store, 1010, 110, tx_total_frames=1500, rx_total_bytes=2000)
+    assert rates == {MAC: {"tx_total_frames": 50}}
+
+
+def test_counter32_wrap(store):
+    """Wrapped 32-bit counters rates are computed"""
+    widths = {"tx_total_bytes": 32}
+    sample(store, 1000, 100, widths, tx_total_bytes=2**32 - 100)
+    assert sample(store, 1010, 110, widths, tx_total_bytes=900) == {MAC: {"tx_total_bytes": 100}}
+
+
+def test_counter64_reset(store):
+    """Decreasing 64-bit counters are handled as resets"""
+    widths = {"tx_total_bytes": 64, "rx_total_bytes": 64}
+    sample(store, 1000, 100, widths, tx_total_bytes=2**40, rx_total_bytes=1000)
+    rates = sample(store, 1010, 110, widths, tx_total_bytes=900, rx_total_bytes=2000)
+    assert rates == {MAC: {"rx_total_bytes": 100}}
+
+
+def test_max_rates(store):
+    """Implausibly high rates are handled as counter resets"""
+    counters = dict.fromkeys(COUNTERS, 0)
+    sample(store, 1000, 100, **counters)
+    rates = sample(
+        store,
+        1010,
+        110,
+        **{
+            counter: int(MAX_RATES[counter] * 10) + (counter == "rx_bad_frames")
+            for counter in COUNTERS
+        },
+    )
+    assert rates == {
+        MAC: {counter: MAX_RATES[counter] for counter in COUNTERS if counter != "rx_bad_frames"}
+    }
+
+
+def test_uptime_regression(store):
+    """Counters samples taken before an AP reboot are ignored"""
+    sample(store, 1000, 100, tx_total_frames=1000)
+    assert not sample(store, 1010, 5, tx_total_frames=1500)
+    assert sample(store, 1020, 15, tx_total_frames=1600) == {MAC: {"tx_total_frames": 10}}
+
+
+def test_same_timestamp(store):
+    """A sample with the same timestamp as the previous one returns the previous rates"""
+    sample(store, 1000, 100, tx_total_frames=1000)
+    rates = sample(store, 1010, 110, tx_total_frames=1500)
+    assert sample(store, 1010, 110, tx_total_frames=1700) == rates == {MAC: {"tx_total_frames": 50}}
+    assert sample(store, 1020, 120, tx_total_frames=2000) == {MAC: {"tx_total_frames": 50}}
+
+
+# vim: tabstop=4 shiftwidth=4 softtabstop=4 expandtab
@@ -0,0 +1,204 @@
+""" Tests of the easysnmp SNMP transport backend (with fake SNMP v3 sessions) """
+
+import time
+
+import pytest
+
+from check_aruba_ap.cache import EngineCache
+from check_aruba_ap.replay_transport import ReplayTransport
+from check_aruba_ap.session_file import SessionRecorder
+from check_aruba_ap.stats import RequestRecorder, SNMPStats
+
+easysnmp_transport = pytest.importorskip("check_aruba_ap.easysnmp_transport")
+fake_agent = pytest.importorskip("fake_agent")
+
+MIB = fake_agent.FakeMIB("instant_node", 5)
+NAME_OID = "iso.3.6.1.4.1.14823.2.3.3.1.2.1.1.2"
+AP_NAME_OID = f"{NAME_OID}{fake_agent.ap_index(1)}"
+ENGINE_KEY = "192.0.2.1:161"
+
+
+class FakeEngine:
+    """SNMP v3 engine of the fake SNMP agent"""
+
+    def __init__(self, engine_id=b"\x80\x00\x39\xe7\x03\x01", boots=3, symbolic=False):
+        # Engine ID (None if the snmpEngineID object is missing)
+        self.engine_id = engine_id
+        self.boots = boots
+        # Are the engine OIDs formatted with their symbolic names
+        self.symbolic = symbolic
+        # Created sessions (with their engine parameters)
+        self.sessions = []
+
+    def item(self, oid, next_item=False):
+        """Retrieve the item of an engine OID (the next one if next_item is set and it's missing)"""
+        idx = easysnmp_transport.ENGINE_OIDS.index(oid)
+        if idx == 0 and self.engine_id is None:
+            if next_item:
+                return self.item(easysnmp_transport.ENGINE_OIDS[1])
+            return fake_agent.FakeVariable(oid, "", "NOSUCHINSTANCE", "NOSUCHINSTANCE")
+        if idx == 0:
+            value, snmp_type = self.engine_id.decode("latin-1"), "OCTETSTR"
+        else:
+            value, snmp_type = str(self.boots if idx == 1 else 1000), "INTEGER"
+        if self.symbolic:
+            return fake_agent.FakeVariable(
+                easysnmp_transport.ENGINE_NAMES[idx][:-2], "0", value, snmp_type
+            )
+        return fake_agent.FakeVariable(oid, "", value, snmp_type)
+
+
+class V3Session(fake_agent.FakeSession):
+    """Fake SNMP v3 session (checking the engine it's created with)"""
+
+    def __init__(self, engine, **kwargs):
+        super().__init__(MIB, **kwargs)
+        self.engine = engine
+        self.kwargs = kwargs
+        engine.sessions.append(self)
+
+    def _check(self):
+        """Check the session engine parameters, if any (as the SNMP agent would do)"""
+        engine_id = self.kwargs.get("security_engine_id")
+        if engine_id is None:
+            return
+        if engine_id != self.engine.engine_id.hex():
+            raise easysnmp_transport.EasySNMPError("Unknown Engine ID")
+        if self.kwargs["engine_boots"] != self.engine.boots:
+            raise easysnmp_transport.EasySNMPError("Not in time window")
+
+    def _split(self, oids, suffix=""):
+        """Split the engine OIDs of a request (return their items and the other OIDs)"""
+        engine_oids = easysnmp_transport.ENGINE_OIDS
+        return (
+            [
+                self.engine.item(oid + suffix, next_item=bool(suffix))
+                for oid in oids
+                if oid + suffix in engine_oids
+            ],
+            [oid for oid in oids if oid + suffix not in engine_oids],
+        )
+
+    def get(self, oids):
+        self._check()
+        items, oids = self._split(oids)
+        return items + super().get(oids)
+
+    def get_next(self, oids):
+        self._check()
+        items, oids = self._split(oids, ".0")
+        return items + super().get_next(oids)
+
+    def get_bulk(self, oids, non_repeaters=0, max_repetitions=10):
+        self._check()
+        items, others = self._split(oids[:non_repeaters], ".0")
+        return items + super().get_bulk(others + oids[non_repeaters:], len(others), max_repetitions)
+
+    def walk(self, oids):
+        self._check()
+        return super().walk(oids)
+
+
+def get_transport(engine, engine_cache_file, **kwargs):
+    """Get an SNMP v3 easysnmp transport using fake sessions of the engine"""
+
+    class Transport(easysnmp_transport.EasySNMPTransport):
+        """easysnmp transport using fake sessions"""
+
+        session_class = staticmethod(lambda **session_kwargs: V3Session(engine, **session_kwargs))
+
+    return Transport(
+        hostname="192.0.2.1",
+        version=3,
+        security_username="monitoring",
+        engine_cache_file=engine_cache_file,
+        **kwargs,
+    )
+
+
+@pytest.mark.parametrize("symbolic", [False, True])
+def test_engine_cache(tmp_path, symbolic):
+    """The engine is retrieved with the first request and cached (numeric or symbolic OIDs)"""
+    path = str(tmp_path / "engines.json")
+    engine = FakeEngine(symbolic=symbolic)
+    transport = get_transport(engine, path)
+    assert [item.value for item in transport.walk(NAME_OID)] == [f"AP-{ap:05d}" for ap in range(5)]
+    assert EngineCache(path).get(ENGINE_KEY)[:2] == (engine.engine_id.hex(), 3)
+
+    # Next sessions are created with the cached engine
+    transport = get_transport(engine, path)
+    assert transport.get(AP_NAME_OID).value == "AP-00001"
+    assert engine.sessions[-1].kwargs["security_engine_id"] == engine.engine_id.hex()
+
+
+@pytest.mark.parametrize("request_type", ["get", "walk"])
+def test_missing_engine_id(tmp_path, request_type):
+    """The engine is not cached if its ID is missing (or if another OID is retrieved instead)"""
+    path = str(tmp_path / "engines.json")
+    transport = get_transport(FakeEngine(engine_id=None), path)
+    if request_type == "get":
+        assert transport.get(AP_NAME_OID).value == "AP-00001"
+    else:
+        assert len(transport.walk(NAME_OID)) == 5
+    assert EngineCache(path).get(ENGINE_KEY) is None
+
+
+def test_not_in_time_window(tmp_path):
+    """The cached engine is forgotten on a not in time window error and the request retried once"""
+    path = str(tmp_path / "engines.json")
+    engine = FakeEngine()
+    get_transport(engine, path).walk(NAME_OID)
+    # The SNMP agent rebooted since its engine was cached
+    engine.boots = 4
+    sessions = len(engine.sessions)
+    stats = SNMPStats()
+    record_file = str(tmp_path / "session.gz")
+    session_recorder = SessionRecorder(record_file)
+    transport = get_transport(
+        engine, path, recorder=RequestRecorder(stats, {}), session_recorder=session_recorder
+    )
+    assert transport.get(AP_NAME_OID).value == "AP-00001"
+    assert (stats.retries, stats.errors) == (1, 1)
+    # A session created with the cached engine, then one discovering the engine
+    assert [session.kwargs.get("engine_boots") for session in engine.sessions[sessions:]] == [
+        3,
+        None,
+    ]
+    assert EngineCache(path).get(ENGINE_KEY)[1] == 4
+
+    # The engine error and the retry are replayed
+    assert session_recorder.save()
+    stats = SNMPStats()
+    transport = ReplayTransport(
+        hostname="192.0.2.1",
+        version=3,
+        replay_file=record_file,
+        latency_factor=0,
+        recorder=RequestRecorder(stats, {}),
+    )
+    assert transport.get(AP_NAME_OID).value == "AP-00001"
+    assert (stats.retries, stats.errors) == (1, 1)
+
+
+def test_deadline_sessions_engine():
+    """Sessions created close to the deadline use the discovered engine (even without cache)"""
+    engine = FakeEngine()
+    transport = get_transport(
+        engine,
+        None,
+        latency=0.05,
+        timeout=1,
+        retries=0,
+        max_repetitions=1,
+        deadline=time.monotonic() + 0.6,
+    )
+    assert len(transport.walk(NAME_OID)) == 5
+    # The timeout is shrunk many times, but only the first used session discovers the engine
+    used = [session for session in engine.sessions if session.requests]
+    assert len(used) > 2
+    assert [session.kwargs.get("security_engine_id") for session in used] == [None] + [
+        engine.engine_id.hex()
+    ] * (len(used) - 1)
+
+
+# vim: tabstop=4 shiftwidth=4 softtabstop=4 expandtab
@@ -0,0 +1,92 @@
+""" Tests of the SNMP client (against the fake SNMP agent) """
+
+import pytest
+
+from check_aruba_ap.snmp_client import PROFILES, SNMPClient
+
+# The fake SNMP agent module also provides a fake easysnmp session
+fake_agent = pytest.importorskip("fake_agent")
+
+APS_COUNT = 5
+RADIOS_COUNT = 2
+
+# Cells missing from the fake MIB (column & AP number, with the radio number for radio columns)
+MISSING_CELLS = [
+    ("ap_oids", "serial", 1),
+    ("ap_oids", "uptime", 3),
+    ("ap_oids", "status", APS_COUNT - 1),
+    ("radio_oids", "noise", 0, 0),
+    ("radio_oids", "usage", 2, 1),
+    ("radio_oids", "clients_count", APS_COUNT - 1, RADIOS_COUNT - 1),
+]
+
+
+def missing_oid(profile, table, key_name, ap, radio=None):
+    """Compute the OID of a missing cell"""
+    oid = PROFILES[profile][table][key_name] + fake_agent.ap_index(ap)
+    return oid if radio is None else f"{oid}.{radio}"
+
+
+@pytest.fixture(name="agent", scope="module", params=list(PROFILES))
+def fixture_agent(request):
+    """Fake SNMP agent of a profile with missing cells"""
+    mib = fake_agent.FakeMIB(request.param, APS_COUNT, radios_count=RADIOS_COUNT)
+    missing = {missing_oid(request.param, *cell) for cell in MISSING_CELLS}
+    kept = [idx for idx, oid in enumerate(mib.oids) if oid not in missing]
+    assert len(kept) == len(mib.oids) - len(missing)
+    mib.oids, mib.keys, mib.values = (
+        [mib.oids[idx] for idx in kept],
+        [mib.keys[idx] for idx in kept],
+        [mib.values[idx] for idx in kept],
+    )
+    agent = fake_agent.FakeAgent(mib, max_response_varbinds=30)
+    agent.start()
+    yield agent
+    agent.stop()
+
+
+def get_status(agent, version, table_fetch):
+    """Retrieve the APs & radio interfaces status (all at once and streamed)"""
+    client = SNMPClient(
+        profile=agent.mib.profile,
+        transport="asyncio",
+        version=version,
+        table_fetch=table_fetch,
+        max_repetitions=7,
+        hostname="127.0.0.1",
+        remote_port=agent.port,
+        timeout=1,
+        retries=0,
+    )
+    aps = [ap.to_dict() for ap in client.get_aps_status()]
+    radios = [it.to_dict() for it in client.get_radio_status()]
+    assert [ap.to_dict() for ap in client.iter_aps_status()] == aps
+    assert [it.to_dict() for it in client.iter_radio_status()] == radios
+    # Radio interfaces of each AP, retrieved with its index suffix
+    by_ap = [it.to_dict() for ap in aps for it in client.get_radio_status(ap["ip"])]
+    assert by_ap == radios
+    return aps, radios
+
+
+def test_missing_cells(agent):
+    """Missing cells are left unset (without shifting the other cells)"""
+    aps, radios = get_status(agent, 2, True)
+    assert len(aps) == APS_COUNT
+    assert len(radios) == APS_COUNT * RADIOS_COUNT
+    assert ["serial" not in ap for ap in aps] == [ap == 1 for ap in range(APS_COUNT)]
+    assert ["uptime" not in ap for ap in aps] == [ap == 3 for ap in range(APS_COUNT)]
+    assert ["status" not in ap for ap in aps] == [ap == APS_COUNT - 1 for ap in range(APS_COUNT)]
+    assert ["noise" not in it for it in radios] == [idx == 0 for idx in range(len(radios))]
+    assert ["usage" not in it for it in radios] == [idx == 5 for idx in range(len(radios))]
+    assert ["clients_count" not in it for it in radios] == [
+        idx == len(radios) - 1 for idx in range(len(radios))
+    ]
+
+
+@pytest.mark.parametrize("version, table_fetch", [(2, False), (1, True), (1, False)])
+def test_fetch_modes(agent, version, table_fetch):
+    """Walked (v1 or v2c) and per-cell fetched tables are the same"""
+    assert get_status(agent, version, table_fetch) == get_status(agent, 2, True)
+
+
+# vim: tabstop=4 shiftwidth=4 softtabstop=4 expandtab
@@ -0,0 +1,123 @@
+""" Tests of the SNMP wire instrumentation """
+
+from check_aruba_ap.stats import RequestRecorder, SNMPStats
+from check_aruba_ap.transport import (
+    SNMPNoSuchNameError,
+    SNMPTooBigError,
+    SNMPTransport,
+    SNMPVariable,
+)
+
+COLUMNS = {"1.1.1": "ap.ip", "1.1.2": "ap.name", "1.2.1": "radio.mac"}
+
+
+def oid_key(oid):
+    """Compute the sort key of an OID"""
+    return tuple(int(sub_id) for sub_id in oid.split("."))
+
+
+class DictTransport(SNMPTransport):
+    """SNMP transport serving the values of a dict (SNMP v1 GET requests semantic)"""
+
+    def __init__(self, values, max_response_varbinds=None, **kwargs):
+        super().__init__(**kwargs)
+        self.values = values
+        self.max_response_varbinds = max_response_varbinds
+
+    def _get(self, oids):
+        with self._record("get", oids) as answer:
+            if any(oid not in self.values for oid in oids):
+                raise SNMPNoSuchNameError("(noSuchName) SNMP error answer")
+            answer.extend(SNMPVariable(oid, "", self.values[oid], "INTEGER") for oid in oids)
+        return answer
+
+    def _get_bulk(self, oids, max_repetitions):
+        with self._record("getbulk", oids, max_repetitions) as answer:
+            if (
+                self.max_response_varbinds
+                and max_repetitions * len(oids) > self.max_response_varbinds
+            ):
+                raise SNMPTooBigError("(tooBig) SNMP error answer")
+            ordered = sorted(self.values, key=oid_key)
+            following = [
+                [oid for oid in ordered if oid_key(oid) > oid_key(start)] for start in oids
+            ]
+            for repetition in range(max_repetitions):
+                for start, next_oids in zip(oids, following):
+                    if repetition < len(next_oids):
+                        oid = next_oids[repetition]
+                        answer.append(SNMPVariable(oid, "", self.values[oid], "INTEGER"))
+                    else:
+                        answer.append(SNMPVariable(start, "", "", "ENDOFMIBVIEW"))
+        return answer
+
+
+def test_no_such_name_split_retries():
+    """Each split of a GET request after a noSuchName answer is counted as a retry"""
+    stats = SNMPStats()
+    transport = DictTransport(
+        {"1.1.1.1": 1, "1.1.1.2": 2, "1.1.1.3": 3}, recorder=RequestRecorder(stats, COLUMNS)
+    )
+    assert transport.get_batch(["1.1.1.1", "1.1.1.2", "1.1.1.3", "1.1.1.4"])[3] is None
+    # [1-4] then [3, 4] failed, [4] alone is missing (no more retry)
+    assert (stats.retries, stats.errors, sum(stats.requests.values())) == (2, 3, 5)
+
+
+def test_too_big_retries():
+    """GETBULK requests re-issued with a smaller max-repetitions are counted as retries"""
+    stats = SNMPStats()
+    transport = DictTransport(
+        {f"1.1.1.{idx}": idx for idx in range(1, 5)},
+        max_response_varbinds=5,
+        version=2,
+        recorder=RequestRecorder(stats, COLUMNS),
+    )
+    assert len(transport.walk("1.1.1")) == 4
+    # max-repetitions 20 -> 10 -> 5
+    assert stats.retries == 2
+
+
+def test_shared_recorder_retries():
+    """A request following a failed one of another transport sharing the recorder isn't a retry"""
+    stats = SNMPStats()
+    recorder = RequestRecorder(stats, COLUMNS)
+    failing = DictTransport({}, recorder=recorder)
+    transport = DictTransport({"1.1.1.1": 1}, recorder=recorder)
+    assert failing.get_batch(["1.1.1.1"]) == [None]
+    assert transport.get_batch(["1.1.1.1"])[0].value == 1
+    assert (stats.retries, stats.errors) == (0, 1)
+
+
+def test_lock_step_columns_stats():
+    """Lock-step GETBULK requests are counted in each walked column"""
+    stats = SNMPStats()
+    values = {f"1.1.1.{idx}": idx for idx in range(1, 4)}
+    values.update({f"1.1.2.{idx}": idx for idx in range(1, 4)})
+    values.update({f"1.2.1.{idx}": idx for idx in range(1, 7)})
+    transport = DictTransport(
+        values, version=2, max_repetitions=12, recorder=RequestRecorder(stats, COLUMNS)
+    )
+    pages = list(transport.walk_rows(["1.1.1", "1.1.2", "1.2.1"]))
+    assert [sum(len(page[idx] or []) for page in pages) for idx in range(3)] == [3, 3, 6]
+
+    # One request of 4 repetitions, then one of 12 for the radio.mac column only
+    assert stats.requests["getbulk"] == 2
+    columns = stats.to_dict()["columns"]
+    assert {label: column["requests"] for label, column in columns.items()} == {
+        "ap.ip": 1,
+        "ap.name": 1,
+        "radio.mac": 2,
+    }
+    assert {label: column["varbinds"] for label, column in columns.items()} == {
+        "ap.ip": 4,
+        "ap.name": 4,
+        "radio.mac": 16,
+    }
+    assert sum(column["varbinds"] for column in columns.values()) == stats.varbinds
+    for key in ("bytes_sent", "bytes_received"):
+        assert sum(column[key] for column in columns.values()) == getattr(stats, key)
+    assert abs(sum(column["time"] for column in columns.values()) - stats.time) < 1e-5
+    assert "SNMP ap.name varbinds" in stats.perf_data()
+
+
+# vim: tabstop=4 shiftwidth=4 softtabstop=4 expandtab
@@ -0,0 +1,159 @@
+""" Tests of the thresholds engine """
+
+import pytest
+
+from check_aruba_ap.records import AccessPoint
+from check_aruba_ap.thresholds import Range, ThresholdError, Thresholds, parse_rule
+
+
+@pytest.mark.parametrize("spec", ["", " ", "@"])
+def test_empty_range(spec):
+    """An empty threshold range is rejected"""
+    with pytest.raises(ThresholdError):
+        Range(spec)
+
+
+@pytest.mark.parametrize("param", ["warning", "critical"])
+def test_rule_with_empty_threshold(param):
+    """An empty warning or critical threshold of a rule is rejected"""
+    with pytest.raises(ThresholdError):
+        parse_rule(f"cpu,{param}=")
+
+
+@pytest.mark.parametrize(
+    "spec, value, alert",
+    [
+        # Legacy plain number: alert if value >= N
+        ("80", 79, False),
+        ("80", 80, True),
+        ("80", 95.5, True),
+        ("0", -1, False),
+        # Nagios ranges: alert if the value is outside the range (bounds included)
+        ("~:70", 71, True),
+        ("~:70", 70, False),
+        ("~:70", -1000, False),
+        ("10:", 5, True),
+        ("10:", 10, False),
+        ("10:20", 21, True),
+        (":20", -1, True),
+        # @ inversion: alert if the value is inside the range (bounds included)
+        ("@10:20", 15, True),
+        ("@10:20", 10, True),
+        ("@10:20", 20, True),
+        ("@10:20", 9, False),
+        ("@10:20", 21, False),
+        ("@~:70", 70, True),
+        ("@~:70", 71, False),
+        ("@80", 50, True),
+        ("@80", 81, False),
+    ],
+)
+def test_range_alert(spec, value, alert):
+    """Values raise an alert according to the range"""
+    assert Range(spec).alert(value) is alert
+
+
+@pytest.mark.parametrize(
+    "spec, description",
+    [("80", ">=80%"), ("~:70", "out of ~:70% range"), ("@10:20", "in 10:20% range")],
+)
+def test_range_describe(spec, description):
+    """The alert condition of ranges is described (legacy ones as >= N)"""
+    assert Range(spec).describe("%") == description
+
+
+@pytest.mark.parametrize("spec", ["abc", "10:x", "20:10", "~"])
+def test_invalid_range(spec):
+    """Invalid threshold ranges are rejected"""
+    with pytest.raises(ThresholdError):
+        Range(spec)
+
+
+def test_parse_rule():
+    """Override rules are parsed with their ranges, other parameters are left unset"""
+    rule = parse_rule("cpu, warning=~:70 ,model=AP-515")
+    assert (rule.metric, str(rule.warning), rule.critical, rule.model, rule.group) == (
+        "cpu",
+        "~:70",
+        None,
+        "AP-515",
+        None,
+    )
+
+
+@pytest.mark.parametrize("spec", ["disk,warning=80", "cpu,warn=80", "cpu,80"])
+def test_invalid_rule(spec):
+    """Override rules of unknown metrics or with invalid parameters are rejected"""
+    with pytest.raises(ThresholdError):
+        parse_rule(spec)
+
+
+def get_thresholds():
+    """Default thresholds overridden by model and/or group rules"""
+    thresholds = Thresholds()
+    thresholds.add("cpu", Range("80"), Range("95"))
+    thresholds.add("mem", Range("80"), Range("95"))
+    for spec in (
+        "cpu,warning=~:70,critical=~:90,model=AP-515",
+        "cpu,critical=@0:10,group=lab",
+        "cpu,warning=60,model=AP-515,group=lab",
+        "mem,warning=50,group=lab",
+    ):
+        thresholds.add(*parse_rule(spec))
+    return thresholds
+
+
+@pytest.mark.parametrize(
+    "model, group, metric, expected",
+    [
+        ("AP-305", "default", "cpu", ("80", "95")),
+        ("AP-305", "default", "mem", ("80", "95")),
+        # Model rule overrides both thresholds
+        ("AP-515", "default", "cpu", ("~:70", "~:90")),
+        # Group rule only overrides the critical threshold
+        ("AP-305", "lab", "cpu", ("80", "@0:10")),
+        # Last matching rules win, parameter by parameter
+        ("AP-515", "lab", "cpu", ("60", "@0:10")),
+        # Rules of other metrics are ignored
+        ("AP-515", "lab", "mem", ("50", "95")),
+    ],
+)
+def test_thresholds_resolution(model, group, metric, expected):
+    """AP thresholds are resolved from the last matching rules of the metric"""
+    thresholds = get_thresholds()
+    ap = AccessPoint(model=model, group=group)
+    assert tuple(str(threshold) for threshold in thresholds.get(ap, metric)) == expected
+
+
+@pytest.mark.parametrize(
+    "model, group, cpu_usage, expected",
+    [
+        ("AP-305", "default", 79, (0, None)),
+        ("AP-305", "default", 80, (1, "80")),
+        ("AP-305", "default", 95, (2, "95")),
+        ("AP-515", "default", 75, (1, "~:70")),
+        ("AP-515", "default", 91, (2, "~:90")),
+        ("AP-305", "lab", 5, (2, "@0:10")),
+        ("AP-305", "lab", 50, (0, None)),
+        ("AP-515", "lab", 60, (1, "60")),
+        ("AP-305", "default", None, (None, None)),
+    ],
+)
+def test_thresholds_check(model, group, cpu_usage, expected):
+    """AP metrics are checked against the critical threshold first"""
+    thresholds = get_thresholds()
+    ap = AccessPoint(model=model, group=group, cpu_usage=cpu_usage)
+    status, threshold = thresholds.check(ap, "cpu")
+    assert (status, threshold if threshold is None else str(threshold)) == expected
+
+
+def test_thresholds_resolution_cache():
+    """Resolved thresholds are forgotten when a rule is added"""
+    thresholds = get_thresholds()
+    ap = AccessPoint(model="AP-305", group="default")
+    assert str(thresholds.get(ap, "cpu")[0]) == "80"
+    thresholds.add("cpu", warning=Range("~:50"), model="AP-305")
+    assert str(thresholds.get(ap, "cpu")[0]) == "~:50"
+
+
+# vim: tabstop=4 shiftwidth=4 softtabstop=4 expandtab
@@ -0,0 +1,245 @@
+""" Benchmark SNMP client & check plugins against a fake Aruba SNMP agent """
+
+import argparse
+import collections
+import contextlib
+import io
+import json
+import sys
+import time
+import tracemalloc
+from unittest import mock
+
+from fake_agent import FakeAgent, FakeMIB, FakeSession
+
+from check_aruba_ap.easysnmp_transport import EasySNMPTransport
+from check_aruba_ap.scripts import add_logging_options
+from check_aruba_ap.scripts import check_aruba_ap as check_aruba_ap_script
+from check_aruba_ap.scripts import check_aruba_aps as check_aruba_aps_script
+from check_aruba_ap.scripts import parse_args
+from check_aruba_ap.snmp_client import PROFILES, SNMPClient
+from check_aruba_ap.transport import DEFAULT_TRANSPORT, TRANSPORTS
+
+
+def run_script(script, argv):
+    """Run a script main (output is discarded)"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        try:
+            script.main(argv)
+        except SystemExit:
+            pass
+
+
+SCENARIOS = {
+    "get_aps_status": lambda client, mib, argv: client.get_aps_status(),
+    "get_ap_status": lambda client, mib, argv: client.get_ap_status(mib.ap_ip(mib.aps_count // 2)),
+    "get_radio_status": lambda client, mib, argv: client.get_radio_status(),
+    "get_ap_radio_status": lambda client, mib, argv: client.get_radio_status(
+        mib.ap_ip(mib.aps_count // 2)
+    ),
+    "check_aruba_aps": lambda client, mib, argv: run_script(check_aruba_aps_script, argv),
+    "check_aruba_ap": lambda client, mib, argv: run_script(
+        check_aruba_ap_script, argv + ["-A", mib.ap_ip(mib.aps_count // 2)]
+    ),
+}
+
+
+def run_scenario(scenario, mib, args):
+    """Run a benchmark scenario and return its measures"""
+    sessions = []
+
+    def session_factory(**kwargs):
+        session = FakeSession(
+            mib,
+            latency=args.latency / 1000,
+            max_response_varbinds=args.max_response_varbinds,
+            **kwargs,
+        )
+        sessions.append(session)
+        return session
+
+    argv = [
+        "-H",
+        "localhost",
+        "--snmp-profile",
+        mib.profile,
+        "--snmp-transport",
+        args.transport,
+        "--snmp-version",
+        str(args.snmp_version),
+        "--snmp-max-repetitions",
+        str(args.snmp_max_repetitions),
+        "--snmp-max-workers",
+        str(args.snmp_max_workers),
+    ]
+    client_kwargs = {}
+    if args.udp or args.transport != "easysnmp":
+        agent = FakeAgent(
+            mib, latency=args.latency / 1000, max_response_varbinds=args.max_response_varbinds
+        )
+        port = agent.start()
+        sessions.append(agent)
+        argv += ["--snmp-remote-port", str(port)]
+        client_kwargs["remote_port"] = port
+        patch = contextlib.nullcontext()
+    else:
+        agent = None
+        patch = mock.patch.object(EasySNMPTransport, "session_class", staticmethod(session_factory))
+    with patch:
+        client = SNMPClient(
+            hostname="localhost",
+            profile=mib.profile,
+            transport=args.transport,
+            version=args.snmp_version,
+            max_repetitions=args.snmp_max_repetitions,
+            max_workers=args.snmp_max_workers,
+            **client_kwargs,
+        )
+        if args.memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        SCENARIOS[scenario](client, mib, argv)
+        duration = time.perf_counter() - start
+        peak_memory = None
+        if args.memory:
+            peak_memory = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+    if agent:
+        agent.stop()
+
+    requests = collections.Counter()
+    varbinds = collections.Counter()
+    for session in sessions:
+        requests.update(session.requests)
+        varbinds.update(session.varbinds)
+    return {
+        "scenario": scenario,
+        "profile": mib.profile,
+        "transport": args.transport,
+        "aps": mib.aps_count,
+        "radios": mib.aps_count * mib.radios_count,
+        "requests": sum(requests.values()),
+        "requests_by_type": dict(requests),
+        "varbinds": sum(varbinds.values()),
+        "duration": round(duration, 4),
+        "peak_memory": peak_memory,
+    }
+
+
+def main(argv=None):
+    """Script main"""
+    parser = argparse.ArgumentParser(description=__doc__)
+
+    parser.add_argument(
+        "-P",
+        "--profile",
+        action="append",
+        choices=list(PROFILES.keys()),
+        help="SNMP profile of the synthetic MIB trees (default: all)",
+    )
+    parser.add_argument(
+        "-s",
+        "--sizes",
+        help="Comma separated fleet sizes (number of APs, default: 10,100,1000)",
+        default="10,100,1000",
+    )
+    parser.add_argument(
+        "-r",
+        "--radios",
+        type=int,
+        help="Number of radio interfaces by AP (default: 2)",
+        default=2,
+    )
+    parser.add_argument(
+        "-S",
+        "--scenario",
+        action="append",
+        choices=list(SCENARIOS.keys()),
+        metavar="SCENARIO",
+        help=f"Benchmark scenario (choices: {', '.join(SCENARIOS)}, default: all)",
+    )
+    parser.add_argument(
+        "-T",
+        "--transport",
+        choices=[name for name in TRANSPORTS if name != "replay"],
+        help=f"SNMP transport backend (default: {DEFAULT_TRANSPORT})",
+        default=DEFAULT_TRANSPORT,
+    )
+    parser.add_argument(
+        "--udp",
+        action="store_true",
+        help=(
+            "Serve the synthetic MIB trees over UDP on localhost (always done with transports "
+            "other than easysnmp, otherwise a fake in-process easysnmp session is used)"
+        ),
+    )
+    parser.add_argument(
+        "-L",
+        "--latency",
+        type=float,
+        help="Simulated latency of each SNMP request in milliseconds (default: 0)",
+        default=0,
+    )
+    parser.add_argument(
+        "-V", "--snmp-version", type=int, help="SNMP version (default: 2)", default=2
+    )
+    parser.add_argument(
+        "--snmp-max-repetitions",
+        type=int,
+        help="SNMP GETBULK max-repetitions (default: 20)",
+        default=20,
+    )
+    parser.add_argument(
+        "--snmp-max-workers",
+        type=int,
+        help="Maximum number of concurrent SNMP requests chains (default: 4)",
+        default=4,
+    )
+    parser.add_argument(
+        "--max-response-varbinds",
+        type=int,
+        help="Simulate tooBig answers of the agent to GETBULK requests exceeding this size",
+    )
+    parser.add_argument(
+        "--no-memory",
+        dest="memory",
+        action="store_false",
+        help="Do not measure peak memory (tracemalloc slows down the benchmarks)",
+    )
+    parser.add_argument("-j", "--json", action="store_true", help="Output results as JSON lines")
+
+    add_logging_options(parser)
+
+    args = parse_args(parser, argv)
+
+    if not args.json:
+        print(
+            f"{'Scenario':<20} {'Profile':<13} {'APs':>6} {'Radios':>7} {'Requests':>9} "
+            f"{'Varbinds':>9} {'Duration':>10} {'Peak memory':>12}"
+        )
+    for profile in args.profile or PROFILES:
+        for size in [int(size) for size in args.sizes.split(",")]:
+            mib = FakeMIB(profile, size, radios_count=args.radios)
+            for scenario in args.scenario or SCENARIOS:
+                result = run_scenario(scenario, mib, args)
+                if args.json:
+                    print(json.dumps(result))
+                    continue
+                print(
+                    f"{scenario:<20} {profile:<13} {size:>6} {result['radios']:>7} "
+                    f"{result['requests']:>9} {result['varbinds']:>9} "
+                    f"{result['duration']:>9.3f}s "
+                    + (
+                        f"{result['peak_memory'] / 1024:>10.1f}KiB"
+                        if result["peak_memory"] is not None
+                        else f"{'-':>12}"
+                    )
+                )
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
+
+# vim: tabstop=4 shiftwidth=4 softtabstop=4 expandtab
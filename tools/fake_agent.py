@@ -0,0 +1,317 @@
+"""
+Fake Aruba SNMP agent (synthetic MIB trees served by an in-process fake easysnmp session or
+over UDP, SNMP v1 & v2c)
+"""
+
+import asyncio
+import bisect
+import collections
+import logging
+import threading
+import time
+
+from easysnmp.exceptions import EasySNMPError, EasySNMPNoSuchNameError
+
+from check_aruba_ap import ber
+from check_aruba_ap.snmp_client import PROFILES, SYS_OBJECT_ID_OID
+
+log = logging.getLogger(__name__)
+
+FakeVariable = collections.namedtuple("FakeVariable", ("oid", "oid_index", "value", "snmp_type"))
+
+# Synthetic values generators of the AP table columns (from the AP number)
+AP_COLUMNS = {
+    "ip": lambda ap: (f"10.{ap >> 16 & 255}.{ap >> 8 & 255}.{ap & 255}", "IPADDR"),
+    "name": lambda ap: (f"AP-{ap:05d}", "OCTETSTR"),
+    "group": lambda ap: (("campus", "branch")[ap % 2], "OCTETSTR"),
+    "serial": lambda ap: (f"CNK{ap:07d}", "OCTETSTR"),
+    "model": lambda ap: (("AP-515", "AP-535", "AP-575")[ap % 3], "OCTETSTR"),
+    "uptime": lambda ap: (str(8640000 + ap * 97), "TICKS"),
+    "status": lambda ap: ("2" if ap % 50 == 7 else "1", "INTEGER"),
+    "cpu_usage": lambda ap: (str(ap * 7 % 100), "GAUGE"),
+    "free_mem": lambda ap: (str(262144 + ap * 131 % 262144), "GAUGE"),
+    "total_mem": lambda ap: ("1048576", "GAUGE"),
+}
+
+# Synthetic values generators of the radio table columns (from the AP & radio numbers)
+RADIO_COLUMNS = {
+    "mac": lambda ap, radio: (
+        bytes((0, 11, 134, ap >> 8 & 255, ap & 255, 16 * radio)).decode("latin-1"),
+        "OCTETSTR",
+    ),
+    "ssid": lambda ap, radio: (f"corp-{radio}", "OCTETSTR"),
+    "noise": lambda ap, radio: (str(-90 - (ap + radio) % 10), "INTEGER"),
+    "usage": lambda ap, radio: (str((ap * 13 + radio * 29) % 100), "GAUGE"),
+    "tx_total_frames": lambda ap, radio: (str(ap * 1000003 % 2**32), "COUNTER"),
+    "tx_total_bytes": lambda ap, radio: (str(ap * 7340033 % 2**32), "COUNTER"),
+    "tx_dropped_frames": lambda ap, radio: (str(ap * 17 % 1000), "COUNTER"),
+    "rx_total_frames": lambda ap, radio: (str(ap * 900001 % 2**32), "COUNTER"),
+    "rx_total_bytes": lambda ap, radio: (str(ap * 6291469 % 2**32), "COUNTER"),
+    "rx_bad_frames": lambda ap, radio: (str(ap * 3 % 100), "COUNTER"),
+    "phy_events": lambda ap, radio: (str(ap % 10), "COUNTER"),
+    "status": lambda ap, radio: ("1", "INTEGER"),
+    "clients_count": lambda ap, radio: (str((ap + radio) % 40), "GAUGE"),
+}
+
+
+def oid_key(oid):
+    """Compute the sort key of an OID (compared as bytes, each sub-identifier on 4 bytes)"""
+    return b"".join(
+        (1 if sub_id == "iso" else int(sub_id)).to_bytes(4, "big")
+        for sub_id in oid.strip(".").split(".")
+    )
+
+
+def ap_index(ap):
+    """Compute the synthetic index suffix of an AP (built from its MAC address)"""
+    return f".0.11.134.{ap >> 16 & 255}.{ap >> 8 & 255}.{ap & 255}"
+
+
+class FakeMIB:
+    """
+    Synthetic Aruba MIB tree of a fleet of APs for a profile (with the sysObjectID of the SNMP
+    host, if provided)
+    """
+
+    def __init__(self, profile, aps_count, radios_count=2, sys_object_id=None):
+        self.profile = profile
+        self.aps_count = aps_count
+        self.radios_count = radios_count
+        values = {}
+        if sys_object_id:
+            values[SYS_OBJECT_ID_OID] = (sys_object_id, "OBJECTID")
+        for key_name, oid in PROFILES[profile]["ap_oids"].items():
+            if oid is None:
+                continue
+            for ap in range(aps_count):
+                values[oid + ap_index(ap)] = AP_COLUMNS[key_name](ap)
+        for key_name, oid in PROFILES[profile]["radio_oids"].items():
+            if oid is None:
+                continue
+            for ap in range(aps_count):
+                for radio in range(radios_count):
+                    values[f"{oid}{ap_index(ap)}.{radio}"] = RADIO_COLUMNS[key_name](ap, radio)
+        self.oids = sorted(values, key=oid_key)
+        self.keys = [oid_key(oid) for oid in self.oids]
+        self.values = [values[oid] for oid in self.oids]
+        log.debug("FakeMIB(%s, %d APs): %d OIDs", profile, aps_count, len(self.oids))
+
+    def ap_ip(self, ap):
+        """Retrieve the IP address of an AP from its number"""
+        return AP_COLUMNS["ip"](ap)[0]
+
+    def get(self, oid):
+        """Get an OID value (return None if not exist)"""
+        idx = bisect.bisect_left(self.keys, oid_key(oid))
+        if idx < len(self.oids) and self.oids[idx] == oid:
+            return FakeVariable(oid, "", *self.values[idx])
+        return None
+
+    def get_next(self, oid):
+        """Get the next OID value (return None at the end of the MIB)"""
+        idx = bisect.bisect_right(self.keys, oid_key(oid))
+        if idx < len(self.oids):
+            return FakeVariable(self.oids[idx], "", *self.values[idx])
+        return None
+
+    def get_bulk(self, oids, non_repeaters, max_repetitions):
+        """Get the values of a GETBULK request"""
+        items = [
+            self.get_next(oid) or FakeVariable(oid, "", "ENDOFMIBVIEW", "ENDOFMIBVIEW")
+            for oid in oids[:non_repeaters]
+        ]
+        next_oids = list(oids[non_repeaters:])
+        for _ in range(max_repetitions):
+            for idx, oid in enumerate(next_oids):
+                item = self.get_next(oid)
+                if item is None:
+                    items.append(FakeVariable(oid, "", "ENDOFMIBVIEW", "ENDOFMIBVIEW"))
+                    continue
+                items.append(item)
+                next_oids[idx] = item.oid
+        return items
+
+
+class FakeSession:
+    """
+    In-process fake easysnmp session serving a FakeMIB
+
+    Each request is delayed by the configured latency and counted (by type, with the number of
+    varbinds of the answers). If max_response_varbinds is set, GETBULK requests that would return
+    more varbinds fail as if the agent answered tooBig.
+    """
+
+    def __init__(self, mib, latency=0, max_response_varbinds=None, **kwargs):
+        self.mib = mib
+        self.latency = latency
+        self.max_response_varbinds = max_response_varbinds
+        self.version = kwargs.get("version", 1)
+        self.requests = collections.Counter()
+        self.varbinds = collections.Counter()
+
+    def _request(self, request_type, varbinds):
+        """Simulate a request round trip"""
+        self.requests[request_type] += 1
+        self.varbinds[request_type] += varbinds
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _missing(self, oid):
+        if self.version == 1:
+            raise EasySNMPNoSuchNameError(
+                "(noSuchName) There is no such variable name in this MIB."
+            )
+        return FakeVariable(oid, "", "NOSUCHINSTANCE", "NOSUCHINSTANCE")
+
+    def get(self, oids):
+        """Simulate a GET request"""
+        if not isinstance(oids, (list, tuple)):
+            return self.get([oids])[0]
+        self._request("get", len(oids))
+        items = [self.mib.get(oid) for oid in oids]
+        return [item or self._missing(oid) for oid, item in zip(oids, items)]
+
+    def get_next(self, oids):
+        """Simulate a GETNEXT request"""
+        if not isinstance(oids, (list, tuple)):
+            return self.get_next([oids])[0]
+        self._request("getnext", len(oids))
+        items = [self.mib.get_next(oid) for oid in oids]
+        if self.version == 1 and None in items:
+            # SNMP v1 end of MIB view
+            raise EasySNMPNoSuchNameError(
+                "(noSuchName) There is no such variable name in this MIB."
+            )
+        return [
+            item or FakeVariable(oid, "", "ENDOFMIBVIEW", "ENDOFMIBVIEW")
+            for oid, item in zip(oids, items)
+        ]
+
+    def get_bulk(self, oids, non_repeaters=0, max_repetitions=10):
+        """Simulate a GETBULK request"""
+        if not isinstance(oids, (list, tuple)):
+            oids = [oids]
+        if self.max_response_varbinds and len(oids) * max_repetitions > self.max_response_varbinds:
+            self._request("getbulk", 0)
+            raise EasySNMPError("(tooBig) Response message would have been too large.")
+        items = self.mib.get_bulk(oids, non_repeaters, max_repetitions)
+        self._request("getbulk", len(items))
+        return items
+
+    def walk(self, oids):
+        """Simulate a walk using GETNEXT requests"""
+        items = []
+        prefix = f"{oids}."
+        oid = oids
+        while True:
+            self._request("getnext", 1)
+            item = self.mib.get_next(oid)
+            if item is None or not item.oid.startswith(prefix):
+                return items
+            items.append(item)
+            oid = item.oid
+
+
+class FakeAgentProtocol(asyncio.DatagramProtocol):
+    """UDP protocol of the fake SNMP agent"""
+
+    def __init__(self, agent):
+        self.agent = agent
+        self.transport = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        try:
+            request = ber.decode_message(data)
+        except ValueError as err:
+            log.warning("FakeAgent: invalid SNMP message received from %s: %s", addr[0], err)
+            return
+        answer = self.agent.answer(request)
+        if self.agent.latency:
+            asyncio.get_running_loop().call_later(
+                self.agent.latency, self.transport.sendto, answer, addr
+            )
+        else:
+            self.transport.sendto(answer, addr)
+
+
+class FakeAgent:
+    """
+    Fake SNMP agent serving a FakeMIB over UDP (SNMP v1 & v2c, any community) on localhost
+
+    The agent is run in a background thread. Answers are delayed by the configured latency without
+    blocking the other requests and requests are counted like by FakeSession.
+    """
+
+    def __init__(self, mib, latency=0, max_response_varbinds=None):
+        self.mib = mib
+        self.latency = latency
+        self.max_response_varbinds = max_response_varbinds
+        self.requests = collections.Counter()
+        self.varbinds = collections.Counter()
+        self.loop = asyncio.new_event_loop()
+        self.transport = None
+        self.port = None
+
+    def start(self):
+        """Start the agent (return the UDP port it's listening on)"""
+        threading.Thread(target=self.loop.run_forever, name="fake-agent", daemon=True).start()
+        self.transport, _ = asyncio.run_coroutine_threadsafe(
+            self.loop.create_datagram_endpoint(
+                lambda: FakeAgentProtocol(self), local_addr=("127.0.0.1", 0)
+            ),
+            self.loop,
+        ).result()
+        self.port = self.transport.get_extra_info("sockname")[1]
+        return self.port
+
+    def stop(self):
+        """Stop the agent"""
+        self.loop.call_soon_threadsafe(self.transport.close)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+    def answer(self, request):
+        """Compute the encoded answer of a decoded SNMP request"""
+        oids = [oid for oid, _, _ in request.varbinds]
+        error_status = error_index = 0
+        items = []
+        if request.pdu_type == ber.GET_BULK_REQUEST and request.version > 1:
+            request_type = "getbulk"
+            if (
+                self.max_response_varbinds
+                and len(oids) * request.error_index > self.max_response_varbinds
+            ):
+                error_status = 1
+            else:
+                items = self.mib.get_bulk(oids, request.error_status, request.error_index)
+        elif request.pdu_type in (ber.GET_REQUEST, ber.GET_NEXT_REQUEST):
+            request_type = "get" if request.pdu_type == ber.GET_REQUEST else "getnext"
+            method = self.mib.get if request_type == "get" else self.mib.get_next
+            missing_type = "NOSUCHINSTANCE" if request_type == "get" else "ENDOFMIBVIEW"
+            for idx, oid in enumerate(oids):
+                item = method(oid)
+                if item is None and request.version == 1:
+                    error_status, error_index = 2, idx + 1
+                    break
+                items.append(item or FakeVariable(oid, "", missing_type, missing_type))
+        else:
+            request_type = "unsupported"
+            error_status = 5
+        self.requests[request_type] += 1
+        self.varbinds[request_type] += len(items) if not error_status else 0
+        return ber.encode_message(
+            request.version,
+            request.community,
+            ber.GET_RESPONSE,
+            request.request_id,
+            error_status,
+            error_index,
+            [(item.oid, ber.encode_value(item.value, item.snmp_type)) for item in items]
+            if not error_status
+            else [(oid, ber.encode_tlv(ber.NULL, b"")) for oid in oids],
+        )
+
+
+# vim: tabstop=4 shiftwidth=4 softtabstop=4 expandtab